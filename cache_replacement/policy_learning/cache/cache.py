@@ -219,35 +219,9 @@ class Cache(object):
         BernoulliProcessStatistic if not provided.
       access_history_len (int): see CacheSet.
     """
-    def is_pow_of_two(x):
-      return (x & (x - 1)) == 0
-
-    if not is_pow_of_two(cache_line_size):
-      raise ValueError("Cache line size ({}) must be a power of two."
-                       .format(cache_line_size))
-
-    num_cache_lines = cache_capacity // cache_line_size
-    num_sets = num_cache_lines // associativity
-
-    if (cache_capacity % cache_line_size != 0 or
-        num_cache_lines % associativity != 0):
-      raise ValueError(
-          ("Cache capacity ({}) must be an even multiple of "
-           "cache_line_size ({}) and associativity ({})").format(
-               cache_capacity, cache_line_size, associativity))
-
-    if not is_pow_of_two(num_sets):
-      raise ValueError("Number of cache sets ({}) must be a power of two."
-                       .format(num_sets))
-
-    if num_sets == 0:
-      raise ValueError(
-          ("Cache capacity ({}) is not great enough for {} cache lines per set "
-           "and cache lines of size {}").format(cache_capacity, associativity,
-                                                cache_line_size))
-
-    set_bits = int(np.log2(num_sets))
-    cache_line_bits = int(np.log2(cache_line_size))
+    set_bits, cache_line_bits = cache_geometry(
+        cache_capacity, associativity, cache_line_size)
+    num_sets = 1 << set_bits
 
     self._sets = [
         CacheSet(set_id, associativity, eviction_policy, access_history_len)
@@ -325,6 +299,51 @@ class Cache(object):
     return "".join(s)
 
 
+def cache_geometry(cache_capacity, associativity, cache_line_size):
+  """Validates a cache configuration and returns its address layout.
+
+  Memory address is divided into:
+    | ... | set_bits | cache_line_bits |
+
+  Args:
+    cache_capacity (int): number of bytes to store in cache.
+    associativity (int): number of cache lines per set.
+    cache_line_size (int): number of bytes per cache line.
+
+  Returns:
+    set_bits (int): number of address bits selecting the cache set.
+    cache_line_bits (int): number of address bits within a cache line.
+  """
+  def is_pow_of_two(x):
+    return (x & (x - 1)) == 0
+
+  if not is_pow_of_two(cache_line_size):
+    raise ValueError("Cache line size ({}) must be a power of two."
+                     .format(cache_line_size))
+
+  num_cache_lines = cache_capacity // cache_line_size
+  num_sets = num_cache_lines // associativity
+
+  if (cache_capacity % cache_line_size != 0 or
+      num_cache_lines % associativity != 0):
+    raise ValueError(
+        ("Cache capacity ({}) must be an even multiple of "
+         "cache_line_size ({}) and associativity ({})").format(
+             cache_capacity, cache_line_size, associativity))
+
+  if not is_pow_of_two(num_sets):
+    raise ValueError("Number of cache sets ({}) must be a power of two."
+                     .format(num_sets))
+
+  if num_sets == 0:
+    raise ValueError(
+        ("Cache capacity ({}) is not great enough for {} cache lines per set "
+         "and cache lines of size {}").format(cache_capacity, associativity,
+                                              cache_line_size))
+
+  return int(np.log2(num_sets)), int(np.log2(cache_line_size))
+
+
 class BernoulliProcessStatistic(object):
   """Tracks results of Bernoulli trials."""
 
@@ -336,6 +355,15 @@ class BernoulliProcessStatistic(object):
     if success:
       self._successes += 1
 
+  def add_trials(self, successes):
+    """Records many trials at once.
+
+    Args:
+      successes (np.ndarray): bool array, True for each successful trial.
+    """
+    self._trials += len(successes)
+    self._successes += int(np.count_nonzero(successes))
+
   @property
   def num_trials(self):
     return self._trials
@@ -20,15 +20,32 @@ import abc
 import collections
 import csv
 import os
+import struct
+import zlib
+from absl import logging
 import numpy as np
 import six
 import tqdm
 
+# Binary trace format (all integers little-endian):
+#   header: magic (8 bytes), version (uint32), flags (uint32),
+#     num_records (uint64), block_size (uint64), index_offset (uint64)
+#   records: if uncompressed, num_records (pc, address) uint64 pairs.
+#     Otherwise, blocks of up to block_size records, each compressed with zlib,
+#     followed at index_offset by num_blocks + 1 uint64 file offsets of the
+#     blocks.
+_BINARY_MAGIC = b"MEMTRACE"
+_BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct("<8sIIQQQ")
+_BINARY_COMPRESSED = 1
+BINARY_RECORD_DTYPE = np.dtype([("pc", "<u8"), ("address", "<u8")])
+
 
 class MemoryTrace(object):
   """Represents the ordered load calls for some program with a cursor.
 
-  Should be used in a with block.
+  The trace is loaded into arrays by load_trace_arrays, so next_access_time is
+  a constant-time lookup. Should be used in a with block.
   """
 
   def __init__(self, filename, max_look_ahead=int(1e7), cache_line_size=64):
@@ -36,7 +53,7 @@ class MemoryTrace(object):
 
     Args:
       filename (str): filename of the file containing the memory trace. Must
-        conform to one of the expected .csv or .txt formats.
+        conform to one of the expected .csv, .txt or .bin formats.
       max_look_ahead (int): number of load calls to look ahead in
         most_future_access(). All addresses not been loaded by the
         max_look_ahead limit are considered tied.
@@ -48,35 +65,17 @@ class MemoryTrace(object):
 
     self._filename = filename
     self._max_look_ahead = max_look_ahead
-
-    self._num_next_calls = 0
-
-    # Maps address --> list of next access times in the look ahead buffer
-    self._access_times = collections.defaultdict(collections.deque)
-    self._look_ahead_buffer = collections.deque()
+    self._cache_line_size = cache_line_size
     self._offset_bits = int(np.log2(cache_line_size))
 
-    # Optimization: only catch the StopIteration in _read_next once.
-    # Without this optimization, the StopIteration is caught max_look_ahead
-    # times.
-    self._reader_exhausted = False
-
-  def _read_next(self):
-    """Adds the next row in the CSV memory trace to the look-ahead buffer.
-
-    Does nothing if the cursor points to the end of the trace.
-    """
-    if self._reader_exhausted:
-      return
+    self._num_next_calls = 0
 
-    try:
-      pc, address = self._reader.next()
-      self._look_ahead_buffer.append((pc, address))
-      # Align to cache line
-      self._access_times[address >> self._offset_bits].append(
-          len(self._look_ahead_buffer) + self._num_next_calls)
-    except StopIteration:
-      self._reader_exhausted = True
+    # Maps aligned address --> index of its most recent access before the
+    # cursor.
+    self._last_access = {}
+    # Maps aligned address --> index of its first access. Only built if
+    # next_access_time is queried for an address not yet seen.
+    self._first_access = None
 
   def next(self):
     """The next load call under the cursor. Advances the cursor.
@@ -84,22 +83,16 @@ class MemoryTrace(object):
     Returns:
       load_call (tuple)
     """
+    index = self._num_next_calls
+    pc = int(self._arrays.pcs[index])
+    address = int(self._arrays.addresses[index])
+    self._last_access[address >> self._offset_bits] = index
     self._num_next_calls += 1
-    pc, address = self._look_ahead_buffer.popleft()
-    # Align to cache line
-    aligned_address = address >> self._offset_bits
-    self._access_times[aligned_address].popleft()
-
-    # Memory optimization: discard keys that have no current access times.
-    if not self._access_times[aligned_address]:
-      del self._access_times[aligned_address]
-
-    self._read_next()
     return pc, address
 
   def done(self):
     """True if the cursor points to the end of the trace."""
-    return not self._look_ahead_buffer
+    return self._num_next_calls >= len(self._arrays.addresses)
 
   def next_access_time(self, address):
     """Returns number of accesses from cursor of next access of address.
@@ -110,32 +103,363 @@ class MemoryTrace(object):
     Returns:
       access_time (int): np.inf if not accessed within max_look_ahead accesses.
     """
-    accesses = self._access_times[address]
-    if not accesses:
+    last_access = self._last_access.get(address)
+    if last_access is not None:
+      next_access = int(self._arrays.next_access[last_access])
+    else:
+      next_access = self._first_access_of(address)
+
+    access_time = next_access - self._num_next_calls + 1
+    if (next_access >= len(self._arrays.addresses) or
+        access_time > self._max_look_ahead):
       return np.inf
-    return accesses[0] - self._num_next_calls
+    return access_time
+
+  def _first_access_of(self, address):
+    """Returns the index of the first access of an aligned address."""
+    if self._first_access is None:
+      aligned, first_indices = np.unique(
+          self._arrays.addresses >> np.uint64(self._offset_bits),
+          return_index=True)
+      self._first_access = dict(zip(aligned.tolist(), first_indices.tolist()))
+    return self._first_access.get(address, len(self._arrays.addresses))
 
   def __enter__(self):
-    self._file = open(self._filename, "r")
-    _, extension = os.path.splitext(self._filename)
+    self._arrays = load_trace_arrays(self._filename, self._cache_line_size)
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    del self._arrays
+
+
+class TraceArrays(collections.namedtuple(
+    "TraceArrays", ("pcs", "addresses", "next_access"))):
+  """A memory trace stored as arrays.
+
+  Consists of:
+    pcs (np.ndarray): uint64 program counter of each access.
+    addresses (np.ndarray): uint64 (unaligned) memory address of each access.
+    next_access (np.ndarray): int64 index of the next access to the same cache
+      line as each access, or len(addresses) if the line is not accessed again.
+  """
+  __slots__ = ()
+
+
+def load_trace_arrays(filename, cache_line_size=64, use_sidecar=True):
+  """Loads a memory trace into arrays, computing next access indices.
+
+  Parsing the trace is slow, so the arrays are saved next to the trace in .npy
+  sidecar files and memory-mapped on later loads. Sidecars older than the trace
+  are rebuilt.
+
+  Args:
+    filename (str): path to a .csv, .txt or .bin memory trace (see
+      MemoryTrace and BinaryTrace). Binary traces are read directly and only
+      the next access sidecar is saved for them.
+    cache_line_size (int): size of cache line used to align addresses when
+      computing next accesses.
+    use_sidecar (bool): if False, neither reads nor writes sidecar files.
+
+  Returns:
+    TraceArrays
+  """
+  offset_bits = int(np.log2(cache_line_size))
+  _, extension = os.path.splitext(filename)
+  sidecars = {
+      "pcs": "{}.pcs.npy".format(filename),
+      "addresses": "{}.addresses.npy".format(filename),
+      "next_access": "{}.next_access_{}.npy".format(filename, cache_line_size),
+  }
+
+  def is_fresh(path):
+    return (use_sidecar and os.path.exists(path) and
+            os.path.getmtime(path) >= os.path.getmtime(filename))
+
+  if extension == ".bin":
+    pcs, addresses = BinaryTrace(filename).read()
+  elif is_fresh(sidecars["pcs"]) and is_fresh(sidecars["addresses"]):
+    pcs = np.load(sidecars["pcs"], mmap_mode="r")
+    addresses = np.load(sidecars["addresses"], mmap_mode="r")
+  else:
+    pcs, addresses = _parse_trace(filename)
+    if use_sidecar:
+      _save_sidecar(sidecars["pcs"], pcs)
+      _save_sidecar(sidecars["addresses"], addresses)
+
+  if is_fresh(sidecars["next_access"]):
+    next_access = np.load(sidecars["next_access"], mmap_mode="r")
+  else:
+    next_access = compute_next_access(addresses >> np.uint64(offset_bits))
+    if use_sidecar:
+      _save_sidecar(sidecars["next_access"], next_access)
+  return TraceArrays(pcs, addresses, next_access)
+
+
+def compute_next_access(aligned_addresses):
+  """Returns the index of the next access to the same address for each access.
+
+  Args:
+    aligned_addresses (np.ndarray): cache-line aligned address of each access.
+
+  Returns:
+    next_access (np.ndarray): int64 array where next_access[i] is the smallest
+      j > i with aligned_addresses[j] == aligned_addresses[i], or
+      len(aligned_addresses) if there is none.
+  """
+  num_accesses = len(aligned_addresses)
+  # A stable sort groups the accesses to each address in time order, so each
+  # access is followed by the next access to the same address.
+  order = np.argsort(aligned_addresses, kind="stable")
+  sorted_addresses = aligned_addresses[order]
+  next_access = np.full(num_accesses, num_accesses, dtype=np.int64)
+  same_address = sorted_addresses[1:] == sorted_addresses[:-1]
+  next_access[order[:-1][same_address]] = order[1:][same_address]
+  return next_access
+
+
+def _parse_trace(filename):
+  """Parses a .csv or .txt memory trace into uint64 (pcs, addresses)."""
+  with open(filename, "r") as f:
+    _, extension = os.path.splitext(filename)
     if extension == ".csv":
-      self._reader = CSVReader(self._file)
+      reader = CSVReader(f)
     elif extension == ".txt":
-      self._reader = TxtReader(self._file)
+      reader = TxtReader(f)
     else:
       raise ValueError(
           "Extension {} not a supported extension.".format(extension))
 
-    # Initialize look-ahead buffer
-    for _ in tqdm.tqdm(
-        range(self._max_look_ahead), desc="Initializing MemoryTrace"):
-      self._read_next()
+    def read_all():
+      while True:
+        try:
+          yield from reader.next()
+        except StopIteration:
+          return
+
+    trace = np.fromiter(
+        tqdm.tqdm(read_all(), desc="Parsing {}".format(filename)),
+        dtype=np.uint64)
+  trace = trace.reshape(-1, 2)
+  return np.ascontiguousarray(trace[:, 0]), np.ascontiguousarray(trace[:, 1])
+
+
+def _save_sidecar(path, array):
+  """Atomically saves an array to a .npy sidecar file.
+
+  Sidecars are only a cache: if the file cannot be written (e.g. read-only
+  directory or full disk), the trace is simply parsed again on the next load.
+  """
+  tmp_path = "{}.tmp.npy".format(path[:-len(".npy")])
+  try:
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+  except OSError as e:
+    logging.warning("Could not save sidecar %s: %s", path, e)
+    try:
+      os.remove(tmp_path)
+    except OSError:
+      pass
+
+
+class BinaryTrace(object):
+  """A memory trace in the binary format written by BinaryTraceWriter.
+
+  Uncompressed traces are memory-mapped, so reading any range of records is
+  nearly free. Compressed traces decompress only the blocks that are read.
+  """
+
+  def __init__(self, filename):
+    """Opens a binary memory trace.
+
+    Args:
+      filename (str): path to the binary trace.
+    """
+    self._filename = filename
+    with open(filename, "rb") as f:
+      header = f.read(_BINARY_HEADER.size)
+      if len(header) < _BINARY_HEADER.size:
+        raise ValueError("{} is not a binary memory trace.".format(filename))
+      (magic, version, flags, self._num_records, self._block_size,
+       index_offset) = _BINARY_HEADER.unpack(header)
+      if magic != _BINARY_MAGIC:
+        raise ValueError("{} is not a binary memory trace.".format(filename))
+      if version != _BINARY_VERSION:
+        raise ValueError(
+            "Unsupported binary trace version: {}".format(version))
+      self._compressed = bool(flags & _BINARY_COMPRESSED)
+      if self._compressed:
+        f.seek(index_offset)
+        num_blocks = -(-self._num_records // self._block_size)
+        self._block_offsets = np.frombuffer(
+            f.read(8 * (num_blocks + 1)), dtype="<u8")
+
+    if not self._compressed:
+      self._records = np.memmap(
+          filename, dtype=BINARY_RECORD_DTYPE, mode="r",
+          offset=_BINARY_HEADER.size, shape=(self._num_records,))
+
+  def __len__(self):
+    return self._num_records
+
+  @property
+  def block_size(self):
+    """Number of records per compressed block, or per chunk if uncompressed."""
+    return self._block_size
+
+  def read(self, start=0, stop=None):
+    """Returns the pcs and addresses of records [start, stop).
+
+    Args:
+      start (int): index of the first record to read.
+      stop (int | None): index past the last record to read. Defaults to the
+        end of the trace.
+
+    Returns:
+      pcs (np.ndarray): uint64 program counters.
+      addresses (np.ndarray): uint64 memory addresses.
+    """
+    if stop is None:
+      stop = self._num_records
+    start, stop = max(start, 0), min(stop, self._num_records)
+    if not self._compressed:
+      records = self._records[start:stop]
+    else:
+      first_block = start // self._block_size
+      last_block = -(-stop // self._block_size)
+      blocks = [self._read_block(i) for i in range(first_block, last_block)]
+      records = (np.concatenate(blocks) if blocks
+                 else np.empty(0, dtype=BINARY_RECORD_DTYPE))
+      offset = first_block * self._block_size
+      records = records[start - offset:stop - offset]
+    return (records["pc"].astype(np.uint64, copy=False),
+            records["address"].astype(np.uint64, copy=False))
+
+  def chunks(self, num_chunks):
+    """Splits the trace into contiguous ranges of whole blocks.
+
+    Args:
+      num_chunks (int): maximum number of ranges to return.
+
+    Returns:
+      chunks (list[(int, int)]): (start, stop) record ranges that cover the
+        trace in order. Each can be passed to read, e.g., by a separate worker.
+    """
+    num_blocks = max(-(-self._num_records // self._block_size), 1)
+    blocks_per_chunk = -(-num_blocks // num_chunks)
+    chunk_size = blocks_per_chunk * self._block_size
+    return [(start, min(start + chunk_size, self._num_records))
+            for start in range(0, max(self._num_records, 1), chunk_size)]
+
+  def _read_block(self, block):
+    with open(self._filename, "rb") as f:
+      f.seek(int(self._block_offsets[block]))
+      data = f.read(
+          int(self._block_offsets[block + 1] - self._block_offsets[block]))
+    return np.frombuffer(zlib.decompress(data), dtype=BINARY_RECORD_DTYPE)
+
+
+class BinaryTraceWriter(object):
+  """Writes a memory trace in the binary format read by BinaryTrace."""
+
+  def __init__(self, filename, compress=False, block_size=1 << 16):
+    """Constructs a writer to write to the provided filename.
+
+    Args:
+      filename (str): path to write trace to.
+      compress (bool): if True, compresses each block of records with zlib.
+      block_size (int): number of records buffered before they are written
+        (and compressed).
+    """
+    self._filename = filename
+    self._compress = compress
+    self._block_size = block_size
+
+  def write(self, pc, address):
+    """Writes the (pc, address) to disk.
+
+    Args:
+      pc (int): program counter of instruction causing read at the address.
+      address (int): memory address accessed in the instruction.
+    """
+    self._buffer[self._buffer_len] = (pc, address)
+    self._buffer_len += 1
+    if self._buffer_len == self._block_size:
+      self._flush()
+
+  def write_arrays(self, pcs, addresses):
+    """Writes many (pc, address) records to disk.
+
+    Args:
+      pcs (np.ndarray): program counters of the accesses.
+      addresses (np.ndarray): memory addresses of the accesses.
+    """
+    for start in range(0, len(pcs), self._block_size):
+      stop = min(start + self._block_size, len(pcs))
+      count = min(stop - start, self._block_size - self._buffer_len)
+      for lo, hi in ((start, start + count), (start + count, stop)):
+        if lo == hi:
+          continue
+        buffer = self._buffer[self._buffer_len:self._buffer_len + hi - lo]
+        buffer["pc"] = pcs[lo:hi]
+        buffer["address"] = addresses[lo:hi]
+        self._buffer_len += hi - lo
+        if self._buffer_len == self._block_size:
+          self._flush()
+
+  def _flush(self):
+    records = self._buffer[:self._buffer_len]
+    if self._compress:
+      self._block_offsets.append(self._file.tell())
+      self._file.write(zlib.compress(records.tobytes()))
+    else:
+      self._file.write(records.tobytes())
+    self._num_records += self._buffer_len
+    self._buffer_len = 0
+
+  def _write_header(self, index_offset):
+    self._file.seek(0)
+    self._file.write(_BINARY_HEADER.pack(
+        _BINARY_MAGIC, _BINARY_VERSION,
+        _BINARY_COMPRESSED if self._compress else 0, self._num_records,
+        self._block_size, index_offset))
+
+  def __enter__(self):
+    self._file = open(self._filename, "wb")
+    self._buffer = np.empty(self._block_size, dtype=BINARY_RECORD_DTYPE)
+    self._buffer_len = 0
+    self._num_records = 0
+    self._block_offsets = []
+    # Placeholder until the number of records is known.
+    self._write_header(0)
     return self
 
   def __exit__(self, exc_type, exc_val, exc_tb):
+    if self._buffer_len:
+      self._flush()
+    index_offset = 0
+    if self._compress:
+      index_offset = self._file.tell()
+      self._block_offsets.append(index_offset)
+      self._file.write(np.array(self._block_offsets, dtype="<u8").tobytes())
+    self._write_header(index_offset)
     self._file.close()
 
 
+def convert_to_binary(filename, binary_filename, compress=False,
+                      block_size=1 << 16):
+  """Converts a .csv or .txt memory trace to the binary trace format.
+
+  Args:
+    filename (str): path to the .csv or .txt trace to convert.
+    binary_filename (str): path to write the binary trace to.
+    compress (bool): see BinaryTraceWriter.
+    block_size (int): see BinaryTraceWriter.
+  """
+  pcs, addresses = _parse_trace(filename)
+  with BinaryTraceWriter(binary_filename, compress, block_size) as writer:
+    writer.write_arrays(pcs, addresses)
+
+
 class MemoryTraceReader(six.with_metaclass(abc.ABCMeta, object)):
   """Internal class for reading different memory trace formats."""
 
@@ -0,0 +1,79 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Tests for memtrace sidecar files."""
+
+import errno
+import os
+import shutil
+import stat
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+import numpy as np
+from cache_replacement.policy_learning.cache import memtrace
+
+_ACCESSES = [(0x10, 0x40), (0x11, 0x80), (0x12, 0x41), (0x13, 0x1000)]
+
+
+class MemtraceSidecarTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.trace_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.trace_dir)
+    self.filename = os.path.join(self.trace_dir, "trace.csv")
+    with open(self.filename, "w") as f:
+      for pc, address in _ACCESSES:
+        f.write("{:x},{:x}\n".format(pc, address))
+
+  def assert_loads_trace(self):
+    with memtrace.MemoryTrace(self.filename) as trace:
+      accesses = []
+      while not trace.done():
+        accesses.append(trace.next())
+    self.assertEqual(_ACCESSES, accesses)
+    arrays = memtrace.load_trace_arrays(self.filename)
+    np.testing.assert_array_equal(arrays.next_access, [2, 4, 4, 4])
+
+  def test_saves_sidecars(self):
+    self.assert_loads_trace()
+    self.assertTrue(os.path.exists(self.filename + ".pcs.npy"))
+    self.assert_loads_trace()
+
+  def test_read_only_directory(self):
+    if os.geteuid() == 0:
+      self.skipTest("Permissions are not enforced for root.")
+    os.chmod(self.trace_dir, stat.S_IRUSR | stat.S_IXUSR)
+    self.addCleanup(os.chmod, self.trace_dir, stat.S_IRWXU)
+    self.assert_loads_trace()
+    self.assertEqual(["trace.csv"], os.listdir(self.trace_dir))
+
+  def test_full_disk(self):
+    def save_partially(path, array):
+      del array
+      with open(path, "w") as f:
+        f.write("partial")
+      raise OSError(errno.ENOSPC, "No space left on device")
+
+    with mock.patch.object(np, "save", side_effect=save_partially):
+      self.assert_loads_trace()
+    self.assertEqual(["trace.csv"], os.listdir(self.trace_dir))
+
+
+if __name__ == "__main__":
+  absltest.main()
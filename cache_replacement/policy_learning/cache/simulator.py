@@ -0,0 +1,504 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Simulates a set-associative cache over a whole trace with NumPy.
+
+Supports the eviction policies that do not need a learned model: greedy LRU,
+greedy Belady's and random. For these, simulate returns exactly the hits that
+cache.Cache would produce when reading the trace one access at a time, but
+processes all cache sets in lockstep on arrays instead of through CacheSet
+objects.
+
+Example usage:
+
+  trace = memtrace.load_trace_arrays("sample_trace.csv", cache_line_size=64)
+  hits = simulator.simulate(trace, cache_config)
+  hit_rate_statistic = cache.BernoulliProcessStatistic()
+  hit_rate_statistic.add_trials(hits[warmup_period:])
+
+Binary traces (see memtrace.BinaryTrace) can also be simulated by several
+processes, each owning a subset of the cache sets:
+
+  hits = simulator.simulate_parallel("trace.bin", cache_config, num_workers=8)
+"""
+
+import multiprocessing
+import numpy as np
+from cache_replacement.policy_learning.cache import cache as cache_mod
+from cache_replacement.policy_learning.cache import memtrace
+
+# Below this many sets with remaining accesses, the per-step NumPy overhead
+# outweighs simulating the remaining sets one access at a time.
+_MIN_LOCKSTEP_SETS = 8
+
+
+def simulate(trace, config, max_look_ahead=int(1e7)):
+  """Returns whether each access in the trace hits in the configured cache.
+
+  Args:
+    trace (memtrace.TraceArrays): the trace to simulate. Its next_access must
+      be computed with the cache_line_size of the config.
+    config (Config): cache config, as passed to cache.Cache.from_config. The
+      eviction policy must be random or greedy with an lru or belady scorer.
+    max_look_ahead (int): see memtrace.MemoryTrace. Only used by Belady's.
+
+  Returns:
+    hits (np.ndarray): bool array with one entry per access, in trace order.
+  """
+  set_bits, cache_line_bits = cache_mod.cache_geometry(
+      config.get("capacity"), config.get("associativity"),
+      config.get("cache_line_size"))
+  aligned_addresses = (
+      np.asarray(trace.addresses) >> np.uint64(cache_line_bits)).astype(
+          np.int64)
+  set_ids = aligned_addresses & ((1 << set_bits) - 1)
+  policy_type, n = _policy_from_config(config.get("eviction_policy"))
+  return simulate_sets(aligned_addresses, set_ids,
+                       config.get("associativity"), policy_type, n=n,
+                       next_access=trace.next_access,
+                       max_look_ahead=max_look_ahead)
+
+
+def simulate_parallel(filename, config, num_workers=None,
+                      max_look_ahead=int(1e7), chunks_per_worker=4):
+  """Simulates a binary trace with the cache sets split across processes.
+
+  Each worker scans the memory-mapped trace chunk by chunk, keeps only the
+  accesses to the sets it owns and simulates them with simulate_sets. The
+  random policy is not supported, since its draws depend on the accesses to
+  all sets.
+
+  Args:
+    filename (str): path to a binary trace (see memtrace.BinaryTrace).
+    config (Config): see simulate. The eviction policy must be greedy with an
+      lru or belady scorer.
+    num_workers (int | None): number of processes. Defaults to the number of
+      CPUs.
+    max_look_ahead (int): see simulate.
+    chunks_per_worker (int): the trace is scanned in num_workers *
+      chunks_per_worker chunks, which bounds the memory used per worker.
+
+  Returns:
+    hits (np.ndarray): bool array with one entry per access, in trace order.
+  """
+  policy_type, n = _policy_from_config(config.get("eviction_policy"))
+  if policy_type == "random":
+    raise ValueError("The random policy cannot be simulated in parallel.")
+  set_bits, cache_line_bits = cache_mod.cache_geometry(
+      config.get("capacity"), config.get("associativity"),
+      config.get("cache_line_size"))
+  num_workers = num_workers or multiprocessing.cpu_count()
+  chunks = memtrace.BinaryTrace(filename).chunks(
+      num_workers * chunks_per_worker)
+  args = [(filename, chunks, worker, num_workers, set_bits, cache_line_bits,
+           config.get("associativity"), policy_type, n, max_look_ahead)
+          for worker in range(num_workers)]
+
+  hits = np.zeros(len(memtrace.BinaryTrace(filename)), dtype=bool)
+  pool = multiprocessing.Pool(num_workers)
+  try:
+    for indices, worker_hits in pool.imap_unordered(_simulate_worker, args):
+      hits[indices] = worker_hits
+  finally:
+    pool.close()
+    pool.join()
+  return hits
+
+
+def _simulate_worker(args):
+  """Simulates the sets owned by one simulate_parallel worker.
+
+  Args:
+    args (tuple): filename, chunks, worker, num_workers, set_bits,
+      cache_line_bits, associativity, policy_type, n and max_look_ahead.
+      The worker owns the sets with set id % num_workers == worker.
+
+  Returns:
+    indices (np.ndarray): trace index of each access to the owned sets.
+    hits (np.ndarray): whether each of these accesses hits.
+  """
+  (filename, chunks, worker, num_workers, set_bits, cache_line_bits,
+   associativity, policy_type, n, max_look_ahead) = args
+  trace = memtrace.BinaryTrace(filename)
+  indices, aligned_addresses = [], []
+  for start, stop in chunks:
+    _, addresses = trace.read(start, stop)
+    aligned = (addresses >> np.uint64(cache_line_bits)).astype(np.int64)
+    owned = np.flatnonzero(
+        ((aligned & ((1 << set_bits) - 1)) % num_workers) == worker)
+    indices.append(owned + start)
+    aligned_addresses.append(aligned[owned])
+  indices = np.concatenate(indices)
+  aligned_addresses = np.concatenate(aligned_addresses)
+
+  next_access = None
+  if policy_type == "belady":
+    # The next access to a line is to the same set, so it is owned by this
+    # worker. Convert it back to a trace index.
+    local_next_access = memtrace.compute_next_access(aligned_addresses)
+    next_access = np.append(indices, len(trace))[local_next_access]
+  hits = simulate_sets(
+      aligned_addresses, aligned_addresses & ((1 << set_bits) - 1),
+      associativity, policy_type, n=n, next_access=next_access,
+      max_look_ahead=max_look_ahead, times=indices, trace_length=len(trace))
+  return indices, hits
+
+
+def simulate_sets(aligned_addresses, set_ids, associativity, policy_type, n=0,
+                  next_access=None, max_look_ahead=int(1e7), seed=0,
+                  times=None, trace_length=None):
+  """Simulates cache sets of the given associativity over aligned addresses.
+
+  The accesses are grouped by set. At step s, the s-th access of every set is
+  processed at once on (set, way) state arrays. Once only a few sets have
+  accesses left, their remaining accesses are simulated one at a time.
+
+  Args:
+    aligned_addresses (np.ndarray): int64 cache-line aligned address of each
+      access, in trace order.
+    set_ids (np.ndarray): cache set of each access.
+    associativity (int): number of cache lines per set.
+    policy_type (str): one of "lru", "belady" or "random".
+    n (int): greedy policies evict the line with the n-th lowest score. See
+      eviction_policy.GreedyEvictionPolicy.
+    next_access (np.ndarray | None): see memtrace.TraceArrays. Required for
+      Belady's.
+    max_look_ahead (int): see memtrace.MemoryTrace. Only used by Belady's.
+    seed (int): seed of the random policy, as in eviction_policy.RandomPolicy.
+    times (np.ndarray | None): time of each access in the full trace, when
+      simulating a subset of its accesses. Defaults to the access position.
+      next_access must then hold times as well.
+    trace_length (int | None): length of the full trace. Defaults to the
+      number of accesses.
+
+  Returns:
+    hits (np.ndarray): bool array with one entry per access, in trace order.
+  """
+  if policy_type not in ("lru", "belady", "random"):
+    raise ValueError("Invalid policy type: {}".format(policy_type))
+  if policy_type == "belady" and next_access is None:
+    raise ValueError("Belady's requires next_access.")
+
+  num_accesses = len(aligned_addresses)
+  hits = np.zeros(num_accesses, dtype=bool)
+  if not num_accesses:
+    return hits
+  if times is None:
+    times = np.arange(num_accesses)
+  if trace_length is None:
+    trace_length = num_accesses
+
+  # Accesses grouped by set, in time order within each set.
+  order = np.argsort(set_ids, kind="stable")
+  _, starts, counts = np.unique(
+      set_ids[order], return_index=True, return_counts=True)
+
+  if policy_type == "random":
+    draws = _random_draws(aligned_addresses, order, starts, counts,
+                          associativity, seed)
+
+  # Visit sets with the most accesses first, so the sets that still have
+  # accesses at step s are always a prefix.
+  by_count = np.argsort(-counts, kind="stable")
+  starts = starts[by_count]
+  counts = counts[by_count]
+  negated_counts = -counts
+
+  num_sets = len(counts)
+  shape = (num_sets, associativity)
+  tags = np.full(shape, -1, dtype=np.int64)
+  inserted_at = np.zeros(shape, dtype=np.int64)
+  last_used_at = np.zeros(shape, dtype=np.int64)
+  next_used_at = np.zeros(shape, dtype=np.int64)
+  num_lines = np.zeros(num_sets, dtype=np.int64)
+  victim_rank = min(n, associativity - 1)
+
+  for step in range(counts[0]):
+    num_active = np.searchsorted(negated_counts, -step, side="left")
+    if num_active < _MIN_LOCKSTEP_SETS:
+      for row in range(num_active):
+        indices = order[starts[row] + step:starts[row] + counts[row]]
+        hits[indices] = _simulate_set(
+            aligned_addresses[indices].tolist(), times[indices].tolist(),
+            tags[row].tolist(), inserted_at[row].tolist(),
+            last_used_at[row].tolist(), next_used_at[row].tolist(),
+            int(num_lines[row]), policy_type, victim_rank,
+            None if next_access is None else next_access[indices].tolist(),
+            trace_length, max_look_ahead,
+            draws[indices].tolist() if policy_type == "random" else None)
+      break
+    rows = np.arange(num_active)
+    index = order[starts[:num_active] + step]
+    time = times[index]
+    address = aligned_addresses[index]
+
+    match = tags[:num_active] == address[:, np.newaxis]
+    hit = match.any(axis=1)
+    hits[index] = hit
+    way = np.argmax(match, axis=1)
+
+    miss = np.flatnonzero(~hit)
+    if miss.size:
+      miss_rows = rows[miss]
+      full = num_lines[miss_rows] == associativity
+      miss_way = num_lines[miss_rows].copy()
+      num_lines[miss_rows[~full]] += 1
+      if full.any():
+        evict_rows = miss_rows[full]
+        evict_index = index[miss[full]]
+        if policy_type == "lru":
+          ranked = np.argsort(last_used_at[evict_rows], axis=1)
+        elif policy_type == "belady":
+          distance = (next_used_at[evict_rows] -
+                      time[miss[full]][:, np.newaxis])
+          never = ((next_used_at[evict_rows] >= trace_length) |
+                   (distance > max_look_ahead))
+          # Score is minus the distance. Lines not used within the look ahead
+          # tie and are ranked in insertion order.
+          score = np.where(never, -trace_length - 1, -distance)
+          ranked = np.lexsort((inserted_at[evict_rows], score), axis=1)
+        else:
+          # RandomPolicy indexes the lines in insertion order.
+          ranked = np.argsort(inserted_at[evict_rows], axis=1)
+        if policy_type == "random":
+          miss_way[full] = ranked[np.arange(len(evict_rows)),
+                                  draws[evict_index]]
+        else:
+          miss_way[full] = ranked[:, victim_rank]
+      way[miss] = miss_way
+      tags[miss_rows, miss_way] = address[miss]
+      inserted_at[miss_rows, miss_way] = time[miss]
+
+    last_used_at[rows, way] = time
+    if next_access is not None:
+      next_used_at[rows, way] = next_access[index]
+  return hits
+
+
+def lru_stack_distances(aligned_addresses, set_ids, max_distance):
+  """Returns the LRU stack distance of each access within its cache set.
+
+  The stack distance of an access is the number of distinct lines accessed in
+  its set since the previous access to the same line. By the inclusion
+  property of LRU, an access hits in an LRU cache with these sets and
+  associativity a if and only if its stack distance is less than a, so a
+  single pass gives the hits of every associativity up to max_distance.
+
+  Args:
+    aligned_addresses (np.ndarray): see simulate_sets.
+    set_ids (np.ndarray): see simulate_sets.
+    max_distance (int): distances are only tracked up to this value.
+
+  Returns:
+    distances (np.ndarray): int64 stack distance of each access, in trace
+      order. max_distance for first accesses and distances >= max_distance.
+  """
+  num_accesses = len(aligned_addresses)
+  distances = np.full(num_accesses, max_distance, dtype=np.int64)
+  if not num_accesses:
+    return distances
+
+  order = np.argsort(set_ids, kind="stable")
+  _, starts, counts = np.unique(
+      set_ids[order], return_index=True, return_counts=True)
+  by_count = np.argsort(-counts, kind="stable")
+  starts = starts[by_count]
+  counts = counts[by_count]
+  negated_counts = -counts
+
+  # Tracks the max_distance most recently used lines of each set, which
+  # behave as an LRU cache set with associativity max_distance.
+  num_sets = len(counts)
+  shape = (num_sets, max_distance)
+  tags = np.full(shape, -1, dtype=np.int64)
+  last_used_at = np.full(shape, -1, dtype=np.int64)
+  num_lines = np.zeros(num_sets, dtype=np.int64)
+
+  for step in range(counts[0]):
+    num_active = np.searchsorted(negated_counts, -step, side="left")
+    if num_active < _MIN_LOCKSTEP_SETS:
+      for row in range(num_active):
+        indices = order[starts[row] + step:starts[row] + counts[row]]
+        # Most recently used line first.
+        stack = [int(tags[row, way]) for way in
+                 np.argsort(-last_used_at[row])[:num_lines[row]]]
+        distances[indices] = _set_stack_distances(
+            aligned_addresses[indices].tolist(), stack, max_distance)
+      break
+    rows = np.arange(num_active)
+    index = order[starts[:num_active] + step]
+    address = aligned_addresses[index]
+
+    match = tags[:num_active] == address[:, np.newaxis]
+    hit = match.any(axis=1)
+    way = np.argmax(match, axis=1)
+    used_at = last_used_at[rows, way]
+    distances[index[hit]] = (
+        last_used_at[:num_active][hit] > used_at[hit, np.newaxis]).sum(axis=1)
+
+    miss = np.flatnonzero(~hit)
+    if miss.size:
+      miss_rows = rows[miss]
+      full = num_lines[miss_rows] == max_distance
+      miss_way = num_lines[miss_rows].copy()
+      num_lines[miss_rows[~full]] += 1
+      miss_way[full] = np.argmin(last_used_at[miss_rows[full]], axis=1)
+      way[miss] = miss_way
+      tags[miss_rows, miss_way] = address[miss]
+    last_used_at[rows, way] = index
+  return distances
+
+
+def _set_stack_distances(addresses, stack, max_distance):
+  """Returns the stack distances of the remaining accesses of one set.
+
+  Args:
+    addresses (list[int]): aligned address of each remaining access.
+    stack (list[int]): lines of the set, most recently used first.
+    max_distance (int): see lru_stack_distances.
+
+  Returns:
+    distances (list[int]): stack distance of each remaining access.
+  """
+  distances = []
+  for address in addresses:
+    if address in stack:
+      distance = stack.index(address)
+      del stack[distance]
+    else:
+      distance = max_distance
+      if len(stack) == max_distance:
+        stack.pop()
+    stack.insert(0, address)
+    distances.append(distance)
+  return distances
+
+
+def _simulate_set(addresses, indices, tags, inserted_at, last_used_at,
+                  next_used_at, num_lines, policy_type, victim_rank,
+                  next_accesses, num_accesses, max_look_ahead, draws):
+  """Simulates the remaining accesses of one set, one access at a time.
+
+  Args:
+    addresses (list[int]): aligned address of each remaining access.
+    indices (list[int]): trace time of each remaining access.
+    tags (list[int]): see simulate_sets, for this set.
+    inserted_at (list[int]): see simulate_sets, for this set.
+    last_used_at (list[int]): see simulate_sets, for this set.
+    next_used_at (list[int]): see simulate_sets, for this set.
+    num_lines (int): number of lines currently in the set.
+    policy_type (str): see simulate_sets.
+    victim_rank (int): rank of the line greedy policies evict.
+    next_accesses (list[int] | None): next_access of each remaining access.
+    num_accesses (int): length of the full trace.
+    max_look_ahead (int): see simulate_sets.
+    draws (list[int] | None): random draw at each remaining access.
+
+  Returns:
+    hits (list[bool]): whether each remaining access hits.
+  """
+  associativity = len(tags)
+  ways = range(associativity)
+
+  def belady_key(way, index):
+    distance = next_used_at[way] - index
+    if next_used_at[way] >= num_accesses or distance > max_look_ahead:
+      return (-num_accesses - 1, inserted_at[way])
+    return (-distance, inserted_at[way])
+
+  hits = []
+  for k, (address, index) in enumerate(zip(addresses, indices)):
+    hit = address in tags
+    if hit:
+      way = tags.index(address)
+    elif num_lines < associativity:
+      way = num_lines
+      num_lines += 1
+    else:
+      if policy_type == "lru":
+        way = sorted(ways, key=last_used_at.__getitem__)[victim_rank]
+      elif policy_type == "belady":
+        way = sorted(ways, key=lambda w: belady_key(w, index))[victim_rank]
+      else:
+        way = sorted(ways, key=inserted_at.__getitem__)[draws[k]]
+    if not hit:
+      tags[way] = address
+      inserted_at[way] = index
+    last_used_at[way] = index
+    if next_accesses is not None:
+      next_used_at[way] = next_accesses[k]
+    hits.append(hit)
+  return hits
+
+
+def _random_draws(aligned_addresses, order, starts, counts, associativity,
+                  seed):
+  """Replays the draws eviction_policy.RandomPolicy makes on each access.
+
+  RandomPolicy draws randint(len(cache_lines)) on every access to a non-empty
+  set, hit or miss. A set only evicts once full, so before an access it holds
+  min(number of distinct lines accessed in the set so far, associativity)
+  lines, which does not depend on the draws.
+
+  Args:
+    aligned_addresses (np.ndarray): see simulate_sets.
+    order (np.ndarray): indices of accesses grouped by set.
+    starts (np.ndarray): start of each set's accesses in order.
+    counts (np.ndarray): number of accesses of each set.
+    associativity (int): number of cache lines per set.
+    seed (int): see simulate_sets.
+
+  Returns:
+    draws (np.ndarray): draw made at each access, in trace order. 0 where no
+      draw is made.
+  """
+  num_accesses = len(aligned_addresses)
+  first = np.zeros(num_accesses, dtype=np.int64)
+  first[np.unique(aligned_addresses, return_index=True)[1]] = 1
+  # Number of distinct lines accessed in the set before each access.
+  first = first[order]
+  seen = np.cumsum(first) - first
+  seen -= np.repeat(seen[starts], counts)
+  num_lines = np.empty(num_accesses, dtype=np.int64)
+  num_lines[order] = np.minimum(seen, associativity)
+
+  draws = np.zeros(num_accesses, dtype=np.int64)
+  nonempty = num_lines > 0
+  draws[nonempty] = np.random.RandomState(seed).randint(0, num_lines[nonempty])
+  return draws
+
+
+def _policy_from_config(config):
+  """Returns the (policy_type, n) of a supported eviction policy config.
+
+  Args:
+    config (Config): config for the eviction policy.
+
+  Returns:
+    policy_type (str): one of "lru", "belady" or "random".
+    n (int): see eviction_policy.GreedyEvictionPolicy.
+  """
+  policy_type = config.get("policy_type")
+  if policy_type == "random":
+    return "random", 0
+  elif policy_type == "greedy":
+    scorer_type = config.get("scorer").get("type")
+    if scorer_type in ("lru", "belady"):
+      return scorer_type, config.get("n", 0)
+    raise ValueError(
+        "Scorer type not supported by simulator: {}".format(scorer_type))
+  raise ValueError(
+      "Policy type not supported by simulator: {}".format(policy_type))
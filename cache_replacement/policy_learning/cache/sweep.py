@@ -0,0 +1,238 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+# pylint: disable=line-too-long
+r"""Computes the hit rates of many cache configs over one memory trace.
+
+Example usage:
+
+  python3 -m cache_replacement.policy_learning.cache.sweep \
+    --cache_configs=cache_replacement/policy_learning/cache/configs/default.json \
+    --eviction_policy_configs=cache_replacement/policy_learning/cache/configs/eviction_policy/lru.json \
+    --eviction_policy_configs=cache_replacement/policy_learning/cache/configs/eviction_policy/belady.json \
+    --capacities=16384 --capacities=32768 --capacities=65536 \
+    --associativities=4 --associativities=8 --associativities=16 \
+    --memtrace_file=cache_replacement/policy_learning/cache/traces/sample_trace.csv \
+    --output_file=/tmp/hit_rates.csv
+
+  Writes the hit rates of LRU and Belady's for all 9 cache geometries to
+  /tmp/hit_rates.csv.
+
+The trace is read and aligned once for all configs. The hit rates of all LRU
+configs with the same number of sets come from a single pass computing LRU
+stack distances. The other configs are simulated with simulator.simulate_sets,
+possibly in parallel.
+"""
+# pylint: enable=line-too-long
+
+import collections
+import copy
+import csv
+import itertools
+import multiprocessing
+import os
+from absl import app
+from absl import flags
+from absl import logging
+
+import numpy as np
+from cache_replacement.policy_learning.cache import cache as cache_mod
+from cache_replacement.policy_learning.cache import memtrace
+from cache_replacement.policy_learning.cache import simulator
+from cache_replacement.policy_learning.common import config as cfg
+
+FLAGS = flags.FLAGS
+flags.DEFINE_multi_string(
+    "cache_configs",
+    ["cache_replacement/policy_learning/cache/configs/default.json"],
+    "List of config paths merged front to back for all caches.")
+flags.DEFINE_multi_string(
+    "eviction_policy_configs",
+    [
+        "cache_replacement/policy_learning/cache/configs/eviction_policy/lru.json",  # pylint: disable=line-too-long
+        "cache_replacement/policy_learning/cache/configs/eviction_policy/belady.json"  # pylint: disable=line-too-long
+    ],
+    "Config paths of the eviction policies to sweep over.")
+flags.DEFINE_multi_integer(
+    "capacities", [], "Cache capacities to sweep over. Defaults to the config.")
+flags.DEFINE_multi_integer(
+    "associativities", [],
+    "Cache associativities to sweep over. Defaults to the config.")
+flags.DEFINE_multi_string(
+    "config_bindings", [],
+    ("override config with key=value pairs "
+     "(e.g., cache_line_size=128)"))
+flags.DEFINE_string(
+    "memtrace_file",
+    "cache_replacement/policy_learning/cache/traces/omnetpp_train.csv",
+    "Memory trace file path to use.")
+flags.DEFINE_integer(
+    "warmup_period", int(2e3), "Number of cache reads before recording stats.")
+flags.DEFINE_integer(
+    "num_workers", 1, "Number of processes simulating non-LRU configs.")
+flags.DEFINE_string(
+    "output_file", None, "If set, the hit-rate table is written to this CSV.")
+
+# Arrays shared by the simulations of a worker process.
+_worker_arrays = None
+
+
+def sweep(filename, configs, warmup_period=0, max_look_ahead=int(1e7),
+          num_workers=1):
+  """Returns the hit rate of each cache config over the memory trace.
+
+  Args:
+    filename (str): path to the memory trace (see memtrace.load_trace_arrays).
+    configs (list[Config]): cache configs, as passed to cache.Cache.from_config.
+      Their eviction policies must be supported by simulator.simulate.
+    warmup_period (int): number of accesses before recording hits.
+    max_look_ahead (int): see memtrace.MemoryTrace. Only used by Belady's.
+    num_workers (int): number of processes simulating the configs that do not
+      use LRU stack distances.
+
+  Returns:
+    hit_rates (list[float]): hit rate of each config, in order.
+  """
+  hit_rates = [None] * len(configs)
+  configs_by_line_size = collections.defaultdict(list)
+  for i, config in enumerate(configs):
+    configs_by_line_size[config.get("cache_line_size")].append(i)
+
+  first_line_size = next(iter(configs_by_line_size))
+  trace = memtrace.load_trace_arrays(filename, cache_line_size=first_line_size)
+  if len(trace.addresses) <= warmup_period:
+    raise ValueError("Trace has no accesses after the warm up period.")
+
+  for cache_line_size, config_indices in configs_by_line_size.items():
+    cache_line_bits = int(np.log2(cache_line_size))
+    aligned_addresses = (
+        np.asarray(trace.addresses) >> np.uint64(cache_line_bits)).astype(
+            np.int64)
+    if cache_line_size == first_line_size:
+      next_access = trace.next_access
+    else:
+      next_access = memtrace.compute_next_access(aligned_addresses)
+
+    # LRU configs evicting the least recently used line, keyed by set bits.
+    stack_distance_groups = collections.defaultdict(list)
+    simulations = []
+    for i in config_indices:
+      config = configs[i]
+      set_bits, _ = cache_mod.cache_geometry(
+          config.get("capacity"), config.get("associativity"),
+          cache_line_size)
+      policy_type, n = simulator._policy_from_config(  # pylint: disable=protected-access
+          config.get("eviction_policy"))
+      if policy_type == "lru" and n == 0:
+        stack_distance_groups[set_bits].append(i)
+      else:
+        simulations.append(
+            (i, set_bits, config.get("associativity"), policy_type, n))
+
+    for set_bits, group in stack_distance_groups.items():
+      max_associativity = max(configs[i].get("associativity") for i in group)
+      distances = simulator.lru_stack_distances(
+          aligned_addresses, aligned_addresses & ((1 << set_bits) - 1),
+          max_associativity)[warmup_period:]
+      cumulative_hits = np.cumsum(
+          np.bincount(distances, minlength=max_associativity + 1))
+      for i in group:
+        associativity = configs[i].get("associativity")
+        hit_rates[i] = cumulative_hits[associativity - 1] / len(distances)
+
+    arrays = (aligned_addresses, next_access, max_look_ahead, warmup_period)
+    if num_workers > 1 and len(simulations) > 1:
+      pool = multiprocessing.Pool(
+          num_workers, initializer=_init_worker, initargs=(arrays,))
+      try:
+        results = pool.map(_simulate, simulations)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      _init_worker(arrays)
+      results = [_simulate(simulation) for simulation in simulations]
+    for (i, _, _, _, _), hit_rate in zip(simulations, results):
+      hit_rates[i] = hit_rate
+  return hit_rates
+
+
+def _init_worker(arrays):
+  """Stores the arrays shared by the simulations run in this process."""
+  global _worker_arrays
+  _worker_arrays = arrays
+
+
+def _simulate(simulation):
+  """Returns the hit rate of one config simulated with simulate_sets.
+
+  Args:
+    simulation (tuple): index, set_bits, associativity, policy_type and n of
+      the config.
+
+  Returns:
+    hit_rate (float): fraction of accesses after the warm up that hit.
+  """
+  _, set_bits, associativity, policy_type, n = simulation
+  aligned_addresses, next_access, max_look_ahead, warmup_period = (
+      _worker_arrays)
+  hits = simulator.simulate_sets(
+      aligned_addresses, aligned_addresses & ((1 << set_bits) - 1),
+      associativity, policy_type, n=n, next_access=next_access,
+      max_look_ahead=max_look_ahead)
+  hit_rate_statistic = cache_mod.BernoulliProcessStatistic()
+  hit_rate_statistic.add_trials(hits[warmup_period:])
+  return hit_rate_statistic.success_rate()
+
+
+def main(_):
+  configs = []
+  policy_names = []
+  for policy_config in FLAGS.eviction_policy_configs:
+    base_config = cfg.Config.from_files_and_bindings(
+        FLAGS.cache_configs + [policy_config], FLAGS.config_bindings)
+    capacities = FLAGS.capacities or [base_config.get("capacity")]
+    associativities = (
+        FLAGS.associativities or [base_config.get("associativity")])
+    for capacity, associativity in itertools.product(
+        capacities, associativities):
+      config = copy.deepcopy(base_config)
+      config.set("capacity", capacity)
+      config.set("associativity", associativity)
+      configs.append(config)
+      policy_names.append(os.path.splitext(os.path.basename(policy_config))[0])
+
+  hit_rates = sweep(FLAGS.memtrace_file, configs,
+                    warmup_period=FLAGS.warmup_period,
+                    num_workers=FLAGS.num_workers)
+
+  header = ["eviction_policy", "cache_line_size", "capacity", "associativity",
+            "hit_rate"]
+  rows = [[policy_name, config.get("cache_line_size"), config.get("capacity"),
+           config.get("associativity"), hit_rate]
+          for policy_name, config, hit_rate in zip(
+              policy_names, configs, hit_rates)]
+  for row in rows:
+    logging.info("%s", ", ".join(str(value) for value in row))
+  if FLAGS.output_file is not None:
+    with open(FLAGS.output_file, "w") as f:
+      writer = csv.writer(f)
+      writer.writerow(header)
+      writer.writerows(rows)
+
+
+if __name__ == "__main__":
+  app.run(main)
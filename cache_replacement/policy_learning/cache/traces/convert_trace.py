@@ -0,0 +1,60 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#!/usr/bin/python3
+# Lint as: python3
+"""Converts an access trace to the binary trace format.
+
+Given a CSV file containing (pc, address) in hex, or a text file containing
+(instruction_type, pc, address) in decimal (see memtrace.CSVReader and
+memtrace.TxtReader), writes the accesses as fixed-width little-endian records
+(see memtrace.BinaryTraceWriter).
+
+Example usage:
+
+  Suppose that the access trace exists at /path/to/file.csv
+  Results in the binary trace /path/to/file.bin.
+
+  python3 convert_trace.py /path/to/file.csv /path/to/file.bin
+"""
+import argparse
+import os
+
+from cache_replacement.policy_learning.cache import memtrace
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      "access_trace_filename", help="Local path to the access trace to convert.")
+  parser.add_argument(
+      "binary_trace_filename", help="Local path to write the binary trace to.")
+  parser.add_argument(
+      "-z", "--compress", action="store_true",
+      help="Compresses each block of records with zlib.")
+  parser.add_argument(
+      "-b", "--block_size", type=int, default=1 << 16,
+      help="Number of records per block.")
+  args = parser.parse_args()
+
+  if os.path.exists(args.binary_trace_filename):
+    raise ValueError(f"File {args.binary_trace_filename} already exists.")
+  if os.path.splitext(args.binary_trace_filename)[1] != ".bin":
+    raise ValueError("Binary traces must have the .bin extension.")
+
+  memtrace.convert_to_binary(
+      args.access_trace_filename, args.binary_trace_filename,
+      compress=args.compress, block_size=args.block_size)
+  print(f"Wrote {len(memtrace.BinaryTrace(args.binary_trace_filename))} "
+        f"accesses to {args.binary_trace_filename}")
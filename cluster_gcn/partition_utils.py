@@ -15,60 +15,104 @@
 
 """Collections of partitioning functions."""
 
+import hashlib
+import os
 import time
 import metis
+import numpy as np
 import scipy.sparse as sp
 import tensorflow.compat.v1 as tf
 
 
-def partition_graph(adj, idx_nodes, num_clusters):
-  """partition a graph by METIS."""
+def _metis_graph(train_adj):
+  """Converts a CSR adjacency matrix to a METIS graph without self-edges."""
+  num_nodes = train_adj.shape[0]
+  rows = np.repeat(np.arange(num_nodes), np.diff(train_adj.indptr))
+  # self-edge needs to be removed for valid format of METIS
+  not_self_edge = train_adj.indices != rows
+  idx_dtype = np.dtype(metis.idx_t)
+  xadj = np.zeros(num_nodes + 1, dtype=idx_dtype)
+  np.cumsum(np.bincount(rows[not_self_edge], minlength=num_nodes), out=xadj[1:])
+  adjncy = train_adj.indices[not_self_edge].astype(idx_dtype)
+  return metis.METIS_Graph(
+      metis.idx_t(num_nodes), metis.idx_t(1), np.ctypeslib.as_ctypes(xadj),
+      np.ctypeslib.as_ctypes(adjncy), None, None, None)
+
+
+def _partition_cache_path(cache_dir, train_adj, idx_nodes, num_clusters):
+  """Path of the cached partition of a graph in cache_dir."""
+  graph_hash = hashlib.sha1()
+  for array in (train_adj.indptr, train_adj.indices, idx_nodes):
+    graph_hash.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+  return os.path.join(
+      cache_dir,
+      'partition_{}_{}.npy'.format(num_clusters, graph_hash.hexdigest()))
+
+
+def partition_graph(adj, idx_nodes, num_clusters, cache_dir=None):
+  """partition a graph by METIS.
+
+  Args:
+    adj: sparse adjacency matrix of all the nodes.
+    idx_nodes: indices of the nodes to partition. Their neighbors in adj must
+      also be in idx_nodes.
+    num_clusters: number of partitions.
+    cache_dir: if set, the partition is saved to and reused from this
+      directory, keyed by a hash of the graph of idx_nodes and num_clusters.
+
+  Returns:
+    The adjacency matrix of the edges inside the partitions, and the indices of
+    the nodes of each partition.
+  """
 
   start_time = time.time()
+  idx_nodes = np.asarray(idx_nodes)
   num_nodes = len(idx_nodes)
   num_all_nodes = adj.shape[0]
 
-  neighbor_intervals = []
-  neighbors = []
-  edge_cnt = 0
-  neighbor_intervals.append(0)
-  train_adj_lil = adj[idx_nodes, :][:, idx_nodes].tolil()
-  train_ord_map = dict()
-  train_adj_lists = [[] for _ in range(num_nodes)]
-  for i in range(num_nodes):
-    rows = train_adj_lil[i].rows[0]
-    # self-edge needs to be removed for valid format of METIS
-    if i in rows:
-      rows.remove(i)
-    train_adj_lists[i] = rows
-    neighbors += rows
-    edge_cnt += len(rows)
-    neighbor_intervals.append(edge_cnt)
-    train_ord_map[idx_nodes[i]] = i
-
-  if num_clusters > 1:
-    _, groups = metis.part_graph(train_adj_lists, num_clusters, seed=1)
-  else:
-    groups = [0] * num_nodes
-
-  part_row = []
-  part_col = []
-  part_data = []
-  parts = [[] for _ in range(num_clusters)]
-  for nd_idx in range(num_nodes):
-    gp_idx = groups[nd_idx]
-    nd_orig_idx = idx_nodes[nd_idx]
-    parts[gp_idx].append(nd_orig_idx)
-    for nb_orig_idx in adj[nd_orig_idx].indices:
-      nb_idx = train_ord_map[nb_orig_idx]
-      if groups[nb_idx] == gp_idx:
-        part_data.append(1)
-        part_row.append(nd_orig_idx)
-        part_col.append(nb_orig_idx)
-  part_data.append(0)
-  part_row.append(num_all_nodes - 1)
-  part_col.append(num_all_nodes - 1)
-  part_adj = sp.coo_matrix((part_data, (part_row, part_col))).tocsr()
+  train_adj = sp.csr_matrix(adj[idx_nodes, :][:, idx_nodes])
+  train_adj.sum_duplicates()
+  train_adj.sort_indices()
+
+  groups = None
+  cache_path = None
+  if cache_dir is not None and num_clusters > 1:
+    cache_path = _partition_cache_path(cache_dir, train_adj, idx_nodes,
+                                       num_clusters)
+    if tf.gfile.Exists(cache_path):
+      with tf.gfile.Open(cache_path, 'rb') as f:
+        groups = np.load(f)
+      tf.logging.info('Loaded partition from %s.', cache_path)
+
+  if groups is None:
+    if num_clusters > 1:
+      _, groups = metis.part_graph(_metis_graph(train_adj), num_clusters,
+                                   seed=1)
+      groups = np.array(groups, dtype=np.int64)
+    else:
+      groups = np.zeros(num_nodes, dtype=np.int64)
+    if cache_path is not None:
+      tf.gfile.MakeDirs(cache_dir)
+      tmp_path = cache_path + '.tmp'
+      with tf.gfile.Open(tmp_path, 'wb') as f:
+        np.save(f, groups)
+      tf.gfile.Rename(tmp_path, cache_path, overwrite=True)
+
+  # Keep the edges of adj between nodes of the same partition.
+  node_groups = np.full(num_all_nodes, -1, dtype=np.int64)
+  node_groups[idx_nodes] = groups
+  nodes_adj = sp.csr_matrix(adj)[idx_nodes, :].tocoo()
+  part_row = idx_nodes[nodes_adj.row]
+  part_col = nodes_adj.col
+  same_group = node_groups[part_row] == node_groups[part_col]
+  part_adj = sp.csr_matrix(
+      (np.ones(np.count_nonzero(same_group)),
+       (part_row[same_group], part_col[same_group])),
+      shape=(num_all_nodes, num_all_nodes))
+
+  order = np.argsort(groups, kind='stable')
+  parts = np.split(idx_nodes[order],
+                   np.cumsum(np.bincount(groups, minlength=num_clusters))[:-1])
 
   tf.logging.info('Partitioning done. %f seconds.', time.time() - start_time)
   return part_adj, parts
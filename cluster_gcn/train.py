@@ -57,6 +57,15 @@ flags.DEFINE_bool(
     'Whether to pre-calculate the first layer (AX preprocessing).')
 flags.DEFINE_bool('validation', True,
                   'Print validation accuracy after each epoch.')
+flags.DEFINE_integer(
+    'num_batch_workers', 2,
+    'Number of threads building multi-cluster batches (0 to build them in the '
+    'training loop).')
+flags.DEFINE_integer('batch_queue_size', 4,
+                     'Maximum number of multi-cluster batches built ahead.')
+flags.DEFINE_string(
+    'partition_cache_dir', None,
+    'If set, METIS partitions are saved to and reused from this directory.')
 
 
 def load_data(data_prefix, dataset_str, precalc):
@@ -135,27 +144,31 @@ def main(unused_argv):
 
   # Partition graph and do preprocessing
   if FLAGS.bsize > 1:
-    _, parts = partition_utils.partition_graph(train_adj, visible_data,
-                                               FLAGS.num_clusters)
+    _, parts = partition_utils.partition_graph(
+        train_adj, visible_data, FLAGS.num_clusters,
+        cache_dir=FLAGS.partition_cache_dir)
     parts = [np.array(pt) for pt in parts]
   else:
     (parts, features_batches, support_batches, y_train_batches,
      train_mask_batches) = utils.preprocess(train_adj, train_feats, y_train,
                                             train_mask, visible_data,
                                             FLAGS.num_clusters,
-                                            FLAGS.diag_lambda)
+                                            FLAGS.diag_lambda,
+                                            FLAGS.partition_cache_dir)
 
   (_, val_features_batches, val_support_batches, y_val_batches,
    val_mask_batches) = utils.preprocess(full_adj, test_feats, y_val, val_mask,
                                         np.arange(num_data),
                                         FLAGS.num_clusters_val,
-                                        FLAGS.diag_lambda)
+                                        FLAGS.diag_lambda,
+                                        FLAGS.partition_cache_dir)
 
   (_, test_features_batches, test_support_batches, y_test_batches,
    test_mask_batches) = utils.preprocess(full_adj, test_feats, y_test,
                                          test_mask, np.arange(num_data),
                                          FLAGS.num_clusters_test,
-                                         FLAGS.diag_lambda)
+                                         FLAGS.diag_lambda,
+                                         FLAGS.partition_cache_dir)
   idx_parts = list(range(len(parts)))
 
   # Some preprocessing
@@ -201,16 +214,12 @@ def main(unused_argv):
     t = time.time()
     np.random.shuffle(idx_parts)
     if FLAGS.bsize > 1:
-      (features_batches, support_batches, y_train_batches,
-       train_mask_batches) = utils.preprocess_multicluster(
-           train_adj, parts, train_feats, y_train, train_mask,
-           FLAGS.num_clusters, FLAGS.bsize, FLAGS.diag_lambda)
-      for pid in range(len(features_batches)):
-        # Use preprocessed batch data
-        features_b = features_batches[pid]
-        support_b = support_batches[pid]
-        y_train_b = y_train_batches[pid]
-        train_mask_b = train_mask_batches[pid]
+      # Batches are built in the background while training.
+      for (features_b, support_b, y_train_b,
+           train_mask_b) in utils.multicluster_batches(
+               train_adj, parts, train_feats, y_train, train_mask,
+               FLAGS.num_clusters, FLAGS.bsize, FLAGS.diag_lambda,
+               FLAGS.num_batch_workers, FLAGS.batch_queue_size):
         # Construct feed dictionary
         feed_dict = utils.construct_feed_dict(features_b, support_b, y_train_b,
                                               train_mask_b, placeholders)
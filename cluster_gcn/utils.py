@@ -15,7 +15,9 @@
 
 """Collections of preprocessing functions for different graph formats."""
 
+import collections
 import json
+from multiprocessing import pool as mp_pool
 import time
 
 from networkx.readwrite import json_graph
@@ -116,6 +118,81 @@ def construct_feed_dict(features, support, labels, labels_mask, placeholders):
   return feed_dict
 
 
+def multicluster_batch(adj, pt, features, y_train, train_mask,
+                       diag_lambda=-1):
+  """Generate the batch of the nodes pt of several clusters.
+
+  Returns:
+    The features, normalized support, labels and train mask of the batch, in
+    the argument order of construct_feed_dict.
+  """
+  support_now = adj[pt, :][:, pt]
+  if diag_lambda == -1:
+    support = sparse_to_tuple(normalize_adj(support_now))
+  else:
+    support = sparse_to_tuple(
+        normalize_adj_diag_enhance(support_now, diag_lambda))
+  return (features[pt, :], support, y_train[pt, :],
+          train_mask[pt].astype(np.bool_))
+
+
+def multicluster_batches(adj,
+                         parts,
+                         features,
+                         y_train,
+                         train_mask,
+                         num_clusters,
+                         block_size,
+                         diag_lambda=-1,
+                         num_workers=2,
+                         queue_size=4):
+  """Generate the batches for multiple clusters on the fly.
+
+  Shuffles parts in place and yields one batch per block_size consecutive
+  parts. The batches are built by num_workers threads, at most queue_size
+  batches ahead of the consumer, so only those batches are in memory.
+
+  Args:
+    adj: sparse adjacency matrix.
+    parts: list of np.arrays, the nodes of each cluster.
+    features: node features.
+    y_train: node labels.
+    train_mask: boolean mask of the training nodes.
+    num_clusters: number of clusters.
+    block_size: number of clusters per batch.
+    diag_lambda: diagonal enhancement, -1 for normalization without it.
+    num_workers: number of threads building batches. If 0, batches are built
+      when they are requested.
+    queue_size: maximum number of batches built ahead.
+
+  Yields:
+    The features, normalized support, labels and train mask of each batch, in
+    the argument order of construct_feed_dict.
+  """
+  np.random.shuffle(parts)
+  batch_nodes = (
+      np.concatenate(parts[st:min(st + block_size, num_clusters)], axis=0)
+      for st in range(0, num_clusters, block_size))
+  batch_args = ((adj, pt, features, y_train, train_mask, diag_lambda)
+                for pt in batch_nodes)
+  if not num_workers:
+    for args in batch_args:
+      yield multicluster_batch(*args)
+    return
+
+  workers = mp_pool.ThreadPool(num_workers)
+  try:
+    pending = collections.deque()
+    for args in batch_args:
+      if len(pending) >= queue_size:
+        yield pending.popleft().get()
+      pending.append(workers.apply_async(multicluster_batch, args))
+    while pending:
+      yield pending.popleft().get()
+  finally:
+    workers.terminate()
+
+
 def preprocess_multicluster(adj,
                             parts,
                             features,
@@ -130,27 +207,13 @@ def preprocess_multicluster(adj,
   support_batches = []
   y_train_batches = []
   train_mask_batches = []
-  total_nnz = 0
-  np.random.shuffle(parts)
-  for _, st in enumerate(range(0, num_clusters, block_size)):
-    pt = parts[st]
-    for pt_idx in range(st + 1, min(st + block_size, num_clusters)):
-      pt = np.concatenate((pt, parts[pt_idx]), axis=0)
-    features_batches.append(features[pt, :])
-    y_train_batches.append(y_train[pt, :])
-    support_now = adj[pt, :][:, pt]
-    if diag_lambda == -1:
-      support_batches.append(sparse_to_tuple(normalize_adj(support_now)))
-    else:
-      support_batches.append(
-          sparse_to_tuple(normalize_adj_diag_enhance(support_now, diag_lambda)))
-    total_nnz += support_now.count_nonzero()
-
-    train_pt = []
-    for newidx, idx in enumerate(pt):
-      if train_mask[idx]:
-        train_pt.append(newidx)
-    train_mask_batches.append(sample_mask(train_pt, len(pt)))
+  for features_b, support_b, y_train_b, train_mask_b in multicluster_batches(
+      adj, parts, features, y_train, train_mask, num_clusters, block_size,
+      diag_lambda, num_workers=0):
+    features_batches.append(features_b)
+    support_batches.append(support_b)
+    y_train_batches.append(y_train_b)
+    train_mask_batches.append(train_mask_b)
   return (features_batches, support_batches, y_train_batches,
           train_mask_batches)
 
@@ -161,12 +224,13 @@ def preprocess(adj,
                train_mask,
                visible_data,
                num_clusters,
-               diag_lambda=-1):
+               diag_lambda=-1,
+               partition_cache_dir=None):
   """Do graph partitioning and preprocessing for SGD training."""
 
   # Do graph partitioning
-  part_adj, parts = partition_utils.partition_graph(adj, visible_data,
-                                                    num_clusters)
+  part_adj, parts = partition_utils.partition_graph(
+      adj, visible_data, num_clusters, cache_dir=partition_cache_dir)
   if diag_lambda == -1:
     part_adj = normalize_adj(part_adj)
   else:
@@ -184,12 +248,7 @@ def preprocess(adj,
     total_nnz += now_part.count_nonzero()
     support_batches.append(sparse_to_tuple(now_part))
     y_train_batches.append(y_train[pt, :])
-
-    train_pt = []
-    for newidx, idx in enumerate(pt):
-      if train_mask[idx]:
-        train_pt.append(newidx)
-    train_mask_batches.append(sample_mask(train_pt, len(pt)))
+    train_mask_batches.append(train_mask[pt].astype(np.bool_))
   return (parts, features_batches, support_batches, y_train_batches,
           train_mask_batches)
 
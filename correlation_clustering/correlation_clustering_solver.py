@@ -14,11 +14,66 @@
 # limitations under the License.
 
 """Implementations of standard correlation clustering algorithm.
+
+The algorithms work on the positive edges of the graph only, which are
+converted once from networkx to compressed sparse row (CSR) arrays. All other
+pairs of nodes are implicitly negative.
 """
 
 import collections
+import multiprocessing
 import random
-from .utils import CorrelationClusteringError
+import numpy as np
+from .utils import CorrelationClusteringCost
+
+# The positive edges of a graph in CSR format: the positive neighbors of
+# nodes[i] are nodes[indices[indptr[i]:indptr[i + 1]]], in the order of
+# graph.neighbors(nodes[i]).
+CsrGraph = collections.namedtuple('CsrGraph', ['nodes', 'indptr', 'indices'])
+
+# The CsrGraph used by the local search attempts of a worker process.
+_worker_graph = None
+
+
+def PositiveCsrGraph(graph):
+  """Converts the positive edges of a graph to CSR arrays.
+
+  Args:
+    graph: the graph in nx.Graph format.
+  Returns:
+    The CsrGraph of the positive edges, with the nodes in sorted order.
+  """
+  nodes = sorted(list(graph.nodes()))
+  position = {node: i for i, node in enumerate(nodes)}
+  degrees = []
+  indices = []
+  for node in nodes:
+    positive_neighbors = [
+        position[neighbor]
+        for neighbor, d in graph.adj[node].items()
+        if d['weight'] > 0
+    ]
+    degrees.append(len(positive_neighbors))
+    indices.extend(positive_neighbors)
+  indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+  np.cumsum(degrees, out=indptr[1:])
+  return CsrGraph(nodes, indptr, np.array(indices, dtype=np.int64))
+
+
+def ClustersFromIds(nodes, cluster_ids):
+  """Groups the nodes by cluster id.
+
+  Args:
+    nodes: list of nodes.
+    cluster_ids: np.array of ints, the cluster id of each node.
+  Returns:
+    The solution as a list of clusters, ordered by cluster id.
+  """
+  cluster_ids = np.asarray(cluster_ids)
+  order = np.argsort(cluster_ids, kind='stable')
+  boundaries = np.flatnonzero(np.diff(cluster_ids[order])) + 1
+  return [[nodes[i] for i in cluster]
+          for cluster in np.split(order, boundaries) if cluster.size]
 
 
 def PivotAlgorithm(graph):
@@ -30,52 +85,84 @@ def PivotAlgorithm(graph):
   Returns:
     The solution.
   """
+  csr_graph = PositiveCsrGraph(graph)
+  indptr = csr_graph.indptr.tolist()
+  indices = csr_graph.indices.tolist()
+  num_nodes = len(csr_graph.nodes)
   # This is to ensure consistency of random runs with same seed.
-  nodes = sorted(list(graph.nodes()))
-  random.shuffle(nodes)
-  clusters = []
-  clustered = set()
+  order = list(range(num_nodes))
+  random.shuffle(order)
+  cluster_ids = [-1] * num_nodes
 
-  for node in nodes:
-    if node in clustered:
+  for node in order:
+    if cluster_ids[node] >= 0:
       continue
-    cluster = [node]
-    clustered.add(node)
+    cluster_ids[node] = node
+    for neighbor in indices[indptr[node]:indptr[node + 1]]:
+      if cluster_ids[neighbor] < 0:
+        cluster_ids[neighbor] = node
+  return ClustersFromIds(csr_graph.nodes, cluster_ids)
 
-    for neighbor in graph.neighbors(node):
-      if graph.edges[node,
-                     neighbor]['weight'] > 0 and neighbor not in clustered:
-        cluster.append(neighbor)
-        clustered.add(neighbor)
-    clusters.append(cluster)
-  assert len(clustered) == sum(len(c) for c in clusters)
-  assert clustered == set(nodes)
-  return clusters
 
-
-def LocalSearchAlgorithm(graph, attempts=10):
+def LocalSearchAlgorithm(graph, attempts=10, num_workers=1):
   """Run the local search heuristic for correlation clustering.
 
   The algorithm is a simple local search heuristic that tries to improve the
   clustering by local moves of individual nodes until a certain number of
   iterations over the graph are completed.
 
+  Each attempt uses its own random number generator, seeded from the random
+  module, so the solution only depends on the seed of the random module and not
+  on num_workers. The attempts are compared by their number of disagreements,
+  which is tracked during the search.
+
   Args:
     graph: the graph in nx.Graph format.
     attempts: number of times local search is run.
+    num_workers: number of processes running the attempts.
   Returns:
     The solution.
   """
-  best_sol = None
+  csr_graph = PositiveCsrGraph(graph)
+  seeds = [random.getrandbits(64) for _ in range(attempts)]
+  if num_workers > 1 and attempts > 1:
+    pool = multiprocessing.Pool(
+        num_workers, initializer=_InitWorker, initargs=(csr_graph,))
+    try:
+      results = pool.map(_RunLocalSearch, seeds)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    _InitWorker(csr_graph)
+    results = [_RunLocalSearch(seed) for seed in seeds]
+
+  best_cluster_ids = None
   best_sol_value = None
-  for _ in range(attempts):
-    ls = LocalSearchCorrelationClustering(graph, 20)
-    sol = ls.RunClustering()
-    cost = CorrelationClusteringError(graph, sol)
+  for cluster_ids, cost in results:
     if best_sol_value is None or best_sol_value > cost:
       best_sol_value = cost
-      best_sol = sol
-  return best_sol
+      best_cluster_ids = cluster_ids
+  return ClustersFromIds(csr_graph.nodes, best_cluster_ids)
+
+
+def _InitWorker(csr_graph):
+  """Stores the graph used by the local search attempts of this process."""
+  global _worker_graph
+  _worker_graph = csr_graph
+
+
+def _RunLocalSearch(seed):
+  """Runs one local search attempt.
+
+  Args:
+    seed: int, seed of the random number generator of the attempt.
+  Returns:
+    The cluster id of each node and the number of disagreements.
+  """
+  ls = LocalSearchCorrelationClustering(_worker_graph, 20, random.Random(seed))
+  ls.RunClustering()
+  return np.array(ls.cluster_ids, dtype=np.int64), ls.cost.disagreements
 
 
 class LocalSearchCorrelationClustering(object):
@@ -84,54 +171,83 @@ class LocalSearchCorrelationClustering(object):
   The algorithm performs a series of passes over the nodes in the graph in
   arbitrary order.
   For each node in the order, it checks if the solution can be improved by
-  moving the node to another cluster.
+  moving the node to another cluster. The search stops early after a pass
+  without any move, since the following passes would not move any node either.
+
+  Nodes are referred to by their position in the sorted nodes, and clusters by
+  integer ids. Initially, node i is alone in cluster i.
   """
 
-  def __init__(self, graph, iterations):
+  def __init__(self, graph, iterations, rng=None):
+    """Initializes the local search.
+
+    Args:
+      graph: the graph in nx.Graph format, or its PositiveCsrGraph.
+      iterations: number of passes over the nodes.
+      rng: random.Random used to order the nodes in each pass. Defaults to the
+        random module.
+    """
+    if not isinstance(graph, CsrGraph):
+      graph = PositiveCsrGraph(graph)
     self.graph = graph
     self.iterations = iterations
-    self.node_to_cluster_id = {}
-    self.cluster_uid = 0
-    self.cluster_id_nodes = collections.defaultdict(set)
-    for node in self.graph.nodes():
-      self.node_to_cluster_id[node] = self.cluster_uid
-      self.cluster_id_nodes[self.cluster_uid].add(node)
-      self.cluster_uid += 1
+    self.rng = random if rng is None else rng
+    self.cost = CorrelationClusteringCost(graph.indptr, graph.indices,
+                                          np.arange(len(graph.nodes)))
+    # Plain lists are much faster than numpy arrays for the scalar accesses of
+    # the moves. They are shared with self.cost.
+    self.indptr = self.cost.indptr
+    self.indices = self.cost.indices
+    self.cluster_ids = self.cost.cluster_ids
+    self.cluster_sizes = self.cost.cluster_sizes
 
   def MoveNodeToCluster(self, node, cluster_id):
     """Moves a node to a cluster."""
-    self.cluster_id_nodes[self.node_to_cluster_id[node]].remove(node)
-    self.node_to_cluster_id[node] = cluster_id
-    self.cluster_id_nodes[cluster_id].add(node)
+    self.cost.MoveNode(node, cluster_id)
 
   def DoOnePassMoves(self):
-    """Completes one pass over the graph."""
-    nodes = sorted(list(self.graph.nodes()))
-    random.shuffle(nodes)
+    """Completes one pass over the graph.
+
+    Returns:
+      The number of nodes moved.
+    """
+    indptr = self.indptr
+    indices = self.indices
+    cluster_ids = self.cluster_ids
+    cluster_sizes = self.cluster_sizes
+    num_nodes = len(cluster_ids)
+    nodes = list(range(num_nodes))
+    self.rng.shuffle(nodes)
+    num_moves = 0
     for node in nodes:
-      positive_to_clusters = collections.defaultdict(int)
+      start = indptr[node]
+      positives = indptr[node + 1] - start
+      if not positives:
+        # The node can only be moved to the cluster of a positive neighbor.
+        continue
+      positive_to_clusters = {}
+      for neighbor in indices[start:start + positives]:
+        c = cluster_ids[neighbor]
+        positive_to_clusters[c] = positive_to_clusters.get(c, 0) + 1
       best_cluster = None
-      best_cluster_cost = self.graph.number_of_nodes() + 1
-      positives = 0
-      for neighbor in self.graph.neighbors(node):
-        if self.graph.edges[node, neighbor]['weight'] > 0:
-          positives += 1
-          positive_to_clusters[self.node_to_cluster_id[neighbor]] += 1
-      curr_cluster = self.node_to_cluster_id[node]
-      curr_cluster_cost = positives + len(
-          self.cluster_id_nodes[curr_cluster]
-          )-1-2*positive_to_clusters[curr_cluster]
+      best_cluster_cost = num_nodes + 1
+      curr_cluster = cluster_ids[node]
+      curr_cluster_cost = positives + cluster_sizes[
+          curr_cluster] - 1 - 2 * positive_to_clusters.get(curr_cluster, 0)
       for c, pos in positive_to_clusters.items():
         if c != curr_cluster:
-          cluster_cost = positives + len(self.cluster_id_nodes[c]) - 2*pos
+          cluster_cost = positives + cluster_sizes[c] - 2 * pos
           if cluster_cost < best_cluster_cost:
             best_cluster_cost = cluster_cost
             best_cluster = c
 
       if best_cluster_cost < curr_cluster_cost:
         self.MoveNodeToCluster(node, best_cluster)
+        num_moves += 1
+    return num_moves
 
   def RunClustering(self):
     for _ in range(self.iterations):
-      self.DoOnePassMoves()
-    return self.cluster_id_nodes.values()
+      if not self.DoOnePassMoves():
+        break
+    return ClustersFromIds(self.graph.nodes, self.cluster_ids)
@@ -103,6 +103,7 @@ from correlation_clustering.utils import ClusterIdMap
 from correlation_clustering.utils import CorrelationClusteringError
 from correlation_clustering.utils import FractionalColorImbalance
 from correlation_clustering.utils import PairwiseFairletCosts
+from correlation_clustering.utils import SignedEdgesFromGraph
 import networkx as nx
 import pandas as pd
 
@@ -389,7 +390,7 @@ def UnpackSolution(compressed_solution, fairlet_dict):
   return list(new_clusters.values())
 
 
-def RunEval(graph, num_colors, algorithm, algo_label, seed):
+def RunEval(graph, num_colors, algorithm, algo_label, seed, signed_edges=None):
   """Run the evalution of a given correlation clustering algorithm.
 
   Runs the function algorithm over graph to obtain a solution and then evaluates
@@ -401,6 +402,8 @@ def RunEval(graph, num_colors, algorithm, algo_label, seed):
     algorithm: the algorithm to call
     algo_label: a label for the algorithm
     seed: a seed used for randomness
+    signed_edges: the SignedEdges of the graph, to avoid converting it for
+      every evaluation.
 
   Returns:
     A dictionary with the results of the evaluation.
@@ -420,7 +423,9 @@ def RunEval(graph, num_colors, algorithm, algo_label, seed):
       all_elems.add(c)
   assert all_elems == set(graph.nodes())
   assert sum(len(clust) for clust in solution) == graph.number_of_nodes()
-  result['error'] = CorrelationClusteringError(graph, solution)
+  if signed_edges is None:
+    signed_edges = SignedEdgesFromGraph(graph)
+  result['error'] = CorrelationClusteringError(signed_edges, solution)
   result['onehalf_imbalance'] = FractionalColorImbalance(graph, solution, 0.5)
   if num_colors > 2:
     result['equal_imbalance'] = FractionalColorImbalance(
@@ -453,10 +458,12 @@ def RunAnalysis(graph, num_colors, seed, tries, outfile):
     algorithms.extend([(CorrelationClusteringEqualRepresentation, 'equal_fair'),
                        (BaselineRandomFairEqual, 'random_equal_fair')])
 
+  signed_edges = SignedEdgesFromGraph(graph)
   for t in range(tries):
     for algo, algo_label in algorithms:
       seed_for_run = seed + t
-      results.append(RunEval(graph, num_colors, algo, algo_label, seed_for_run))
+      results.append(RunEval(graph, num_colors, algo, algo_label, seed_for_run,
+                             signed_edges))
 
   df = pd.DataFrame(results)
   with open(outfile, 'w') as out_file:
@@ -107,25 +107,143 @@ def FractionalColorImbalance(graph, solution, alpha):
   return 1.0 * total_violation / nodes
 
 
+# The edges of a graph as arrays: edge i connects nodes[sources[i]] and
+# nodes[targets[i]] and has the sign of its weight, signs[i].
+SignedEdges = collections.namedtuple('SignedEdges',
+                                     ['nodes', 'sources', 'targets', 'signs'])
+
+
+def SignedEdgesFromGraph(graph):
+  """Converts the edges of a graph to SignedEdges.
+
+  Args:
+    graph: in nx.Graph format.
+  Returns:
+    the SignedEdges of the graph, with the nodes in sorted order.
+  """
+  nodes = sorted(list(graph.nodes()))
+  position = {node: i for i, node in enumerate(nodes)}
+  edges = list(graph.edges(data='weight'))
+  num_edges = len(edges)
+  sources = np.fromiter((position[u] for u, _, _ in edges), np.int64,
+                        num_edges)
+  targets = np.fromiter((position[v] for _, v, _ in edges), np.int64,
+                        num_edges)
+  signs = np.sign(np.fromiter((w for _, _, w in edges), np.float64,
+                              num_edges)).astype(np.int8)
+  return SignedEdges(nodes, sources, targets, signs)
+
+
 def CorrelationClusteringError(graph, solution):
   """Evaluates  the correlation clustering error of solution.
 
-  Computes the fraction of edges that are misclassified by the algorithm.
+  Computes the fraction of edges that are misclassified by the algorithm. To
+  evaluate many solutions of the same graph, convert it once with
+  SignedEdgesFromGraph.
 
   Args:
-    graph: in nx.Graph format.
+    graph: in nx.Graph format, or its SignedEdges.
     solution: list of clusters.
   Returns:
     the fraction of edges that are incorrectly classified.
   """
+  if not isinstance(graph, SignedEdges):
+    graph = SignedEdgesFromGraph(graph)
   clust_assignment = ClusterIdMap(solution)
-  errors = 0
-  corrects = 0
-  for u, v, d in graph.edges(data=True):
-    if (d['weight'] > 0 and clust_assignment[u] != clust_assignment[v]) or \
-        (d['weight'] < 0 and clust_assignment[u] == clust_assignment[v]):
-      errors += 1
-    elif (d['weight'] > 0 and clust_assignment[u] == clust_assignment[v]) or \
-        (d['weight'] < 0 and clust_assignment[u] != clust_assignment[v]):
-      corrects += 1
+  cluster_ids = np.array([clust_assignment[node] for node in graph.nodes],
+                         dtype=np.int64)
+  return CorrelationClusteringErrorOfIds(graph, cluster_ids)
+
+
+def CorrelationClusteringErrorOfIds(signed_edges, cluster_ids):
+  """Evaluates the correlation clustering error of a cluster id assignment.
+
+  Args:
+    signed_edges: the SignedEdges of the graph.
+    cluster_ids: np.array of ints, the cluster id of each of
+      signed_edges.nodes.
+  Returns:
+    the fraction of edges that are incorrectly classified.
+  """
+  same_cluster = (cluster_ids[signed_edges.sources] ==
+                  cluster_ids[signed_edges.targets])
+  positive = signed_edges.signs > 0
+  negative = signed_edges.signs < 0
+  errors = int(np.count_nonzero(positive & ~same_cluster) +
+               np.count_nonzero(negative & same_cluster))
+  corrects = int(np.count_nonzero(positive & same_cluster) +
+                 np.count_nonzero(negative & ~same_cluster))
   return float(errors) / (errors + corrects)
+
+
+class CorrelationClusteringCost(object):
+  """Number of disagreements of a clustering, updated as nodes move.
+
+  The graph is given by its positive edges in CSR format, and all the other
+  pairs of nodes are negative. A disagreement is a positive edge between two
+  clusters or a negative pair inside a cluster. Moving a node takes
+  O(degree) time.
+
+  The cluster_ids and cluster_sizes lists are updated in place and may be
+  shared with the caller.
+  """
+
+  def __init__(self, indptr, indices, cluster_ids):
+    """Computes the disagreements of the initial clustering.
+
+    Args:
+      indptr: np.array, the CSR row pointers of the positive edges.
+      indices: np.array, the CSR column indices of the positive edges. Each
+        edge is listed from both of its endpoints.
+      cluster_ids: np.array of ints in [0, number of nodes), the cluster id of
+        each node.
+    """
+    indptr = np.asarray(indptr)
+    indices = np.asarray(indices)
+    cluster_ids = np.asarray(cluster_ids, dtype=np.int64)
+    num_nodes = len(cluster_ids)
+    self.indptr = indptr.tolist()
+    self.indices = indices.tolist()
+    self.cluster_ids = cluster_ids.tolist()
+    cluster_sizes = np.bincount(cluster_ids, minlength=num_nodes)
+    self.cluster_sizes = cluster_sizes.tolist()
+    self.num_pairs = num_nodes * (num_nodes - 1) // 2
+
+    rows = np.repeat(np.arange(num_nodes), np.diff(indptr))
+    not_loop = rows != indices
+    positives = np.count_nonzero(not_loop) // 2
+    positives_inside = np.count_nonzero(
+        not_loop & (cluster_ids[rows] == cluster_ids[indices])) // 2
+    pairs_inside = int(np.sum(cluster_sizes * (cluster_sizes - 1) // 2))
+    self.disagreements = int((positives - positives_inside) +
+                             (pairs_inside - positives_inside))
+
+  def MoveNode(self, node, cluster_id):
+    """Moves a node to a cluster and updates the disagreements."""
+    curr_cluster = self.cluster_ids[node]
+    if curr_cluster == cluster_id:
+      return
+    to_curr = 0
+    to_new = 0
+    cluster_ids = self.cluster_ids
+    for neighbor in self.indices[self.indptr[node]:self.indptr[node + 1]]:
+      if neighbor != node:
+        c = cluster_ids[neighbor]
+        if c == curr_cluster:
+          to_curr += 1
+        elif c == cluster_id:
+          to_new += 1
+    # The positive edges to the current cluster become disagreements and those
+    # to the new cluster agreements. Conversely for the negative pairs.
+    self.disagreements += (
+        2 * (to_curr - to_new) + self.cluster_sizes[cluster_id] -
+        (self.cluster_sizes[curr_cluster] - 1))
+    self.cluster_sizes[curr_cluster] -= 1
+    self.cluster_sizes[cluster_id] += 1
+    cluster_ids[node] = cluster_id
+
+  def Error(self):
+    """Returns the fraction of pairs of nodes that are disagreements."""
+    if not self.num_pairs:
+      return 0.0
+    return float(self.disagreements) / self.num_pairs
@@ -386,7 +386,7 @@ class ElephantRainbowAgent(dqn_agent.DQNAgent):
     self._reset_return()
 
     if self._replay_forgetting == 'elephant':
-      self._replay.memory.sort_replay_buffer_trajectories()
+      self._replay.sort_replay_buffer_trajectories()
 
     self._record_observation(observation)
 
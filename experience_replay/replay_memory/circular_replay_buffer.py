@@ -23,10 +23,15 @@ off-policy corrections.
 """
 
 import collections
+import contextlib
+import copy
 import gzip
 import math
 import os
 import pickle
+import queue
+import threading
+import time
 
 import gin
 import numpy as np
@@ -49,6 +54,9 @@ STORE_FILENAME_PREFIX = '$store$_'
 # This constant determines how many iterations a checkpoint is kept for.
 CHECKPOINT_DURATION = 4
 
+# Name of the file recording which iteration the incremental store holds.
+STORE_ITERATION_FILENAME = STORE_FILENAME_PREFIX + 'iteration'
+
 
 def invalid_range(cursor, replay_capacity, stack_size, update_horizon):
   """Returns a array with the indices of cursor-related invalid transitions.
@@ -77,6 +85,208 @@ def invalid_range(cursor, replay_capacity, stack_size, update_horizon):
                    for i in range(stack_size + update_horizon)])
 
 
+class NotEnoughTransitionsError(RuntimeError):
+  """Raised when sampling from a memory without enough valid transitions."""
+
+
+class ReaderWriterLock(object):
+  """A lock held either by any number of readers or by a single writer.
+
+  Waiting writers take precedence over new readers, so that add() is not
+  starved by sampling threads.
+  """
+
+  def __init__(self):
+    self._condition = threading.Condition()
+    self._num_readers = 0
+    self._num_waiting_writers = 0
+    self._has_writer = False
+
+  @contextlib.contextmanager
+  def read(self):
+    """Holds the lock for reading in a with statement."""
+    with self._condition:
+      while self._has_writer or self._num_waiting_writers:
+        self._condition.wait()
+      self._num_readers += 1
+    try:
+      yield
+    finally:
+      with self._condition:
+        self._num_readers -= 1
+        if not self._num_readers:
+          self._condition.notify_all()
+
+  @contextlib.contextmanager
+  def write(self):
+    """Holds the lock for writing in a with statement."""
+    with self._condition:
+      self._num_waiting_writers += 1
+      while self._has_writer or self._num_readers:
+        self._condition.wait()
+      self._num_waiting_writers -= 1
+      self._has_writer = True
+    try:
+      yield
+    finally:
+      with self._condition:
+        self._has_writer = False
+        self._condition.notify_all()
+
+
+class PrefetchingSampler(object):
+  """Samples transition batches ahead of time on background threads.
+
+  Worker threads call memory.sample_transition_batch under the read side of a
+  ReaderWriterLock and push the batches into a bounded queue. Anything that
+  modifies the memory must hold the write side of the lock.
+
+  Since batches are sampled ahead of time, the transitions their indices point
+  to may have been overwritten by the time they are consumed. Modifications that
+  move transitions around must call flush, so that no batch sampled before them
+  is returned.
+  """
+
+  def __init__(self, memory, lock, num_threads=2, queue_size=4,
+               batch_size=None, retry_interval=0.1):
+    """Initializes PrefetchingSampler.
+
+    Args:
+      memory: OutOfGraphReplayBuffer, the memory to sample from.
+      lock: ReaderWriterLock, held for writing while memory is modified.
+      num_threads: int, number of sampling threads.
+      queue_size: int, maximum number of prefetched batches.
+      batch_size: int, number of transitions per batch. If None, the default
+        batch_size of the memory will be used.
+      retry_interval: float, seconds to wait before sampling again when the
+        memory does not hold enough transitions yet.
+    """
+    self._memory = memory
+    self._lock = lock
+    self._num_threads = num_threads
+    self._batch_size = batch_size
+    self._retry_interval = retry_interval
+    self._queue = queue.Queue(maxsize=queue_size)
+    self._threads = []
+    self._stop_event = threading.Event()
+    self._error = None
+    # Incremented by flush. Batches sampled under an older generation are
+    # dropped by sample_transition_batch.
+    self._generation = 0
+    self._metrics_lock = threading.Lock()
+    self._num_batches = 0
+    self._total_sample_latency = 0.0
+    self._max_sample_latency = 0.0
+    self._num_waits = 0
+    self._total_wait_latency = 0.0
+
+  def start(self):
+    """Starts the sampling threads."""
+    self._stop_event.clear()
+    for _ in range(self._num_threads):
+      thread = threading.Thread(target=self._run)
+      # Sampling threads must not keep the process alive.
+      thread.daemon = True
+      thread.start()
+      self._threads.append(thread)
+
+  def stop(self):
+    """Stops the sampling threads and drops the prefetched batches."""
+    self._stop_event.set()
+    for thread in self._threads:
+      thread.join()
+    self._threads = []
+    while not self._queue.empty():
+      self._queue.get_nowait()
+
+  def flush(self):
+    """Drops the batches sampled so far.
+
+    Must be called while holding the write side of the lock, so that no batch
+    is being sampled concurrently.
+    """
+    self._generation += 1
+    while not self._queue.empty():
+      try:
+        self._queue.get_nowait()
+      except queue.Empty:
+        break
+
+  def _run(self):
+    """Samples batches into the queue until stopped."""
+    while not self._stop_event.is_set():
+      start_time = time.time()
+      try:
+        with self._lock.read():
+          generation = self._generation
+          batch = self._memory.sample_transition_batch(self._batch_size)
+      except NotEnoughTransitionsError:
+        # The memory does not hold enough valid transitions yet.
+        self._stop_event.wait(self._retry_interval)
+        continue
+      except Exception as e:  # pylint: disable=broad-except
+        self._error = e
+        return
+      latency = time.time() - start_time
+      with self._metrics_lock:
+        self._num_batches += 1
+        self._total_sample_latency += latency
+        self._max_sample_latency = max(self._max_sample_latency, latency)
+
+      while not self._stop_event.is_set():
+        try:
+          self._queue.put((generation, batch), timeout=self._retry_interval)
+          break
+        except queue.Full:
+          pass
+
+  def sample_transition_batch(self):
+    """Returns the next prefetched batch, starting the threads if needed.
+
+    Returns:
+      transition_batch: tuple of np.arrays, see
+        OutOfGraphReplayBuffer.sample_transition_batch.
+
+    Raises:
+      Exception: The error raised by a sampling thread, if any.
+    """
+    if not self._threads:
+      self.start()
+    start_time = time.time()
+    while True:
+      if self._error is not None:
+        raise self._error
+      try:
+        generation, batch = self._queue.get(timeout=self._retry_interval)
+      except queue.Empty:
+        continue
+      if generation == self._generation:
+        break
+    with self._metrics_lock:
+      self._num_waits += 1
+      self._total_wait_latency += time.time() - start_time
+    return batch
+
+  def get_metrics(self):
+    """Returns metrics about the prefetching.
+
+    Returns:
+      dict with the number of batches in the queue ('queue_depth'), the mean
+        and max seconds taken to sample a batch ('mean_sample_latency',
+        'max_sample_latency'), and the mean seconds the consumer waited for a
+        batch ('mean_wait_latency').
+    """
+    with self._metrics_lock:
+      return {
+          'queue_depth': self._queue.qsize(),
+          'mean_sample_latency': (
+              self._total_sample_latency / max(self._num_batches, 1)),
+          'max_sample_latency': self._max_sample_latency,
+          'mean_wait_latency': (
+              self._total_wait_latency / max(self._num_waits, 1)),
+      }
+
+
 class OutOfGraphReplayBuffer(object):
   """A simple out-of-graph Replay Buffer.
 
@@ -111,7 +321,12 @@ class OutOfGraphReplayBuffer(object):
                reward_shape=(),
                reward_dtype=np.float32,
                trajectory_value='return',
-               replay_forgetting='default'):
+               replay_forgetting='default',
+               checkpoint_mode='full',
+               checkpoint_chunk_size=10000,
+               background_checkpoint=False,
+               reuse_batch_arrays=False,
+               trajectory_sort_mode='copy'):
     """Initializes OutOfGraphReplayBuffer.
 
     Args:
@@ -139,15 +354,40 @@ class OutOfGraphReplayBuffer(object):
         forgetting purposes.  One of ['return'].
       replay_forgetting:  str, What strategy to employ for forgetting old
         trajectories.  One of ['default', 'elephant'].
+      checkpoint_mode: str, how the storage arrays are checkpointed. One of
+        ['full', 'incremental']. 'full' writes every array to a gzipped file
+        per iteration. 'incremental' keeps one uncompressed .npy file per array
+        in the (local) checkpoint directory, rewrites only the chunks that
+        changed since the last save, and memory-maps the files on load.
+      checkpoint_chunk_size: int, number of transitions per chunk tracked by
+        incremental checkpoints.
+      background_checkpoint: bool, when True, incremental checkpoints copy the
+        changed chunks and write them on a background thread.
+      reuse_batch_arrays: bool, when True, sample_transition_batch writes into
+        the same preallocated arrays on every call instead of allocating new
+        ones. The caller must be done with a batch before sampling the next.
+      trajectory_sort_mode: str, how sort_replay_buffer_trajectories reorders
+        the storage. One of ['copy', 'indirect']. 'copy' gathers every storage
+        array in sorted order. 'indirect' only sorts a permutation mapping
+        replay indices to storage slots, so no transition is copied.
 
     Raises:
       ValueError: If replay_capacity is too small to hold at least one
         transition.
+      ValueError: If the checkpoint options are invalid.
+      ValueError: If trajectory_sort_mode is invalid.
     """
     assert isinstance(observation_shape, tuple)
     if replay_capacity < update_horizon + stack_size:
       raise ValueError('There is not enough capacity to cover '
                        'update_horizon and stack_size.')
+    if checkpoint_mode not in ['full', 'incremental']:
+      raise ValueError('Invalid checkpoint mode: {}'.format(checkpoint_mode))
+    if background_checkpoint and checkpoint_mode != 'incremental':
+      raise ValueError('Background checkpoints require incremental mode.')
+    if trajectory_sort_mode not in ['copy', 'indirect']:
+      raise ValueError(
+          'Invalid trajectory sort mode: {}'.format(trajectory_sort_mode))
 
     tf.logging.info(
         'Creating a %s replay memory with the following parameters:',
@@ -162,6 +402,8 @@ class OutOfGraphReplayBuffer(object):
     tf.logging.info('\t gamma: %f', gamma)
     tf.logging.info('\t trajectory_value: %s', trajectory_value)
     tf.logging.info('\t replay_forgetting: %s', replay_forgetting)
+    tf.logging.info('\t checkpoint_mode: %s', checkpoint_mode)
+    tf.logging.info('\t trajectory_sort_mode: %s', trajectory_sort_mode)
 
     self._action_shape = action_shape
     self._action_dtype = action_dtype
@@ -177,6 +419,21 @@ class OutOfGraphReplayBuffer(object):
     self._observation_dtype = observation_dtype
     self._terminal_dtype = terminal_dtype
     self._max_sample_attempts = max_sample_attempts
+    self._checkpoint_mode = checkpoint_mode
+    self._checkpoint_chunk_size = checkpoint_chunk_size
+    self._background_checkpoint = background_checkpoint
+    self._checkpoint_thread = None
+    self._checkpoint_error = None
+    self._reuse_batch_arrays = reuse_batch_arrays
+    self._trajectory_sort_mode = trajectory_sort_mode
+    # Preallocated batch arrays, keyed by batch size.
+    self._batch_arrays = {}
+    # Directory holding the incremental store that _dirty_chunks is relative
+    # to.
+    self._store_checkpoint_dir = None
+    # Guards _dirty_chunks, which the background checkpoint thread updates
+    # while transitions are added.
+    self._dirty_chunks_lock = threading.Lock()
     if extra_storage_types:
       self._extra_storage_types = extra_storage_types
     else:
@@ -206,110 +463,117 @@ class OutOfGraphReplayBuffer(object):
       self._store[storage_element.name] = np.zeros(
           array_shape, dtype=storage_element.type)
     self._train_counts = np.empty([self._replay_capacity], dtype=np.int32)
+    # The storage slot of each replay index. It is the identity unless the
+    # trajectories were sorted in 'indirect' mode. The train counts are
+    # indexed by storage slot, as they belong to the stored transitions.
+    self._store_indices = np.arange(self._replay_capacity)
+    self._mark_all_dirty()
+
+  def _mark_all_dirty(self):
+    """Marks every chunk of the storage as changed since the last save."""
+    num_chunks = -(-self._replay_capacity // self._checkpoint_chunk_size)
+    with self._dirty_chunks_lock:
+      self._dirty_chunks = np.ones([num_chunks], dtype=np.bool_)
 
   def _get_trajectory_spans(self):
-    """Compute the span of non-looped trajectories."""
+    """Compute the span of non-looped trajectories.
+
+    Returns:
+      np.array of shape [num_terminals - 1, 2], the (start, end) replay indices
+        of the trajectories between consecutive terminals.
+    """
     assert (not self.is_empty()), 'Method should not be called on empty buffer.'
 
     # Record the terminal indices which mark episode boundaries.
-    terminals = np.nonzero(self._store['terminal'])[0].tolist()
-    num_terminals = len(terminals)
-    spans = [(terminals[i] + 1, terminals[i + 1] + 1)
-             for i in xrange(num_terminals - 1)]
-    return spans
+    terminals = np.flatnonzero(self._store['terminal'][self._store_indices])
+    return np.stack([terminals[:-1] + 1, terminals[1:] + 1], axis=1)
 
   def _compute_trajectory_value(self, spans):
-    """Computes for each trajectory the value."""
-    values = []
+    """Computes for each trajectory the value.
 
-    for (start_idx, end_idx) in spans:
-      if self._trajectory_value == 'return':
-        # We currently assign value as max return over the span.
-        max_return = max(self._store['return'][start_idx:end_idx])
-        values.append(max_return)
+    Args:
+      spans: np.array, the trajectory spans from _get_trajectory_spans.
 
-    # We need to handle the looped-case specially.
-    final_span_end = spans[-1][1]
+    Returns:
+      np.array, the value of each span followed by the value of the looped
+        trajectory which wraps around the end of the buffer.
+    """
+    assert self._trajectory_value == 'return'
+    returns = self._store['return'][self._store_indices]
+
+    # We currently assign value as max return over the span. The spans are
+    # contiguous, so this is one segment reduction over [first start, last end).
     first_span_beg = spans[0][0]
+    final_span_end = spans[-1][1]
+    values = np.maximum.reduceat(returns[first_span_beg:final_span_end],
+                                 spans[:, 0] - first_span_beg)
 
-    # Check whether the spans begin or end at the replay buffer boundaries.
+    # The looped span is everything outside [first start, last end). Each side
+    # is worth 0 when it is empty.
     if final_span_end == self._replay_capacity:
       final_span_max = 0
     else:
-      final_span_max = max(self._store['return'][final_span_end:])
+      final_span_max = returns[final_span_end:].max()
     if first_span_beg == 0:
       first_span_max = 0
     else:
-      first_span_max = max(self._store['return'][:first_span_beg])
-
+      first_span_max = returns[:first_span_beg].max()
     looped_span_value = max(final_span_max, first_span_max)
-    values.append(looped_span_value)
-    return values
+    return np.append(values, looped_span_value)
 
   def sort_replay_buffer_trajectories(self):
-    """Sort the trajectories within the replay buffer."""
+    """Sort the trajectories within the replay buffer.
+
+    The trajectories are reordered by increasing value, and writing resumes at
+    the front of the buffer, overwriting the least valuable trajectories. In
+    'indirect' trajectory sort mode, only self._store_indices is reordered.
+    """
     # We only need to sort the replay buffer once it's full.
     if not self.is_full():
       return
 
     spans = self._get_trajectory_spans()  # [...,(start_idx, end_id), ...]
+    # Without two terminals there is at most one trajectory.
+    if not len(spans):
+      return
     trajectory_values = self._compute_trajectory_value(spans)
 
     # Sort trajectories in increasing order.
     sorted_trajectory_indices = np.argsort(trajectory_values)
 
-    # Create an empty tmp_store for sorting.
-    tmp_store = {}
-    for storage_element in self.get_storage_signature():
-      array_shape = [self._replay_capacity] + list(storage_element.shape)
-      tmp_store[storage_element.name] = np.zeros(
-          array_shape, dtype=storage_element.type)
-
-    # Add the sorted trajectories from self._store.
-    tmp_cursor = 0
+    # The replay index each new replay index takes its transition from. The
+    # looped span is made of the end and the beginning of the buffer.
+    final_span_end = spans[-1][1]
+    first_span_beg = spans[0][0]
+    segments = []
     for index in sorted_trajectory_indices:
-      # Handle the looped span.
       if index == len(spans):
-        final_span_end = spans[-1][1]
-        first_span_beg = spans[0][0]
-        traj_len = self._replay_capacity - final_span_end + first_span_beg
+        segments.append(np.arange(final_span_end, self._replay_capacity))
+        segments.append(np.arange(first_span_beg))
       else:
-        (traj_start, traj_end) = spans[index]
-        traj_len = traj_end - traj_start
-
-      # Add all elements to the self._tmp_store.
-      element_signatures = self.get_storage_signature()
-      for element in element_signatures:
-        element_name = element.name
-
-        # Handle the looped span.
-        if index == len(spans):
-          element_trajectory_end = self._store[element_name][final_span_end:]
-          element_trajectory_beg = self._store[element_name][:first_span_beg]
-          element_trajectory = np.concatenate(
-              [element_trajectory_end, element_trajectory_beg], 0)
-        else:
-          element_trajectory = self._store[element_name][traj_start:traj_end]
-
-        tmp_store[element_name][tmp_cursor:tmp_cursor +
-                                traj_len] = element_trajectory
-
-      # Move the cursor after each trajectory.
-      tmp_cursor += traj_len
-
-    # After all these writes, the tmp_cursor should match the replay buffer
-    # length.
-    assert tmp_cursor == self._replay_capacity, 'Mismatched'
-
-    # Move the tmp_store to the self._store.
-    self._store = tmp_store
+        segments.append(np.arange(spans[index][0], spans[index][1]))
+    order = np.concatenate(segments)
+    assert len(order) == self._replay_capacity, 'Mismatched'
+    self._reorder_transitions(order)
 
     # Return to writing to front.
     assert self.is_full()
     self._sorted_cursor = 0
 
-    del tmp_store, tmp_cursor
-    # TODO(liamfedus): reindex the sum_tree in priortized replay
+  def _reorder_transitions(self, order):
+    """Moves the transition at replay index order[i] to replay index i.
+
+    Args:
+      order: np.array, a permutation of the replay indices.
+    """
+    slots = self._store_indices[order]
+    if self._trajectory_sort_mode == 'indirect':
+      self._store_indices = slots
+    else:
+      for array_name in self._store:
+        self._store[array_name] = self._store[array_name][slots]
+      self._train_counts = self._train_counts[slots]
+      self._mark_all_dirty()
 
   def get_add_args_signature(self):
     """The signature of the add function.
@@ -374,7 +638,8 @@ class OutOfGraphReplayBuffer(object):
     step_added = self.add_count
     self._check_add_types(observation, action, reward, terminal, step_added,
                           *args)
-    if self.is_empty() or self._store['terminal'][self.cursor() - 1] == 1:
+    if (self.is_empty() or
+        self._store['terminal'][self._store_indices[self.cursor() - 1]] == 1):
       for _ in range(self._stack_size - 1):
         # Child classes can rely on the padding transitions being filled with
         # zeros. This is useful when there is a priority argument.
@@ -400,11 +665,13 @@ class OutOfGraphReplayBuffer(object):
       transition: The dictionary of names and values of the transition to add to
         the storage.
     """
-    cursor = self.cursor()
+    slot = self._store_indices[self.cursor()]
 
     for arg_name in transition:
-      self._store[arg_name][cursor] = transition[arg_name]
-    self._train_counts[cursor] = 0
+      self._store[arg_name][slot] = transition[arg_name]
+    self._train_counts[slot] = 0
+    with self._dirty_chunks_lock:
+      self._dirty_chunks[slot // self._checkpoint_chunk_size] = True
 
     self.add_count += 1
 
@@ -471,7 +738,8 @@ class OutOfGraphReplayBuffer(object):
     """Returns the range of array at the index handling wraparound if necessary.
 
     Args:
-      array: np.array, the array to get the stack from.
+      array: np.array, the storage array to get the stack from. It is indexed
+        by storage slot, see self._store_indices.
       start_index: int, index to the start of the range to be returned. Range
         will wraparound if start_index is smaller than 0.
       end_index: int, exclusive end index. Range will wraparound if end_index
@@ -489,13 +757,13 @@ class OutOfGraphReplayBuffer(object):
 
     # Fast slice read when there is no wraparound.
     if start_index % self._replay_capacity < end_index % self._replay_capacity:
-      return_array = array[start_index:end_index, Ellipsis]
+      slots = self._store_indices[start_index:end_index]
     # Slow list read.
     else:
       indices = [(start_index + i) % self._replay_capacity
                  for i in range(end_index - start_index)]
-      return_array = array[indices, Ellipsis]
-    return return_array
+      slots = self._store_indices[indices]
+    return array[slots, Ellipsis]
 
   def get_observation_stack(self, index):
     return self._get_element_stack(index, 'observation')
@@ -506,6 +774,23 @@ class OutOfGraphReplayBuffer(object):
     # The stacking axis is 0 but the agent expects as the last axis.
     return np.moveaxis(state, 0, -1)
 
+  def get_observation_stacks(self, indices):
+    """Returns the observation stacks at the indices, handling wraparound.
+
+    Vectorized version of get_observation_stack.
+
+    Args:
+      indices: np.array of ints, the indices of the last frame of each stack.
+
+    Returns:
+      np.array, with shape [len(indices)] + state_shape.
+    """
+    frame_indices = (np.asarray(indices)[:, np.newaxis] +
+                     np.arange(1 - self._stack_size, 1)) % self._replay_capacity
+    # The stacking axis is 1 but the agent expects as the last axis.
+    return np.moveaxis(
+        self._store['observation'][self._store_indices[frame_indices]], 1, -1)
+
   def get_terminal_stack(self, index):
     return self.get_range(self._store['terminal'], index - self._stack_size + 1,
                           index + 1)
@@ -545,6 +830,37 @@ class OutOfGraphReplayBuffer(object):
 
     return True
 
+  def are_valid_transitions(self, indices):
+    """Checks which of the indices contain a valid transition.
+
+    Vectorized version of is_valid_transition.
+
+    Args:
+      indices: np.array of ints, the indices to the states in the transitions.
+
+    Returns:
+      np.array of bools, whether each index is valid.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    valid = (indices >= 0) & (indices < self._replay_capacity)
+    if not self.is_full():
+      # The indices and next_indices must be smaller than the cursor.
+      valid &= indices < self.cursor() - self._update_horizon
+      # The first few indices contain the padding states of the first episode.
+      valid &= indices >= self._stack_size - 1
+
+    # Skip transitions that straddle the cursor.
+    valid &= ~np.isin(indices, self.invalid_range)
+
+    # If there are terminal flags in any other frame other than the last one
+    # the stack is not valid, so don't sample it.
+    if self._stack_size > 1:
+      frame_indices = (indices[:, np.newaxis] +
+                       np.arange(1 - self._stack_size, 0)) % self._replay_capacity
+      frame_slots = self._store_indices[frame_indices]
+      valid &= ~self._store['terminal'][frame_slots].any(axis=1)
+    return valid
+
   def _create_batch_arrays(self, batch_size):
     """Create a tuple of arrays with the type of get_transition_elements.
 
@@ -575,6 +891,8 @@ class OutOfGraphReplayBuffer(object):
       list of ints, a batch of valid indices sampled uniformly.
 
     Raises:
+      NotEnoughTransitionsError: If the memory holds fewer than stack size +
+        update_horizon transitions.
       RuntimeError: If the batch was not constructed after maximum number of
         tries.
     """
@@ -587,26 +905,28 @@ class OutOfGraphReplayBuffer(object):
       min_id = self._stack_size - 1
       max_id = self.cursor() - self._update_horizon
       if max_id <= min_id:
-        raise RuntimeError('Cannot sample a batch with fewer than stack size '
-                           '({}) + update_horizon ({}) transitions.'.format(
-                               self._stack_size, self._update_horizon))
+        raise NotEnoughTransitionsError(
+            'Cannot sample a batch with fewer than stack size ({}) + '
+            'update_horizon ({}) transitions.'.format(self._stack_size,
+                                                      self._update_horizon))
 
-    indices = []
+    indices = np.empty([0], dtype=np.int64)
     attempt_count = 0
     while (len(indices) < batch_size and
            attempt_count < self._max_sample_attempts):
-      index = np.random.randint(min_id, max_id) % self._replay_capacity
-      if self.is_valid_transition(index):
-        indices.append(index)
-      else:
-        attempt_count += 1
+      # Draw as many candidates as indices are missing and keep the valid ones.
+      candidates = np.random.randint(
+          min_id, max_id, size=batch_size - len(indices)) % self._replay_capacity
+      valid = self.are_valid_transitions(candidates)
+      indices = np.concatenate([indices, candidates[valid]])
+      attempt_count += len(candidates) - np.count_nonzero(valid)
     if len(indices) != batch_size:
       raise RuntimeError(
           'Max sample attempts: Tried {} times but only sampled {}'
           ' valid indices. Batch size is {}'.format(self._max_sample_attempts,
                                                     len(indices), batch_size))
 
-    return indices
+    return indices.tolist()
 
   def sample_transition_batch(self, batch_size=None, indices=None):
     """Returns a batch of transitions (including any extra contents).
@@ -624,6 +944,10 @@ class OutOfGraphReplayBuffer(object):
     be used by subclasses of this replay buffer but may point to different data
     as soon as sampling is done.
 
+    All the elements of the batch are gathered at once with fancy indexing.
+    When reuse_batch_arrays is set, the returned arrays are overwritten by the
+    next call with the same batch_size.
+
     Args:
       batch_size: int, number of transitions returned. If None, the default
         batch_size will be used.
@@ -644,60 +968,64 @@ class OutOfGraphReplayBuffer(object):
     assert len(indices) == batch_size
 
     transition_elements = self.get_transition_elements(batch_size)
-    batch_arrays = self._create_batch_arrays(batch_size)
-    for batch_element, state_index in enumerate(indices):
-      trajectory_indices = [(state_index + j) % self._replay_capacity
-                            for j in range(self._update_horizon)]
-      trajectory_terminals = self._store['terminal'][trajectory_indices]
-      is_terminal_transition = trajectory_terminals.any()
-      if not is_terminal_transition:
-        trajectory_length = self._update_horizon
-      else:
-        # np.argmax of a bool array returns the index of the first True.
-        trajectory_length = np.argmax(trajectory_terminals.astype(np.bool),
-                                      0) + 1
-      next_state_index = state_index + trajectory_length
-      trajectory_discount_vector = (
-          self._cumulative_discount_vector[:trajectory_length])
-      trajectory_rewards = self.get_range(self._store['reward'], state_index,
-                                          next_state_index)
-
-      # Fill the contents of each array in the sampled batch.
-      assert len(transition_elements) == len(batch_arrays)
-      for element_array, element in zip(batch_arrays, transition_elements):
-        if element.name == 'state':
-          element_array[batch_element] = self.get_observation_stack(state_index)
-        elif element.name == 'reward':
-          # compute the discounted sum of rewards in the trajectory.
-          element_array[batch_element] = np.sum(
-              trajectory_discount_vector * trajectory_rewards, axis=0)
-        elif element.name == 'next_state':
-          element_array[batch_element] = self.get_observation_stack(
-              (next_state_index) % self._replay_capacity)
-        elif element.name in ('next_action', 'next_reward'):
-          element_array[batch_element] = (
-              self._store[element.name.lstrip('next_')][(next_state_index) %
-                                                        self._replay_capacity])
-        elif element.name == 'terminal':
-          element_array[batch_element] = is_terminal_transition
-        elif element.name == 'indices':
-          element_array[batch_element] = state_index
-        elif element.name == 'train_counts':
-          element_array[batch_element] = self._train_counts[state_index]
-        elif element.name == 'steps_until_first_train':
-          step_added = self._store['step_added'][state_index]
-          steps_since_add = self.add_count - step_added
-          already_trained = self._train_counts[state_index] > 0
-          steps_until_first_train = -1 if already_trained else steps_since_add
-          element_array[batch_element] = steps_until_first_train
-        elif element.name == 'age':
-          step_added = self._store['step_added'][state_index]
-          steps_since_add = self.add_count - step_added
-          element_array[batch_element] = steps_since_add
-        elif element.name in self._store.keys():
-          element_array[batch_element] = (
-              self._store[element.name][state_index])
-        # We assume the other elements are filled in by the subclass.
+    if self._reuse_batch_arrays:
+      if batch_size not in self._batch_arrays:
+        self._batch_arrays[batch_size] = self._create_batch_arrays(batch_size)
+      batch_arrays = self._batch_arrays[batch_size]
+    else:
+      batch_arrays = self._create_batch_arrays(batch_size)
+
+    state_indices = np.asarray(indices, dtype=np.int64)
+    trajectory_indices = (state_indices[:, np.newaxis] +
+                          np.arange(self._update_horizon)) % self._replay_capacity
+    state_slots = self._store_indices[state_indices]
+    trajectory_slots = self._store_indices[trajectory_indices]
+    trajectory_terminals = self._store['terminal'][trajectory_slots].astype(
+        np.bool_)
+    is_terminal_transition = trajectory_terminals.any(axis=1)
+    # np.argmax of a bool array returns the index of the first True.
+    trajectory_lengths = np.where(is_terminal_transition,
+                                  np.argmax(trajectory_terminals, axis=1) + 1,
+                                  self._update_horizon)
+    next_state_indices = (
+        (state_indices + trajectory_lengths) % self._replay_capacity)
+    # Discounts past the end of each trajectory are zero.
+    trajectory_discounts = self._cumulative_discount_vector * (
+        np.arange(self._update_horizon) < trajectory_lengths[:, np.newaxis])
+    step_added = self._store['step_added'][state_slots]
+    steps_since_add = self.add_count - step_added
+    train_counts = self._train_counts[state_slots]
+
+    # Fill the contents of each array in the sampled batch.
+    assert len(transition_elements) == len(batch_arrays)
+    for element_array, element in zip(batch_arrays, transition_elements):
+      if element.name == 'state':
+        element_array[:] = self.get_observation_stacks(state_indices)
+      elif element.name == 'reward':
+        # compute the discounted sum of rewards in the trajectory.
+        trajectory_rewards = self._store['reward'][trajectory_slots]
+        discounts = trajectory_discounts.reshape(
+            trajectory_discounts.shape + (1,) * (trajectory_rewards.ndim - 2))
+        element_array[:] = np.sum(discounts * trajectory_rewards, axis=1)
+      elif element.name == 'next_state':
+        element_array[:] = self.get_observation_stacks(next_state_indices)
+      elif element.name in ('next_action', 'next_reward'):
+        element_array[:] = (
+            self._store[element.name.lstrip('next_')][
+                self._store_indices[next_state_indices]])
+      elif element.name == 'terminal':
+        element_array[:] = is_terminal_transition
+      elif element.name == 'indices':
+        element_array[:] = state_indices
+      elif element.name == 'train_counts':
+        element_array[:] = train_counts
+      elif element.name == 'steps_until_first_train':
+        element_array[:] = np.where(train_counts > 0, -1, steps_since_add)
+      elif element.name == 'age':
+        element_array[:] = steps_since_add
+      elif element.name in self._store.keys():
+        element_array[:] = self._store[element.name][state_slots]
+      # We assume the other elements are filled in by the subclass.
 
     return batch_arrays
 
@@ -741,7 +1069,7 @@ class OutOfGraphReplayBuffer(object):
   def update_train_counts(self, indices):
     """Increments the train count for all transitions that were sampled."""
     for memory_index in indices:
-      self._train_counts[memory_index] += 1
+      self._train_counts[self._store_indices[memory_index]] += 1
 
   def _generate_filename(self, checkpoint_dir, name, suffix):
     return os.path.join(checkpoint_dir, '{}_ckpt.{}.gz'.format(name, suffix))
@@ -760,14 +1088,33 @@ class OutOfGraphReplayBuffer(object):
           checkpointable_elements[STORE_FILENAME_PREFIX + array_name] = array
       elif not member_name.startswith('_'):
         checkpointable_elements[member_name] = member
-      elif member_name in ['_train_counts']:  # Exceptions to the above rule.
+      # Exceptions to the above rule.
+      elif member_name in ['_train_counts', '_store_indices']:
         checkpointable_elements[member_name] = member
     return checkpointable_elements
 
+  def _generate_store_filename(self, checkpoint_dir, array_name):
+    return os.path.join(checkpoint_dir,
+                        '{}{}_ckpt.npy'.format(STORE_FILENAME_PREFIX,
+                                               array_name))
+
+  def _remove_stale_file(self, checkpoint_dir, attr, iteration_number):
+    """Garbage collects the checkpoint file that is four versions old."""
+    stale_iteration_number = iteration_number - CHECKPOINT_DURATION
+    if stale_iteration_number >= 0:
+      stale_filename = self._generate_filename(checkpoint_dir, attr,
+                                               stale_iteration_number)
+      try:
+        tf.gfile.Remove(stale_filename)
+      except tf.errors.NotFoundError:
+        pass
+
   def save(self, checkpoint_dir, iteration_number):
     """Save the OutOfGraphReplayBuffer attributes into a file.
 
-    This method will save all the replay buffer's state in a single file.
+    In 'full' checkpoint mode, this method will save all the replay buffer's
+    state in a single file per attribute. In 'incremental' mode, see
+    _save_incremental.
 
     Args:
       checkpoint_dir: str, the directory where numpy checkpoint files should be
@@ -777,6 +1124,10 @@ class OutOfGraphReplayBuffer(object):
     """
     if not tf.gfile.Exists(checkpoint_dir):
       return
+    self.wait_for_checkpoint()
+    if self._checkpoint_mode == 'incremental':
+      self._save_incremental(checkpoint_dir, iteration_number)
+      return
 
     checkpointable_elements = self._return_checkpointable_elements()
 
@@ -797,16 +1148,142 @@ class OutOfGraphReplayBuffer(object):
           else:
             pickle.dump(self.__dict__[attr], outfile)
 
-      # After writing a checkpoint file, we garbage collect the checkpoint file
-      # that is four versions old.
-      stale_iteration_number = iteration_number - CHECKPOINT_DURATION
-      if stale_iteration_number >= 0:
-        stale_filename = self._generate_filename(checkpoint_dir, attr,
-                                                 stale_iteration_number)
-        try:
-          tf.gfile.Remove(stale_filename)
-        except tf.errors.NotFoundError:
-          pass
+      self._remove_stale_file(checkpoint_dir, attr, iteration_number)
+
+  def _save_incremental(self, checkpoint_dir, iteration_number):
+    """Saves the changed storage chunks and the other attributes.
+
+    The storage arrays live in one .npy file each, which is updated in place
+    with the chunks added to since the last save into checkpoint_dir. Only the
+    latest iteration of the storage is kept. The attributes not in self._store
+    are small and are saved in full as in 'full' mode.
+
+    When background_checkpoint is set, the state to write is copied and the
+    files are written on a background thread. wait_for_checkpoint blocks until
+    the write is done.
+
+    Args:
+      checkpoint_dir: str, the local directory where checkpoint files should be
+        saved.
+      iteration_number: int, iteration_number to use as a suffix in naming
+        checkpoint files.
+    """
+    if checkpoint_dir != self._store_checkpoint_dir:
+      self._mark_all_dirty()
+    # Swap the dirty chunks out, so that chunks marked while the checkpoint is
+    # written are saved by the next one.
+    with self._dirty_chunks_lock:
+      dirty_chunks = np.flatnonzero(self._dirty_chunks)
+      self._dirty_chunks = np.zeros_like(self._dirty_chunks)
+    self._store_checkpoint_dir = checkpoint_dir
+
+    # Contiguous runs of dirty chunks, as [start, end) transition ranges.
+    runs = np.split(dirty_chunks, np.flatnonzero(np.diff(dirty_chunks) != 1) + 1)
+    ranges = [(run[0] * self._checkpoint_chunk_size,
+               min((run[-1] + 1) * self._checkpoint_chunk_size,
+                   self._replay_capacity))
+              for run in runs if run.size]
+
+    copy_state = self._background_checkpoint
+    store_ranges = {}
+    for array_name, array in self._store.items():
+      store_ranges[array_name] = [
+          (start, array[start:end].copy() if copy_state else array[start:end])
+          for start, end in ranges]
+    elements = {}
+    for attr in self._return_checkpointable_elements():
+      if not attr.startswith(STORE_FILENAME_PREFIX):
+        value = self.__dict__[attr]
+        elements[attr] = copy.deepcopy(value) if copy_state else value
+
+    args = (checkpoint_dir, iteration_number, store_ranges, elements,
+            dirty_chunks)
+    if self._background_checkpoint:
+      self._checkpoint_thread = threading.Thread(
+          target=self._write_incremental_checkpoint, args=args)
+      self._checkpoint_thread.start()
+    else:
+      self._write_incremental_checkpoint(*args)
+      self._raise_checkpoint_error()
+
+  def _write_incremental_checkpoint(self, checkpoint_dir, iteration_number,
+                                    store_ranges, elements, dirty_chunks):
+    """Writes the state captured by _save_incremental to checkpoint_dir.
+
+    Args:
+      checkpoint_dir: str, the local directory to write to.
+      iteration_number: int, iteration_number to use as a suffix in naming
+        checkpoint files.
+      store_ranges: dict mapping the names of the storage arrays to lists of
+        (start index, chunk contents) to write.
+      elements: dict mapping the names of the other attributes to their values.
+      dirty_chunks: np.array, indices of the chunks being written. They are
+        marked as changed again if writing fails.
+    """
+    try:
+      iteration_filename = os.path.join(checkpoint_dir,
+                                        STORE_ITERATION_FILENAME)
+      # The store is inconsistent until all the chunks are written.
+      if tf.gfile.Exists(iteration_filename):
+        tf.gfile.Remove(iteration_filename)
+
+      for storage_element in self.get_storage_signature():
+        filename = self._generate_store_filename(checkpoint_dir,
+                                                 storage_element.name)
+        shape = (self._replay_capacity,) + tuple(storage_element.shape)
+        store_file = None
+        if os.path.exists(filename):
+          store_file = np.lib.format.open_memmap(filename, mode='r+')
+          if (store_file.shape != shape or
+              store_file.dtype != np.dtype(storage_element.type)):
+            store_file = None
+        if store_file is None:
+          # A new file only holds the current contents if they are all written.
+          if dirty_chunks.size != len(self._dirty_chunks):
+            with self._dirty_chunks_lock:
+              self._dirty_chunks[:] = True
+            raise ValueError(
+                'Missing incremental store file: {}'.format(filename))
+          store_file = np.lib.format.open_memmap(
+              filename, mode='w+', dtype=storage_element.type, shape=shape)
+        for start, contents in store_ranges[storage_element.name]:
+          store_file[start:start + len(contents)] = contents
+        store_file.flush()
+        del store_file
+
+      with tf.gfile.Open(iteration_filename, 'w') as f:
+        f.write(str(iteration_number))
+
+      for attr, value in elements.items():
+        filename = self._generate_filename(checkpoint_dir, attr,
+                                           iteration_number)
+        with tf.gfile.Open(filename, 'wb') as f:
+          with gzip.GzipFile(fileobj=f) as outfile:
+            if isinstance(value, np.ndarray):
+              np.save(outfile, value, allow_pickle=False)
+            else:
+              pickle.dump(value, outfile)
+        self._remove_stale_file(checkpoint_dir, attr, iteration_number)
+    except Exception as e:  # pylint: disable=broad-except
+      with self._dirty_chunks_lock:
+        self._dirty_chunks[dirty_chunks] = True
+      self._checkpoint_error = e
+
+  def _raise_checkpoint_error(self):
+    if self._checkpoint_error is not None:
+      error, self._checkpoint_error = self._checkpoint_error, None
+      raise error
+
+  def wait_for_checkpoint(self):
+    """Blocks until the checkpoint being written in the background is done.
+
+    Raises:
+      Exception: The error raised while writing the checkpoint, if any.
+    """
+    if self._checkpoint_thread is not None:
+      self._checkpoint_thread.join()
+      self._checkpoint_thread = None
+    self._raise_checkpoint_error()
 
   def load(self, checkpoint_dir, suffix):
     """Restores the object from bundle_dictionary and numpy checkpoints.
@@ -816,10 +1293,25 @@ class OutOfGraphReplayBuffer(object):
         files from.
       suffix: str, the suffix to use in numpy checkpoint files.
 
+    In 'incremental' checkpoint mode, the storage arrays are memory-mapped
+    copy-on-write from the checkpoint files, so they are only read as they are
+    accessed.
+
     Raises:
       NotFoundError: If not all expected files are found in directory.
     """
+    self.wait_for_checkpoint()
     save_elements = self._return_checkpointable_elements()
+    if self._checkpoint_mode == 'incremental':
+      save_elements = [attr for attr in save_elements
+                       if not attr.startswith(STORE_FILENAME_PREFIX)]
+    # Checkpoints written before trajectories could be sorted indirectly have
+    # no storage slots, which are then the identity.
+    identity_store_indices = not tf.gfile.Exists(
+        self._generate_filename(checkpoint_dir, '_store_indices', suffix))
+    if identity_store_indices:
+      save_elements = [attr for attr in save_elements
+                       if attr != '_store_indices']
     # We will first make sure we have all the necessary files available to avoid
     # loading a partially-specified (i.e. corrupted) replay buffer.
     for attr in save_elements:
@@ -827,8 +1319,29 @@ class OutOfGraphReplayBuffer(object):
       if not tf.gfile.Exists(filename):
         raise tf.errors.NotFoundError(None, None,
                                       'Missing file: {}'.format(filename))
+    if self._checkpoint_mode == 'incremental':
+      iteration_filename = os.path.join(checkpoint_dir,
+                                        STORE_ITERATION_FILENAME)
+      if not tf.gfile.Exists(iteration_filename):
+        raise tf.errors.NotFoundError(
+            None, None, 'Missing file: {}'.format(iteration_filename))
+      with tf.gfile.Open(iteration_filename, 'r') as f:
+        store_iteration = f.read().strip()
+      if store_iteration != str(suffix):
+        raise tf.errors.NotFoundError(
+            None, None, 'Incremental store holds iteration {}, not {}'.format(
+                store_iteration, suffix))
+      for storage_element in self.get_storage_signature():
+        filename = self._generate_store_filename(checkpoint_dir,
+                                                 storage_element.name)
+        self._store[storage_element.name] = np.load(filename, mmap_mode='c')
+      with self._dirty_chunks_lock:
+        self._dirty_chunks[:] = False
+      self._store_checkpoint_dir = checkpoint_dir
     # If we've reached this point then we have verified that all expected files
     # are available.
+    if identity_store_indices:
+      self._store_indices = np.arange(self._replay_capacity)
     for attr in save_elements:
       filename = self._generate_filename(checkpoint_dir, attr, suffix)
       with tf.gfile.Open(filename, 'rb') as f:
@@ -873,7 +1386,14 @@ class WrappedReplayBuffer(object):
                action_dtype=np.int32,
                reward_shape=(),
                reward_dtype=np.float32,
-               replay_forgetting='default'):
+               replay_forgetting='default',
+               checkpoint_mode='full',
+               checkpoint_chunk_size=10000,
+               background_checkpoint=False,
+               reuse_batch_arrays=False,
+               prefetch_threads=0,
+               prefetch_queue_size=4,
+               trajectory_sort_mode='copy'):
     """Initializes WrappedReplayBuffer.
 
     Args:
@@ -903,10 +1423,22 @@ class WrappedReplayBuffer(object):
       reward_dtype: np.dtype, type of elements in the reward.
       replay_forgetting:  str, What strategy to employ for forgetting old
         trajectories.  One of ['default', 'elephant'].
+      checkpoint_mode: str, how the replay memory is checkpointed. One of
+        ['full', 'incremental'], see OutOfGraphReplayBuffer.
+      checkpoint_chunk_size: int, see OutOfGraphReplayBuffer.
+      background_checkpoint: bool, see OutOfGraphReplayBuffer.
+      reuse_batch_arrays: bool, see OutOfGraphReplayBuffer. Requires
+        use_staging to be False, since the staging area keeps a pointer to the
+        sampled arrays.
+      prefetch_threads: int, when positive, this many threads sample batches
+        ahead of time into a queue (see PrefetchingSampler).
+      prefetch_queue_size: int, maximum number of prefetched batches.
+      trajectory_sort_mode: str, see OutOfGraphReplayBuffer.
 
     Raises:
       ValueError: If update_horizon is not positive.
       ValueError: If discount factor is not in [0, 1].
+      ValueError: If reuse_batch_arrays is used with staging or prefetching.
     """
     if replay_capacity < update_horizon + 1:
       raise ValueError('Update horizon ({}) should be significantly smaller '
@@ -916,6 +1448,9 @@ class WrappedReplayBuffer(object):
       raise ValueError('Update horizon must be positive.')
     if not 0.0 <= gamma <= 1.0:
       raise ValueError('Discount factor (gamma) must be in [0, 1].')
+    if reuse_batch_arrays and (use_staging or prefetch_threads):
+      raise ValueError(
+          'Batch arrays cannot be reused with staging or prefetching.')
 
     self.batch_size = batch_size
 
@@ -938,10 +1473,24 @@ class WrappedReplayBuffer(object):
           action_dtype=action_dtype,
           reward_shape=reward_shape,
           reward_dtype=reward_dtype,
-          replay_forgetting=replay_forgetting)
-
+          replay_forgetting=replay_forgetting,
+          checkpoint_mode=checkpoint_mode,
+          checkpoint_chunk_size=checkpoint_chunk_size,
+          background_checkpoint=background_checkpoint,
+          reuse_batch_arrays=reuse_batch_arrays,
+          trajectory_sort_mode=trajectory_sort_mode)
+
+    # Held for writing whenever the memory is modified, so that prefetching
+    # threads never sample from a partially updated memory.
+    self._lock = ReaderWriterLock()
+    self._sampler = None
+    if prefetch_threads:
+      self._sampler = PrefetchingSampler(
+          self.memory, self._lock, num_threads=prefetch_threads,
+          queue_size=prefetch_queue_size)
     self.create_sampling_ops(use_staging)
     tf.logging.info('\t replay_forgetting: %s', replay_forgetting)
+    tf.logging.info('\t prefetch_threads: %d', prefetch_threads)
 
   def add(self, observation, action, reward, terminal, *args):
     """Adds a transition to the replay memory.
@@ -960,7 +1509,23 @@ class WrappedReplayBuffer(object):
       *args: extra contents with shapes and dtypes according to
         extra_storage_types.
     """
-    self.memory.add(observation, action, reward, terminal, *args)
+    with self._lock.write():
+      self.memory.add(observation, action, reward, terminal, *args)
+
+  def sort_replay_buffer_trajectories(self):
+    """Sorts the trajectories within the underlying replay buffer."""
+    with self._lock.write():
+      self.memory.sort_replay_buffer_trajectories()
+      if self._sampler is not None and self.memory.is_full():
+        # Only a full memory is sorted. Drop the batches whose indices point
+        # to the unsorted transitions.
+        self._sampler.flush()
+
+  def get_prefetch_metrics(self):
+    """Returns the PrefetchingSampler metrics, or None if not prefetching."""
+    if self._sampler is None:
+      return None
+    return self._sampler.get_metrics()
 
   def create_sampling_ops(self, use_staging):
     """Creates the ops necessary to sample from the replay buffer.
@@ -974,8 +1539,13 @@ class WrappedReplayBuffer(object):
     with tf.name_scope('sample_replay'):
       with tf.device('/cpu:*'):
         transition_type = self.memory.get_transition_elements()
+        if self._sampler is not None:
+          sample_fn = self._sampler.sample_transition_batch
+          self._create_prefetch_summaries()
+        else:
+          sample_fn = self.memory.sample_transition_batch
         transition_tensors = tf.py_func(
-            self.memory.sample_transition_batch, [],
+            sample_fn, [],
             [return_entry.type for return_entry in transition_type],
             name='replay_sample_py_func')
         self._set_transition_shape(transition_tensors, transition_type)
@@ -986,6 +1556,21 @@ class WrappedReplayBuffer(object):
         # Unpack sample transition into member variables.
         self.unpack_transition(transition_tensors, transition_type)
 
+  def _create_prefetch_summaries(self):
+    """Creates summaries of the prefetching queue depth and latencies."""
+    metric_names = ['queue_depth', 'mean_sample_latency', 'max_sample_latency',
+                    'mean_wait_latency']
+
+    def get_metrics():
+      metrics = self._sampler.get_metrics()
+      return np.array([metrics[name] for name in metric_names],
+                      dtype=np.float32)
+
+    metrics = tf.py_func(get_metrics, [], tf.float32,
+                         name='replay_prefetch_metrics_py_func')
+    for i, name in enumerate(metric_names):
+      tf.summary.scalar('Prefetch/{}'.format(name), metrics[i])
+
   def _set_transition_shape(self, transition, transition_type):
     """Set shape for each element in the transition.
 
@@ -1062,7 +1647,8 @@ class WrappedReplayBuffer(object):
       iteration_number: int, the iteration_number to use as a suffix in naming
         numpy checkpoint files.
     """
-    self.memory.save(checkpoint_dir, iteration_number)
+    with self._lock.read():
+      self.memory.save(checkpoint_dir, iteration_number)
 
   def load(self, checkpoint_dir, suffix):
     """Loads the replay buffer's state from a saved file.
@@ -1072,7 +1658,15 @@ class WrappedReplayBuffer(object):
         files from.
       suffix: str, the suffix to use in numpy checkpoint files.
     """
-    self.memory.load(checkpoint_dir, suffix)
+    if self._sampler is not None:
+      # Drop the batches sampled from the memory being replaced.
+      self._sampler.stop()
+    with self._lock.write():
+      self.memory.load(checkpoint_dir, suffix)
+
+  def wait_for_checkpoint(self):
+    """Blocks until the replay buffer's background checkpoint is written."""
+    self.memory.wait_for_checkpoint()
 
   def tf_update_train_counts(self, indices):
     """Updates the train counts for the given indices.
@@ -1083,6 +1677,10 @@ class WrappedReplayBuffer(object):
     Returns:
        A tf op updating the train count.
     """
+    def update_train_counts(indices):
+      with self._lock.write():
+        self.memory.update_train_counts(indices)
+
     return tf.py_func(
-        self.memory.update_train_counts, [indices], [],
+        update_train_counts, [indices], [],
         name='replay_update_train_counts_py_func')
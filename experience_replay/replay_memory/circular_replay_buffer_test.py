@@ -0,0 +1,136 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for circular_replay_buffer."""
+
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+import tensorflow.compat.v1 as tf
+from experience_replay.replay_memory import circular_replay_buffer
+
+ReplayElement = circular_replay_buffer.ReplayElement
+
+REPLAY_CAPACITY = 60
+BATCH_SIZE = 8
+
+
+class PrefetchingSamplerTest(parameterized.TestCase):
+
+  def _create_replay(self, trajectory_sort_mode='copy'):
+    # The sampling ops are not needed to sample from the PrefetchingSampler.
+    with mock.patch.object(circular_replay_buffer.WrappedReplayBuffer,
+                           'create_sampling_ops'):
+      return circular_replay_buffer.WrappedReplayBuffer(
+          observation_shape=(1,),
+          stack_size=1,
+          use_staging=False,
+          replay_capacity=REPLAY_CAPACITY,
+          batch_size=BATCH_SIZE,
+          extra_storage_types=[ReplayElement('return', (), np.float32)],
+          replay_forgetting='elephant',
+          prefetch_threads=2,
+          prefetch_queue_size=4,
+          trajectory_sort_mode=trajectory_sort_mode)
+
+  @parameterized.parameters('copy', 'indirect')
+  def test_sort_drops_prefetched_batches(self, trajectory_sort_mode):
+    replay = self._create_replay(trajectory_sort_mode)
+    self.addCleanup(replay._sampler.stop)
+    rng = np.random.RandomState(0)
+    for i in range(2 * REPLAY_CAPACITY):
+      # Each observation identifies its transition.
+      replay.add(np.array([i % 256], dtype=np.uint8), 0, float(i), i % 7 == 6,
+                 rng.randn())
+    # Fill the prefetch queue with batches of the unsorted memory.
+    replay._sampler.sample_transition_batch()
+    replay.sort_replay_buffer_trajectories()
+
+    names = [e.name for e in replay.memory.get_transition_elements()]
+    for _ in range(10):
+      batch = replay._sampler.sample_transition_batch()
+      indices = batch[names.index('indices')]
+      expected = replay.memory.sample_transition_batch(BATCH_SIZE, indices)
+      for name in ['state', 'reward', 'next_state']:
+        np.testing.assert_array_equal(expected[names.index(name)],
+                                      batch[names.index(name)])
+
+  def test_retries_until_enough_transitions(self):
+    num_calls = []
+
+    def sample_transition_batch(batch_size):
+      del batch_size
+      num_calls.append(1)
+      if len(num_calls) == 1:
+        raise circular_replay_buffer.NotEnoughTransitionsError('Not enough.')
+      return ('batch',)
+
+    memory = mock.Mock()
+    memory.sample_transition_batch.side_effect = sample_transition_batch
+    sampler = circular_replay_buffer.PrefetchingSampler(
+        memory, circular_replay_buffer.ReaderWriterLock(), num_threads=1,
+        retry_interval=0.01)
+    self.addCleanup(sampler.stop)
+    self.assertEqual(('batch',), sampler.sample_transition_batch())
+
+  def test_raises_sampling_errors(self):
+    memory = mock.Mock()
+    memory.sample_transition_batch.side_effect = RuntimeError('Max attempts.')
+    sampler = circular_replay_buffer.PrefetchingSampler(
+        memory, circular_replay_buffer.ReaderWriterLock(), num_threads=1,
+        retry_interval=0.01)
+    self.addCleanup(sampler.stop)
+    with self.assertRaisesRegex(RuntimeError, 'Max attempts.'):
+      sampler.sample_transition_batch()
+
+
+class OutOfGraphReplayBufferTest(absltest.TestCase):
+
+  def test_failed_load_keeps_store_indices(self):
+    checkpoint_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, checkpoint_dir)
+    memory = circular_replay_buffer.OutOfGraphReplayBuffer(
+        observation_shape=(1,),
+        stack_size=1,
+        replay_capacity=REPLAY_CAPACITY,
+        batch_size=BATCH_SIZE,
+        extra_storage_types=[ReplayElement('return', (), np.float32)],
+        replay_forgetting='elephant',
+        trajectory_sort_mode='indirect')
+    rng = np.random.RandomState(0)
+    for i in range(2 * REPLAY_CAPACITY):
+      memory.add(np.array([i % 256], dtype=np.uint8), 0, float(i), i % 7 == 6,
+                 rng.randn())
+    memory.save(checkpoint_dir, 0)
+    memory.sort_replay_buffer_trajectories()
+    store_indices = memory._store_indices.copy()
+    self.assertFalse(
+        np.array_equal(store_indices, np.arange(REPLAY_CAPACITY)))
+
+    # A checkpoint without storage slots, which is also missing a file.
+    os.remove(memory._generate_filename(checkpoint_dir, '_store_indices', 0))
+    os.remove(memory._generate_filename(checkpoint_dir, 'add_count', 0))
+    with self.assertRaises(tf.errors.NotFoundError):
+      memory.load(checkpoint_dir, 0)
+    np.testing.assert_array_equal(store_indices, memory._store_indices)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -20,12 +20,12 @@ by Tom Schaul et al. (2015). Many thanks to Tom Schaul, John Quan, and Matteo
 Hessel for providing useful pointers on the algorithm and its implementation.
 """
 
-from dopamine.replay_memory import sum_tree
 import gin
 import numpy as np
 import tensorflow.compat.v1 as tf
 
 from experience_replay.replay_memory import circular_replay_buffer
+from experience_replay.replay_memory import sum_tree
 from experience_replay.replay_memory.circular_replay_buffer import ReplayElement
 
 
@@ -52,7 +52,12 @@ class OutOfGraphPrioritizedReplayBuffer(
                reward_shape=(),
                reward_dtype=np.float32,
                replay_forgetting='default',
-               sample_newest_immediately=False):
+               sample_newest_immediately=False,
+               checkpoint_mode='full',
+               checkpoint_chunk_size=10000,
+               background_checkpoint=False,
+               reuse_batch_arrays=False,
+               trajectory_sort_mode='copy'):
     """Initializes OutOfGraphPrioritizedReplayBuffer.
 
     Args:
@@ -80,6 +85,12 @@ class OutOfGraphPrioritizedReplayBuffer(
         trajectories.  One of ['default', 'elephant'].
       sample_newest_immediately: bool, when True, immediately trains on the
         newest transition instead of using the max_priority hack.
+      checkpoint_mode: str, how the replay memory is checkpointed. One of
+        ['full', 'incremental'], see OutOfGraphReplayBuffer.
+      checkpoint_chunk_size: int, see OutOfGraphReplayBuffer.
+      background_checkpoint: bool, see OutOfGraphReplayBuffer.
+      reuse_batch_arrays: bool, see OutOfGraphReplayBuffer.
+      trajectory_sort_mode: str, see OutOfGraphReplayBuffer.
     """
     super(OutOfGraphPrioritizedReplayBuffer, self).__init__(
         observation_shape=observation_shape,
@@ -96,7 +107,12 @@ class OutOfGraphPrioritizedReplayBuffer(
         action_dtype=action_dtype,
         reward_shape=reward_shape,
         reward_dtype=reward_dtype,
-        replay_forgetting=replay_forgetting)
+        replay_forgetting=replay_forgetting,
+        checkpoint_mode=checkpoint_mode,
+        checkpoint_chunk_size=checkpoint_chunk_size,
+        background_checkpoint=background_checkpoint,
+        reuse_batch_arrays=reuse_batch_arrays,
+        trajectory_sort_mode=trajectory_sort_mode)
 
     tf.logging.info('\t replay_forgetting: %s', replay_forgetting)
     self.sum_tree = sum_tree.SumTree(replay_capacity)
@@ -162,8 +178,20 @@ class OutOfGraphPrioritizedReplayBuffer(
       list of ints, a batch of valid indices sampled uniformly.
 
     Raises:
+      NotEnoughTransitionsError: If the memory holds fewer than stack size +
+        update_horizon transitions, or none with a positive priority.
       Exception: If the batch was not constructed after maximum number of tries.
     """
+    # pylint: disable=protected-access
+    total_priority = self.sum_tree._total_priority()
+    # pylint: enable=protected-access
+    if ((not self.is_full() and
+         self.cursor() - self._update_horizon <= self._stack_size - 1) or
+        total_priority == 0.0):
+      raise circular_replay_buffer.NotEnoughTransitionsError(
+          'Cannot sample a batch without stack size ({}) + update_horizon ({}) '
+          'transitions of positive priority.'.format(self._stack_size,
+                                                     self._update_horizon))
     manually_sample_newest = False
     if self._sample_newest_immediately:
       # self.cursor() points to the next hole to fill, so need to back up to the
@@ -181,21 +209,21 @@ class OutOfGraphPrioritizedReplayBuffer(
     # Sample stratified indices. Some of them might be invalid.
     indices = self.sum_tree.stratified_sample(batch_size)
     allowed_attempts = self._max_sample_attempts
-    for i in range(len(indices)):
-      if not self.is_valid_transition(indices[i]):
-        if allowed_attempts == 0:
-          raise RuntimeError(
-              'Max sample attempts: Tried {} times but only sampled {}'
-              ' valid indices. Batch size is {}'.
-              format(self._max_sample_attempts, i, batch_size))
-        index = indices[i]
-        while not self.is_valid_transition(index) and allowed_attempts > 0:
-          # If index i is not valid keep sampling others. Note that this
-          # is not stratified.
-          index = self.sum_tree.sample()
-          allowed_attempts -= 1
-        indices[i] = index
-
+    invalid = np.flatnonzero(~self.are_valid_transitions(indices))
+    while invalid.size:
+      if allowed_attempts == 0:
+        raise RuntimeError(
+            'Max sample attempts: Tried {} times but only sampled {}'
+            ' valid indices. Batch size is {}'.
+            format(self._max_sample_attempts, batch_size - invalid.size,
+                   batch_size))
+      # Resample the invalid indices. Note that this is not stratified.
+      invalid = invalid[:allowed_attempts]
+      indices[invalid] = self.sum_tree.sample_many(invalid.size)
+      allowed_attempts -= invalid.size
+      invalid = np.flatnonzero(~self.are_valid_transitions(indices))
+
+    indices = indices.tolist()
     if manually_sample_newest:
       indices.append(newest_transition_index)
 
@@ -241,8 +269,7 @@ class OutOfGraphPrioritizedReplayBuffer(
     """
     assert indices.dtype == np.int32, ('Indices must be integers, '
                                        'given: {}'.format(indices.dtype))
-    for index, priority in zip(indices, priorities):
-      self.sum_tree.set(index, priority)
+    self.sum_tree.set_many(indices, priorities)
 
   def get_priority(self, indices):
     """Fetches the priorities correspond to a batch of memory indices.
@@ -259,11 +286,35 @@ class OutOfGraphPrioritizedReplayBuffer(
     assert indices.shape, 'Indices must be an array.'
     assert indices.dtype == np.int32, ('Indices must be int32s, '
                                        'given: {}'.format(indices.dtype))
-    batch_size = len(indices)
-    priority_batch = np.empty((batch_size), dtype=np.float32)
-    for i, memory_index in enumerate(indices):
-      priority_batch[i] = self.sum_tree.get(memory_index)
-    return priority_batch
+    return self.sum_tree.get_many(indices).astype(np.float32)
+
+  def _reorder_transitions(self, order):
+    """Moves the transitions and their priorities to their new indices.
+
+    Args:
+      order: np.array, a permutation of the replay indices.
+    """
+    super(OutOfGraphPrioritizedReplayBuffer, self)._reorder_transitions(order)
+    self.sum_tree.set_many(np.arange(self._replay_capacity),
+                           self.sum_tree.get_many(order))
+
+  def load(self, checkpoint_dir, suffix):
+    """Restores the object from bundle_dictionary and numpy checkpoints.
+
+    Checkpoints holding a dopamine sum tree are converted to sum_tree.SumTree.
+
+    Args:
+      checkpoint_dir: str, the directory where to read the numpy checkpointed
+        files from.
+      suffix: str, the suffix to use in numpy checkpoint files.
+    """
+    super(OutOfGraphPrioritizedReplayBuffer, self).load(checkpoint_dir, suffix)
+    if not isinstance(self.sum_tree, sum_tree.SumTree):
+      legacy_tree = self.sum_tree
+      self.sum_tree = sum_tree.SumTree(self._replay_capacity)
+      self.sum_tree.set_many(np.arange(self._replay_capacity),
+                             legacy_tree.nodes[-1][:self._replay_capacity])
+      self.sum_tree.max_recorded_priority = legacy_tree.max_recorded_priority
 
   def get_transition_elements(self, batch_size=None):
     """Returns a 'type signature' for sample_transition_batch.
@@ -315,7 +366,14 @@ class WrappedPrioritizedReplayBuffer(
                reward_shape=(),
                reward_dtype=np.float32,
                replay_forgetting='default',
-               sample_newest_immediately=False):
+               sample_newest_immediately=False,
+               checkpoint_mode='full',
+               checkpoint_chunk_size=10000,
+               background_checkpoint=False,
+               reuse_batch_arrays=False,
+               prefetch_threads=0,
+               prefetch_queue_size=4,
+               trajectory_sort_mode='copy'):
     """Initializes WrappedPrioritizedReplayBuffer.
 
     Args:
@@ -345,10 +403,19 @@ class WrappedPrioritizedReplayBuffer(
         trajectories.  One of ['default', 'elephant'].
       sample_newest_immediately: bool, whether to sample a new transition
         immediately for training.
+      checkpoint_mode: str, how the replay memory is checkpointed. One of
+        ['full', 'incremental'], see OutOfGraphReplayBuffer.
+      checkpoint_chunk_size: int, see OutOfGraphReplayBuffer.
+      background_checkpoint: bool, see OutOfGraphReplayBuffer.
+      reuse_batch_arrays: bool, see WrappedReplayBuffer.
+      prefetch_threads: int, see WrappedReplayBuffer.
+      prefetch_queue_size: int, see WrappedReplayBuffer.
+      trajectory_sort_mode: str, see OutOfGraphReplayBuffer.
 
     Raises:
       ValueError: If update_horizon is not positive.
       ValueError: If discount factor is not in [0, 1].
+      ValueError: If reuse_batch_arrays is used with staging or prefetching.
     """
     memory = OutOfGraphPrioritizedReplayBuffer(
         observation_shape, stack_size, replay_capacity, batch_size,
@@ -356,7 +423,12 @@ class WrappedPrioritizedReplayBuffer(
         extra_storage_types=extra_storage_types,
         observation_dtype=observation_dtype,
         replay_forgetting=replay_forgetting,
-        sample_newest_immediately=sample_newest_immediately)
+        sample_newest_immediately=sample_newest_immediately,
+        checkpoint_mode=checkpoint_mode,
+        checkpoint_chunk_size=checkpoint_chunk_size,
+        background_checkpoint=background_checkpoint,
+        reuse_batch_arrays=reuse_batch_arrays,
+        trajectory_sort_mode=trajectory_sort_mode)
     super(WrappedPrioritizedReplayBuffer, self).__init__(
         observation_shape,
         stack_size,
@@ -373,7 +445,10 @@ class WrappedPrioritizedReplayBuffer(
         action_dtype=action_dtype,
         reward_shape=reward_shape,
         reward_dtype=reward_dtype,
-        replay_forgetting=replay_forgetting)
+        replay_forgetting=replay_forgetting,
+        reuse_batch_arrays=reuse_batch_arrays,
+        prefetch_threads=prefetch_threads,
+        prefetch_queue_size=prefetch_queue_size)
     tf.logging.info('\t replay_forgetting: %s', replay_forgetting)
 
   def tf_set_priority(self, indices, priorities):
@@ -386,8 +461,12 @@ class WrappedPrioritizedReplayBuffer(
     Returns:
        A tf op setting the priorities for prioritized sampling.
     """
+    def set_priority(indices, priorities):
+      with self._lock.write():
+        self.memory.set_priority(indices, priorities)
+
     return tf.py_func(
-        self.memory.set_priority, [indices, priorities], [],
+        set_priority, [indices, priorities], [],
         name='prioritized_replay_set_priority_py_func')
 
   def tf_get_priority(self, indices):
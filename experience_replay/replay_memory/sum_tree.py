@@ -0,0 +1,232 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""An array-backed sum tree with batched operations.
+
+This is a drop-in replacement for dopamine.replay_memory.sum_tree.SumTree that
+stores the whole tree in a single numpy array, so that batches of priorities
+can be read, written and sampled with a handful of vectorized operations per
+tree level instead of a Python loop per element.
+"""
+
+import math
+
+import numpy as np
+
+
+class SumTree(object):
+  """A sum tree data structure for storing replay priorities.
+
+  A sum tree is a complete binary tree whose leaves contain values called
+  priorities. Internal nodes maintain the sum of the priorities of all leaf
+  nodes in their subtree.
+
+  The tree is stored in the usual array representation of a complete binary
+  tree: the root is at index 1 and the children of node i are at 2i and
+  2i + 1. The leaves, padded with zeros up to a power of two, are at the end
+  of the array.
+  """
+
+  def __init__(self, capacity):
+    """Creates the sum tree data structure for the given replay capacity.
+
+    Args:
+      capacity: int, the maximum number of elements that can be stored in this
+        data structure.
+
+    Raises:
+      ValueError: If requested capacity is not positive.
+    """
+    assert isinstance(capacity, int)
+    if capacity <= 0:
+      raise ValueError('Sum tree capacity should be positive. Got: {}'.format(
+          capacity))
+
+    self._depth = int(math.ceil(np.log2(capacity)))
+    self._num_leaves = 2 ** self._depth
+    self._tree = np.zeros(2 * self._num_leaves)
+    self.max_recorded_priority = 1.0
+
+  @property
+  def nodes(self):
+    """List of the node values at each depth, as in dopamine's SumTree."""
+    return [self._tree[2 ** depth:2 ** (depth + 1)]
+            for depth in range(self._depth + 1)]
+
+  def _total_priority(self):
+    """Returns the sum of all priorities stored in this sum tree.
+
+    Returns:
+      float, sum of priorities stored in this sum tree.
+    """
+    return self._tree[1]
+
+  def sample(self, query_value=None):
+    """Samples an element from the sum tree.
+
+    Each element has probability p_i / sum_j p_j of being picked, where p_i is
+    the (positive) value associated with node i (possibly unnormalized).
+
+    Args:
+      query_value: float in [0, 1], used as the random value to select a sample.
+        If None, will select one randomly in [0, 1).
+
+    Returns:
+      int, a random element from the sum tree.
+
+    Raises:
+      Exception: If the sum tree is empty (i.e. its node values sum to 0), or if
+        the supplied query_value is larger than the total sum.
+    """
+    if query_value and (query_value < 0.0 or query_value > 1.0):
+      raise ValueError('query_value must be in [0, 1].')
+    query_value = np.random.random() if query_value is None else query_value
+    return int(self.sample_many(query_values=np.array([query_value]))[0])
+
+  def sample_many(self, batch_size=None, query_values=None):
+    """Samples a batch of elements from the sum tree with replacement.
+
+    Args:
+      batch_size: int, the number of elements to sample. Ignored if
+        query_values is given.
+      query_values: np.array of floats in [0, 1], used as the random values to
+        select the samples. If None, batch_size values are drawn uniformly in
+        [0, 1).
+
+    Returns:
+      np.array of int32, the sampled elements.
+
+    Raises:
+      ValueError: If the sum tree is empty (i.e. its node values sum to 0).
+    """
+    if self._total_priority() == 0.0:
+      raise ValueError('Cannot sample from an empty sum tree.')
+    if query_values is None:
+      query_values = np.random.random(batch_size)
+    query_values = np.asarray(query_values, dtype=np.float64)
+    query_values = query_values * self._total_priority()
+
+    # Traverse the sum tree for all query values at once.
+    node_indices = np.ones(len(query_values), dtype=np.int64)
+    for _ in range(self._depth):
+      left_children = node_indices * 2
+      left_sums = self._tree[left_children]
+      # Each subtree describes a range [0, a), where a is its value.
+      go_right = query_values >= left_sums
+      query_values = np.where(go_right, query_values - left_sums, query_values)
+      node_indices = left_children + go_right
+    return (node_indices - self._num_leaves).astype(np.int32)
+
+  def stratified_sample(self, batch_size):
+    """Performs stratified sampling using the sum tree.
+
+    Let R be the value at the root (total value of sum tree). This method will
+    divide [0, R) into batch_size segments, pick a random number from each of
+    those segments, and use that random number to sample from the sum_tree. This
+    is as specified in Schaul et al. (2015).
+
+    Args:
+      batch_size: int, the number of strata to use.
+
+    Returns:
+      np.array of batch_size elements sampled from the sum tree.
+
+    Raises:
+      ValueError: If the sum tree is empty (i.e. its node values sum to 0).
+    """
+    bounds = np.linspace(0.0, 1.0, batch_size + 1)
+    query_values = np.random.uniform(bounds[:-1], bounds[1:])
+    return self.sample_many(query_values=query_values)
+
+  def get(self, node_index):
+    """Returns the value of the leaf node corresponding to the index.
+
+    Args:
+      node_index: The index of the leaf node.
+
+    Returns:
+      The value of the leaf node.
+    """
+    return self._tree[self._num_leaves + node_index]
+
+  def get_many(self, node_indices):
+    """Returns the values of the leaf nodes corresponding to the indices.
+
+    Args:
+      node_indices: np.array of ints, the indices of the leaf nodes.
+
+    Returns:
+      np.array, the values of the leaf nodes.
+    """
+    return self._tree[self._num_leaves + np.asarray(node_indices)]
+
+  def set(self, node_index, value):
+    """Sets the value of a leaf node and updates internal nodes accordingly.
+
+    This operation takes O(log(capacity)).
+    Args:
+      node_index: int, the index of the leaf node to be updated.
+      value: float, the value which we assign to the node. This value must be
+        nonnegative. Setting value = 0 will cause the element to never be
+        sampled.
+
+    Raises:
+      ValueError: If the given value is negative.
+    """
+    if value < 0.0:
+      raise ValueError('Sum tree values should be nonnegative. Got {}'.format(
+          value))
+    self.max_recorded_priority = max(value, self.max_recorded_priority)
+
+    tree = self._tree
+    tree_index = self._num_leaves + node_index
+    tree[tree_index] = value
+    # Recompute the sums along the path to the root.
+    tree_index //= 2
+    while tree_index:
+      tree[tree_index] = tree[2 * tree_index] + tree[2 * tree_index + 1]
+      tree_index //= 2
+
+  def set_many(self, node_indices, values):
+    """Sets the values of many leaf nodes and updates internal nodes.
+
+    Equivalent to calling set on each (node_index, value) pair in order: if an
+    index appears several times, its last value is kept.
+
+    Args:
+      node_indices: np.array of ints, the indices of the leaf nodes to update.
+      values: np.array of floats, the nonnegative values to assign.
+
+    Raises:
+      ValueError: If any of the given values is negative.
+    """
+    node_indices = np.asarray(node_indices, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if not node_indices.size:
+      return
+    if (values < 0.0).any():
+      raise ValueError('Sum tree values should be nonnegative. Got {}'.format(
+          values[values < 0.0][0]))
+    self.max_recorded_priority = max(values.max(), self.max_recorded_priority)
+
+    # Keep the last value of each repeated index.
+    reversed_indices = node_indices[::-1]
+    tree_indices, last = np.unique(reversed_indices, return_index=True)
+    self._tree[self._num_leaves + tree_indices] = values[::-1][last]
+    tree_indices += self._num_leaves
+    for _ in range(self._depth):
+      tree_indices = np.unique(tree_indices // 2)
+      self._tree[tree_indices] = (self._tree[2 * tree_indices] +
+                                  self._tree[2 * tree_indices + 1])
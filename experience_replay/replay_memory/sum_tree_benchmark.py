@@ -0,0 +1,81 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+r"""Benchmarks the batched sum tree against dopamine's per-element sum tree.
+
+Times one learner step worth of priority work: a stratified sample, a priority
+read and a priority update of a batch.
+
+Sample usage (from google_research/):
+
+python -m experience_replay.replay_memory.sum_tree_benchmark \
+    --capacity=1000000 --batch_size=512
+"""
+
+import timeit
+
+from absl import app
+from absl import flags
+from dopamine.replay_memory import sum_tree as dopamine_sum_tree
+import numpy as np
+
+from experience_replay.replay_memory import sum_tree
+
+flags.DEFINE_integer('capacity', 1000000, 'Number of leaves in the sum tree.')
+flags.DEFINE_integer('batch_size', 512, 'Number of elements per batch.')
+flags.DEFINE_integer('num_steps', 100, 'Number of batches to time.')
+
+FLAGS = flags.FLAGS
+
+
+def _per_element_step(tree, batch_size):
+  indices = tree.stratified_sample(batch_size)
+  priorities = [tree.get(index) for index in indices]
+  for index, priority in zip(indices, priorities):
+    tree.set(index, priority * 0.9 + 0.1)
+
+
+def _batched_step(tree, batch_size):
+  indices = tree.stratified_sample(batch_size)
+  priorities = tree.get_many(indices)
+  tree.set_many(indices, priorities * 0.9 + 0.1)
+
+
+def _run(name, tree, step_fn):
+  start = timeit.default_timer()
+  for _ in range(FLAGS.num_steps):
+    step_fn(tree, FLAGS.batch_size)
+  elapsed = timeit.default_timer() - start
+  print('%-12s %8.3fs %10.1f steps/s' % (name, elapsed,
+                                         FLAGS.num_steps / elapsed))
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+  priorities = np.random.uniform(size=FLAGS.capacity)
+  per_element_tree = dopamine_sum_tree.SumTree(FLAGS.capacity)
+  for index, priority in enumerate(priorities):
+    per_element_tree.set(index, priority)
+  batched_tree = sum_tree.SumTree(FLAGS.capacity)
+  batched_tree.set_many(np.arange(FLAGS.capacity), priorities)
+
+  print('Capacity %d, batch size %d.' % (FLAGS.capacity, FLAGS.batch_size))
+  _run('per-element', per_element_tree, _per_element_step)
+  _run('batched', batched_tree, _batched_step)
+
+
+if __name__ == '__main__':
+  app.run(main)
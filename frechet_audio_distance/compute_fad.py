@@ -24,10 +24,12 @@ from absl import flags
 
 from frechet_audio_distance import fad_utils
 
-flags.DEFINE_string("background_stats", None,
-                    "Tf record containing the background stats (mu sigma).")
-flags.DEFINE_string("test_stats", None,
-                    "Tf record containing the test stats (mu sigma).")
+flags.DEFINE_multi_string(
+    "background_stats", None,
+    "Tf record containing the background stats (mu sigma). May be repeated.")
+flags.DEFINE_multi_string(
+    "test_stats", None,
+    "Tf record containing the test stats (mu sigma). May be repeated.")
 
 flags.mark_flags_as_required(["background_stats", "test_stats"])
 
@@ -36,10 +38,21 @@ FLAGS = flags.FLAGS
 
 def main(argv):
   del argv  # Unused.
-  mu_bg, sigma_bg = fad_utils.read_mean_and_covariances(FLAGS.background_stats)
-  mu_test, sigma_test = fad_utils.read_mean_and_covariances(FLAGS.test_stats)
-  fad = fad_utils.frechet_distance(mu_bg, sigma_bg, mu_test, sigma_test)
-  print("FAD: %f" % fad)
+  background_stats = [
+      fad_utils.read_mean_and_covariances(filename)
+      for filename in FLAGS.background_stats
+  ]
+  test_stats = [
+      fad_utils.read_mean_and_covariances(filename)
+      for filename in FLAGS.test_stats
+  ]
+  fads = fad_utils.frechet_distances(test_stats, background_stats)
+  if fads.size == 1:
+    print("FAD: %f" % fads[0, 0])
+    return
+  for test_filename, test_fads in zip(FLAGS.test_stats, fads):
+    for background_filename, fad in zip(FLAGS.background_stats, test_fads):
+      print("FAD %s vs %s: %f" % (test_filename, background_filename, fad))
 
 
 if __name__ == "__main__":
@@ -33,6 +33,7 @@ import scipy.io.wavfile
 import scipy.spatial.distance
 import tensorflow.compat.v1 as tf
 
+from frechet_audio_distance import fad_utils
 from frechet_audio_distance.audioset_model import AudioSetModel
 
 
@@ -51,22 +52,15 @@ class ComputeMeanAndCovariance(beam.CombineFn):
 
    The covariance matrix sigma is computed on mean normalized data X like this:
    m = np.mean(X, axis=0) # mean of X = (x_0, ..., x_i, ... x_n)
-     = sum(x_i) / n => sum(x_i) = m * n
    sigma = sum[(x_i - m) * (x_i - m).T] / (n-1)
-         = sum [ x_i * x_i.T - x_i * m.T - m * x_i.T -  m * m.T]/(n-1)
-         = [sum(x_i * x_i.T) - sum(x_i) * m.T - m * sum(x_i)  + n m * m.T]/(n-1)
-         = [sum(x_i * x_i.T) - n * m * m.T - m * n * m.T  + n m * m.T]/(n-1)
-         = [sum(x_i * x_i.T) - n * m * m.T]/(n-1)
-         = sum(x_i * x_i.T)/(n-1) - (m * m.T) * n/(n-1)
     This equivalent to: sigma = np.cov(X, rowvar=0) but runs much faster:
       - np.cov: 400 hour of audio 2048 dim ~ 1h
       - this approach: 400 hour of audio 2048 dim ~ 5min
 
-    By splitting sigma up this way it can be accumulated in parallel by using
-    accumulators for:
-      1) sum(x_i * x_i.T)
-      2) for the mean sum(x_i)
-      3) and an accumulator that just counts the total number samples.
+    The accumulators (see fad_utils.MeanAndCovarianceAccumulator) keep the
+    count, the mean and sum[(x_i - m) * (x_i - m).T] of their embeddings, which
+    can be updated and merged in parallel without the loss of precision of
+    accumulating sum(x_i * x_i.T).
 
   The resulting PCollection contains a single tf.Example containing the stats.
   """
@@ -83,50 +77,24 @@ class ComputeMeanAndCovariance(beam.CombineFn):
 
   def create_accumulator(self):
     """See base class."""
-    mean_accu = np.zeros((self._embedding_dim, 1), dtype=np.float64)
-    cov_accu = np.zeros((self._embedding_dim, self._embedding_dim),
-                        dtype=np.float64)
-
-    return mean_accu, cov_accu, 0
+    return fad_utils.MeanAndCovarianceAccumulator(self._embedding_dim)
 
   def add_input(self, accu, element):
     """See base class."""
-    mean_accu, cov_accu, sample_count = accu
-    for embeddding in element:
-      if self._embedding_dim != len(embeddding):
-        raise ValueError('Embedding dims missmatch: %d != %d' %
-                         (self._embedding_dim, len(embeddding)))
-      np_embeddding = np.array(embeddding).reshape((self._embedding_dim, 1))
-      mean_accu += np_embeddding
-      cov_accu += np_embeddding * np_embeddding.T
-      sample_count += 1
-    return mean_accu, cov_accu, sample_count
+    if len(element):  # pylint: disable=g-explicit-length-test
+      accu.add(element)
+    return accu
 
   def merge_accumulators(self, accumulators):
     """See base class."""
-    merged_mean, merged_cov, merged_sample_count = self.create_accumulator()
+    merged = self.create_accumulator()
     for accu in accumulators:
-      mean_accu, cov_accu, sample_count = accu
-      merged_mean += mean_accu
-      merged_cov += cov_accu
-      merged_sample_count += sample_count
-    return merged_mean, merged_cov, merged_sample_count
+      merged.merge(accu)
+    return merged
 
   def extract_output(self, accu):
     """See base class."""
-    mean_accu, cov_accu, sample_count = accu
-    feature = {
-        'embedding_count': _int64_feature([sample_count]),
-        'embedding_length': _int64_feature([self._embedding_dim])
-    }
-    if sample_count > 0:
-      mu = (mean_accu / sample_count).reshape((self._embedding_dim, 1))
-      sigma = cov_accu / (sample_count - 1) - mu * mu.T * (sample_count) / (
-          sample_count - 1)
-      feature['mu'] = _float_feature(list(mu.flatten()))
-      feature['sigma'] = _float_feature(list(sigma.flatten()))
-    example = tf.train.Example(features=tf.train.Features(feature=feature))
-    return self._key_name, example
+    return self._key_name, fad_utils.mean_and_covariance_example(accu)
 
 
 class BatchedInference(beam.DoFn):
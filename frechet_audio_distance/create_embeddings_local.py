@@ -0,0 +1,233 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Computes the embedding stats of local audio without a Beam runner.
+
+Audio clips are read and converted into model inputs by a pool of reader
+threads. The inputs of consecutive clips are cut into batches of exactly
+batch_size examples, which are embedded by a pool of inference threads. Each
+inference thread owns a model session and a MeanAndCovarianceAccumulator; the
+accumulators are merged once all the audio has been processed.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import threading
+import timeit
+
+from multiprocessing import pool as mp_pool
+import numpy as np
+import scipy.io.wavfile
+import tensorflow.compat.v1 as tf
+
+from frechet_audio_distance import fad_utils
+from frechet_audio_distance.audioset_model import AudioSetModel
+from tensorflow_models.audioset import vggish_params
+
+LocalStats = collections.namedtuple(
+    'LocalStats', 'accumulator audio_seconds elapsed_seconds')
+
+
+def _bounded_imap(pool, func, iterable, max_pending):
+  """Like pool.imap, but with at most max_pending unfinished tasks.
+
+  Unlike pool.imap, this does not consume the whole iterable up front, so the
+  clips and batches in flight stay bounded.
+
+  Args:
+    pool: multiprocessing pool running the tasks.
+    func: function applied to each element.
+    iterable: the elements.
+    max_pending: maximum number of tasks submitted but not yet yielded.
+
+  Yields:
+    func(element) for each element, in order.
+  """
+  pending = collections.deque()
+  for element in iterable:
+    if len(pending) >= max_pending:
+      yield pending.popleft().get()
+    pending.append(pool.apply_async(func, (element,)))
+  while pending:
+    yield pending.popleft().get()
+
+
+def _fixed_size_batches(inputs, batch_size):
+  """Concatenates model inputs and cuts them into batches of batch_size.
+
+  Args:
+    inputs: iterable of arrays of model inputs, each of shape (num_inputs, ...).
+    batch_size: number of model inputs per batch.
+
+  Yields:
+    Arrays of batch_size model inputs. Only the last batch may be smaller.
+  """
+  buffered = []
+  num_buffered = 0
+  for clip_inputs in inputs:
+    if not len(clip_inputs):  # pylint: disable=g-explicit-length-test
+      continue
+    buffered.append(clip_inputs)
+    num_buffered += len(clip_inputs)
+    if num_buffered < batch_size:
+      continue
+    merged = np.concatenate(buffered)
+    num_full = num_buffered // batch_size * batch_size
+    for start in range(0, num_full, batch_size):
+      yield merged[start:start + batch_size]
+    buffered = [merged[num_full:]]
+    num_buffered -= num_full
+  if num_buffered:
+    yield np.concatenate(buffered)
+
+
+def _read_inputs(files_input_list=None, tfrecord_input=None):
+  """Yields the wav file names or the serialized tf.Examples to process."""
+  if files_input_list:
+    with tf.gfile.GFile(files_input_list) as f:
+      for line in f:
+        if line.strip():
+          yield line.strip()
+  else:
+    for filename in tf.gfile.Glob(tfrecord_input):
+      for record in tf.python_io.tf_record_iterator(filename):
+        yield record
+
+
+def compute_stats(embedding_model,
+                  files_input_list=None,
+                  tfrecord_input=None,
+                  stats_output=None,
+                  feature_key=None,
+                  batch_size=64,
+                  num_readers=4,
+                  num_workers=2,
+                  queue_size=16):
+  """Computes the stats of the embeddings of audio examples.
+
+  Args:
+    embedding_model: ModelConfig namedtuple; contains model ckpt, embedding
+      dimension size and step size.
+    files_input_list: List of files from where the audio is to be read.
+    tfrecord_input: Path to a tfrecord containing audio.
+    stats_output: location to where the stats should be written, in the format
+      written by create_embeddings_beam.
+    feature_key: tf.example feature that contains the samples that are to be
+      processed.
+    batch_size: number of model inputs per model call.
+    num_readers: number of threads reading audio and extracting model inputs.
+    num_workers: number of threads, each with its own model, computing
+      embeddings.
+    queue_size: maximum number of clips, and of batches, in flight.
+
+  Returns:
+    LocalStats namedtuple with the merged MeanAndCovarianceAccumulator, the
+    seconds of audio processed and the wall time it took.
+
+  Raises:
+    ValueError:
+      - When neither or both of files_input_list and tfrecord_input are set.
+      - When the extracted input features are not finite.
+      - When the computed embeddings are not finite.
+      - If the emddings do not have the expected dimension.
+  """
+  if bool(files_input_list) == bool(tfrecord_input):
+    raise ValueError('Exactly one of files_input_list and tfrecord_input must '
+                     'be set.')
+  feature_key = feature_key or 'audio/reference/raw_audio'
+  start = timeit.default_timer()
+
+  # TF sessions release the GIL while running, so the inference threads run
+  # their models concurrently. Each thread takes one of the models.
+  models = [
+      AudioSetModel(embedding_model.model_ckpt, embedding_model.step_size)
+      for _ in range(num_workers)
+  ]
+  free_models = list(models)
+  accumulators = []
+  lock = threading.Lock()
+  worker = threading.local()
+
+  def init_worker():
+    worker.accumulator = fad_utils.MeanAndCovarianceAccumulator(
+        embedding_model.embedding_dim)
+    with lock:
+      worker.model = free_models.pop()
+      accumulators.append(worker.accumulator)
+
+  def embed(batch):
+    embeddings = worker.model.process_batch(batch)
+    if embeddings.shape[1] != embedding_model.embedding_dim:
+      raise ValueError('Embedding isn\'t the expected dimension %d vs %d' %
+                       (embeddings.shape[1], embedding_model.embedding_dim))
+    if not np.isfinite(embeddings).all():
+      raise ValueError('Embedding not finite')
+    worker.accumulator.add(embeddings)
+
+  def read(element):
+    if files_input_list:
+      key = element
+      _, data = scipy.io.wavfile.read(element)
+      samples = np.array(data, dtype=np.float32).astype(np.float64)
+    else:
+      example = tf.train.Example.FromString(element)
+      key = example.features.feature['name'].bytes_list.value
+      samples = np.array(example.features.feature[feature_key].float_list.value)
+    num_samples = samples.shape[0]
+    # Feature extraction does not use the model session.
+    features = models[0].extract_features(samples)
+    if not features:
+      return num_samples, np.zeros((0,))
+    features = np.concatenate(features)
+    if not np.isfinite(features).all():
+      raise ValueError('Input Feature not finite %s' % key)
+    return num_samples, features
+
+  audio_samples = [0]
+
+  def clip_inputs(clips):
+    for num_samples, features in clips:
+      audio_samples[0] += num_samples
+      yield features
+
+  readers = mp_pool.ThreadPool(num_readers)
+  workers = mp_pool.ThreadPool(num_workers, initializer=init_worker)
+  try:
+    clips = _bounded_imap(readers,
+                          read,
+                          _read_inputs(files_input_list, tfrecord_input),
+                          queue_size)
+    batches = _fixed_size_batches(clip_inputs(clips), batch_size)
+    for _ in _bounded_imap(workers, embed, batches, queue_size):
+      pass
+  finally:
+    readers.terminate()
+    workers.terminate()
+    readers.join()
+    workers.join()
+
+  accumulator = fad_utils.MeanAndCovarianceAccumulator(
+      embedding_model.embedding_dim)
+  for worker_accumulator in accumulators:
+    accumulator.merge(worker_accumulator)
+  if stats_output:
+    fad_utils.write_mean_and_covariances(stats_output, accumulator)
+  return LocalStats(
+      accumulator=accumulator,
+      audio_seconds=audio_samples[0] / float(vggish_params.SAMPLE_RATE),
+      elapsed_seconds=timeit.default_timer() - start)
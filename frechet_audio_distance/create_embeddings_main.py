@@ -13,7 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Uses Python Beam to compute the multivariate Gaussian."""
+"""Uses Python Beam or a local runner to compute the multivariate Gaussian."""
 
 from __future__ import absolute_import
 from __future__ import division
@@ -24,6 +24,7 @@ from absl import app
 from absl import flags
 
 from frechet_audio_distance import create_embeddings_beam
+from frechet_audio_distance import create_embeddings_local
 
 flags.DEFINE_string('input_files', None,
                     'File containing a list of all input audio files.')
@@ -43,6 +44,18 @@ flags.DEFINE_integer('model_embedding_dim', 128,
                      'The model dimension of the models emedding layer.')
 flags.DEFINE_integer('model_step_size', 8000,
                      'Number of samples between each extraced windown.')
+flags.DEFINE_enum(
+    'runner', 'beam', ['beam', 'local'],
+    'Use a Beam pipeline or the local threaded runner. The local runner only '
+    'writes --stats.')
+flags.DEFINE_integer('batch_size', 64,
+                     'Local runner: number of model inputs per model call.')
+flags.DEFINE_integer('num_readers', 4,
+                     'Local runner: number of threads reading the audio.')
+flags.DEFINE_integer(
+    'num_workers', 2,
+    'Local runner: number of threads, each with its own model, computing '
+    'embeddings.')
 
 flags.mark_flags_as_mutual_exclusive(['input_files', 'tfrecord_input'],
                                      required=True)
@@ -57,14 +70,31 @@ def main(unused_argv):
   if not FLAGS.embeddings and not FLAGS.stats:
     raise ValueError('No output provided. Please specify at least one of '
                      '"--embeddings" or "--stats".')
+  model_config = ModelConfig(
+      model_ckpt=FLAGS.model_ckpt,
+      embedding_dim=FLAGS.model_embedding_dim,
+      step_size=FLAGS.model_step_size)
+  if FLAGS.runner == 'local':
+    if FLAGS.embeddings:
+      raise ValueError('The local runner does not write "--embeddings".')
+    stats = create_embeddings_local.compute_stats(
+        embedding_model=model_config,
+        files_input_list=FLAGS.input_files,
+        tfrecord_input=FLAGS.tfrecord_input,
+        stats_output=FLAGS.stats,
+        feature_key=FLAGS.feature_key,
+        batch_size=FLAGS.batch_size,
+        num_readers=FLAGS.num_readers,
+        num_workers=FLAGS.num_workers)
+    print('Embedded %.1f seconds of audio in %.1f seconds: %.1f audio-seconds '
+          'per second.' % (stats.audio_seconds, stats.elapsed_seconds,
+                           stats.audio_seconds / stats.elapsed_seconds))
+    return
   pipeline = create_embeddings_beam.create_pipeline(
       tfrecord_input=FLAGS.tfrecord_input,
       files_input_list=FLAGS.input_files,
       feature_key=FLAGS.feature_key,
-      embedding_model=ModelConfig(
-          model_ckpt=FLAGS.model_ckpt,
-          embedding_dim=FLAGS.model_embedding_dim,
-          step_size=FLAGS.model_step_size),
+      embedding_model=model_config,
       embeddings_output=FLAGS.embeddings,
       stats_output=FLAGS.stats)
   result = pipeline.run()
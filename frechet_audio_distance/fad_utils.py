@@ -21,7 +21,6 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-from scipy import linalg
 import tensorflow.compat.v1 as tf
 
 
@@ -45,6 +44,47 @@ def read_mean_and_covariances(filename):
   return mu, sigma
 
 
+def mean_and_covariance_example(accumulator):
+  """Returns the stats of a MeanAndCovarianceAccumulator as a tf.Example.
+
+  The example has the format read by read_mean_and_covariances.
+
+  Args:
+    accumulator: MeanAndCovarianceAccumulator with the embeddings.
+
+  Returns:
+    tf.train.Example with the embedding_count, embedding_length, and when at
+    least one embedding was accumulated, mu and sigma features.
+  """
+  feature = {
+      'embedding_count':
+          tf.train.Feature(
+              int64_list=tf.train.Int64List(value=[accumulator.count])),
+      'embedding_length':
+          tf.train.Feature(
+              int64_list=tf.train.Int64List(
+                  value=[accumulator.embedding_dim]))
+  }
+  if accumulator.count > 0:
+    feature['mu'] = tf.train.Feature(
+        float_list=tf.train.FloatList(value=list(accumulator.mean)))
+    feature['sigma'] = tf.train.Feature(
+        float_list=tf.train.FloatList(
+            value=list(accumulator.covariance().flatten())))
+  return tf.train.Example(features=tf.train.Features(feature=feature))
+
+
+def write_mean_and_covariances(filename, accumulator):
+  """Writes the stats of a MeanAndCovarianceAccumulator to a tf_record.
+
+  Args:
+    filename: Path of the tf_record.
+    accumulator: MeanAndCovarianceAccumulator with the embeddings.
+  """
+  with tf.python_io.TFRecordWriter(filename) as writer:
+    writer.write(mean_and_covariance_example(accumulator).SerializeToString())
+
+
 def normalize_loudness(np_samples, max_db_increase=20):
   """Normalizes the loudness to be between -1.0 and 1.0.
 
@@ -63,38 +103,101 @@ def normalize_loudness(np_samples, max_db_increase=20):
   return np_samples / np.maximum(min_amplitude_ratio, np.amax(np_samples))
 
 
-def _stable_trace_sqrt_product(sigma_test, sigma_train, eps=1e-7):
-  """Avoids some problems when computing the srqt of product of sigmas.
+class MeanAndCovarianceAccumulator(object):
+  """Accumulates the mean and covariance matrix of streamed embeddings.
+
+  Keeps the count, the mean and the sum of the outer products of the deviations
+  from the mean, which are updated with the pairwise algorithm of Chan et al.
+  for every batch (or shard) of embeddings. Unlike accumulating sum(x_i) and
+  sum(x_i * x_i.T), this does not lose precision when the mean is large
+  compared to the variance. Accumulators of different shards can be merged.
+  """
+
+  def __init__(self, embedding_dim):
+    """Initializes an empty MeanAndCovarianceAccumulator.
+
+    Args:
+      embedding_dim: Dimensionality of the embeddings.
+    """
+    self.embedding_dim = embedding_dim
+    self.count = 0
+    self.mean = np.zeros((embedding_dim,), dtype=np.float64)
+    self.m2 = np.zeros((embedding_dim, embedding_dim), dtype=np.float64)
+
+  def add(self, embeddings):
+    """Adds a batch of embeddings.
+
+    Args:
+      embeddings: 2d array of shape (num_embeddings, embedding_dim).
+
+    Raises:
+      ValueError: If the embeddings do not have the expected dimension.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    if embeddings.ndim != 2 or embeddings.shape[1] != self.embedding_dim:
+      raise ValueError('Embedding dims missmatch: %s != (None, %d)' %
+                       (embeddings.shape, self.embedding_dim))
+    if not embeddings.shape[0]:
+      return
+    mean = embeddings.mean(axis=0)
+    centered = embeddings - mean
+    self._merge(embeddings.shape[0], mean, centered.T.dot(centered))
+
+  def merge(self, other):
+    """Adds the embeddings accumulated by another accumulator."""
+    if other.embedding_dim != self.embedding_dim:
+      raise ValueError('Embedding dims missmatch: %d != %d' %
+                       (other.embedding_dim, self.embedding_dim))
+    if other.count:
+      self._merge(other.count, other.mean, other.m2)
 
-  Based on Dougal J. Sutherland's contribution here:
-  https://github.com/bioinf-jku/TTUR/blob/master/fid.py
+  def _merge(self, count, mean, m2):
+    total_count = self.count + count
+    delta = mean - self.mean
+    self.m2 = self.m2 + m2 + np.outer(delta, delta) * (
+        self.count * count / total_count)
+    self.mean = self.mean + delta * (count / total_count)
+    self.count = total_count
+
+  def covariance(self):
+    """Returns the unbiased covariance matrix, as np.cov(X, rowvar=0)."""
+    return self.m2 / (self.count - 1)
+
+
+def _sqrt_psd(sigma):
+  """Returns a matrix A with A.dot(A.T) == sigma for a covariance matrix.
 
   Args:
-    sigma_test: Test covariance matrix.
-    sigma_train: Train covariance matirx.
-    eps: Small number; used to avoid singular product.
+    sigma: Symmetric positive semi-definite matrix.
 
   Returns:
-    The Trace of the square root of the product of the passed convariance
-    matrices.
-
-  Raises:
-    ValueError: If the sqrt of the product of the sigmas contains complex
-        numbers with large imaginary parts.
+    The factor V * sqrt(w) of the eigendecomposition sigma = V diag(w) V.T.
+    Small negative eigenvalues due to rounding are clipped to 0.
   """
-  # product might be almost singular
-  sqrt_product, _ = linalg.sqrtm(sigma_test.dot(sigma_train), disp=False)
-  if not np.isfinite(sqrt_product).all():
-    # add eps to the diagonal to avoid a singular product.
-    offset = np.eye(sigma_test.shape[0]) * eps
-    sqrt_product = linalg.sqrtm((sigma_test + offset).dot(sigma_train + offset))
+  eigenvalues, eigenvectors = np.linalg.eigh(sigma)
+  return eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+
 
-  # Might have a slight imaginary component.
-  if not np.allclose(np.diagonal(sqrt_product).imag, 0, atol=1e-3):
-    raise ValueError('sqrt_product contains large complex numbers.')
-  sqrt_product = sqrt_product.real
+def _trace_sqrt_products(sigmas_test, sqrt_sigma_train):
+  """Computes Tr(sqrt(sigma_test * sigma_train)) for many test covariances.
 
-  return np.trace(sqrt_product)
+  With sigma_train = A A.T, sigma_test * sigma_train is similar to the
+  symmetric positive semi-definite matrix A.T sigma_test A, so the trace of its
+  square root is the sum of the square roots of the eigenvalues of the latter.
+  This avoids the general (complex) matrix square root.
+
+  Args:
+    sigmas_test: Test covariance matrices, with shape (num_test, dim, dim).
+    sqrt_sigma_train: The factor A of the train covariance matrix, see
+      _sqrt_psd.
+
+  Returns:
+    1d np.array with the trace of the square root of each product.
+  """
+  products = np.matmul(
+      np.matmul(sqrt_sigma_train.T, sigmas_test), sqrt_sigma_train)
+  eigenvalues = np.linalg.eigvalsh(products)
+  return np.sqrt(np.maximum(eigenvalues, 0)).sum(axis=-1)
 
 
 def frechet_distance(mu_test, sigma_test, mu_train, sigma_train):
@@ -133,8 +236,48 @@ def frechet_distance(mu_test, sigma_test, mu_train, sigma_train):
   if sigma_test.shape != sigma_train.shape:
     raise ValueError('sigma_test should have the same shape as sigma_train')
 
-  mu_diff = mu_test - mu_train
-  trace_sqrt_product = _stable_trace_sqrt_product(sigma_test, sigma_train)
+  return frechet_distances([(mu_test, sigma_test)],
+                           [(mu_train, sigma_train)])[0, 0]
+
+
+def frechet_distances(test_stats, train_stats, batch_size=16):
+  """Computes the Fréchet distance of every pair of test and train gaussians.
+
+  Each train covariance matrix is eigendecomposed once and reused for all the
+  test gaussians, which are processed batch_size at a time.
+
+  Args:
+    test_stats: List of (mu, sigma) of the test multivariate gaussians.
+    train_stats: List of (mu, sigma) of the train multivariate gaussians.
+    batch_size: Number of test covariance matrices processed at once.
+
+  Returns:
+    2d np.array with shape (len(test_stats), len(train_stats)) where entry
+    (i, j) is the Fréchet distance between test_stats[i] and train_stats[j].
+
+  Raises:
+    ValueError: If the gaussians do not all have the same dimension.
+  """
+  mus_test = np.array([mu for mu, _ in test_stats], dtype=np.float64)
+  sigmas_test = np.array([sigma for _, sigma in test_stats], dtype=np.float64)
+  if mus_test.ndim != 2 or sigmas_test.shape[1:] != (mus_test.shape[1],) * 2:
+    raise ValueError('All gaussians must have the same dimension.')
+  traces_test = np.trace(sigmas_test, axis1=1, axis2=2)
 
-  return mu_diff.dot(mu_diff) + np.trace(sigma_test) + np.trace(
-      sigma_train) - 2 * trace_sqrt_product
+  distances = np.zeros((len(test_stats), len(train_stats)))
+  for j, (mu_train, sigma_train) in enumerate(train_stats):
+    mu_train = np.asarray(mu_train, dtype=np.float64)
+    sigma_train = np.asarray(sigma_train, dtype=np.float64)
+    if mu_train.shape != mus_test.shape[1:]:
+      raise ValueError('All gaussians must have the same dimension.')
+    if sigma_train.shape != sigmas_test.shape[1:]:
+      raise ValueError('All gaussians must have the same dimension.')
+    sqrt_sigma_train = _sqrt_psd(sigma_train)
+    mu_diffs = mus_test - mu_train
+    for start in range(0, len(test_stats), batch_size):
+      end = start + batch_size
+      distances[start:end, j] = (
+          np.sum(mu_diffs[start:end]**2, axis=1) + traces_test[start:end] +
+          np.trace(sigma_train) - 2 *
+          _trace_sqrt_products(sigmas_test[start:end], sqrt_sigma_train))
+  return distances
@@ -47,7 +47,48 @@ def log_likelihood(particles, test_results,
    The log likelihood of the particles given the test results.
   """
   positive_in_groups = np.dot(groups, np.transpose(particles)) > 0
+  return _log_likelihood_of_positive_groups(
+      positive_in_groups, test_results, groups, log_specificity,
+      log_1msensitivity)
+
+
+@jax.jit
+def infected_in_groups(particles, groups):
+  """Counts the infected patients of each group in each particle.
+
+  Args:
+   particles: np.ndarray<bool>[n_particles, n_patients].
+   groups: np.ndarray<bool>[n_groups, n_patients].
+
+  Returns:
+   A np.ndarray<int>[n_groups, n_particles]. Flipping patient i of a particle
+   changes its column by +/- groups[:, i], so these counts can be kept up to
+   date as particles move, instead of recomputing the product with groups.
+  """
+  return np.dot(groups.astype(np.int32),
+                np.transpose(particles).astype(np.int32))
+
+
+@jax.jit
+def log_likelihood_from_counts(infected_counts, test_results,
+                               groups, log_specificity,
+                               log_1msensitivity):
+  """Same as log_likelihood, given the infected_in_groups of the particles."""
+  return _log_likelihood_of_positive_groups(
+      infected_counts > 0, test_results, groups, log_specificity,
+      log_1msensitivity)
+
+
+def _log_likelihood_of_positive_groups(positive_in_groups, test_results,
+                                       groups, log_specificity,
+                                       log_1msensitivity):
+  """Computes log_likelihood given which groups are positive in particles.
+
+  Empty groups, which pad_tests adds, are never positive and are excluded from
+  the constant term, so they do not change the log_likelihood.
+  """
   group_sizes = np.sum(groups, axis=1)
+  is_test = group_sizes > 0
   log_specificity = utils.select_from_sizes(log_specificity, group_sizes)
   log_1msensitivity = utils.select_from_sizes(log_1msensitivity, group_sizes)
   logit_specificity = special.logit(np.exp(log_specificity))
@@ -57,7 +98,39 @@ def log_likelihood(particles, test_results,
   ll = np.sum(
       positive_in_groups * (gamma + test_results * add_logits)[:, np.newaxis],
       axis=0)
-  return ll + np.sum(log_specificity - test_results * logit_specificity)
+  return ll + np.sum(
+      is_test * (log_specificity - test_results * logit_specificity))
+
+
+def pad_tests(log_probability_params, bucket_size):
+  """Pads the tests of log_probability parameters to a multiple of bucket_size.
+
+  The jitted functions of this module are compiled again for every new number
+  of tests. Padding the tests with empty groups, which do not change the
+  log_likelihood, lets all the numbers of tests of a bucket share one
+  compilation.
+
+  Args:
+    log_probability_params: Dict of parameters of log_probability.
+    bucket_size: int, the number of tests is rounded up to a multiple of it. No
+      padding is done if 0.
+
+  Returns:
+    A Dict of parameters of log_probability with the same log probabilities.
+  """
+  test_results = log_probability_params['test_results']
+  if test_results is None or not bucket_size:
+    return log_probability_params
+  padding = -test_results.shape[0] % bucket_size
+  if not padding:
+    return log_probability_params
+  groups = log_probability_params['groups']
+  return dict(
+      log_probability_params,
+      test_results=np.concatenate(
+          (test_results, np.zeros((padding,), dtype=test_results.dtype))),
+      groups=np.concatenate(
+          (groups, np.zeros((padding, groups.shape[1]), dtype=groups.dtype))))
 
 
 @jax.jit
@@ -106,6 +179,54 @@ def log_probability(particles,
   return log_prob
 
 
+@jax.jit
+def log_probability_from_counts(particles,
+                                infected_counts,
+                                test_results,
+                                groups,
+                                log_prior_specificity,
+                                log_prior_1msensitivity,
+                                prior_infection_rate):
+  """Same as log_probability, given the infected_in_groups of the particles.
+
+  Args:
+    particles: np.ndarray, computing tempered log_posterior for each of these.
+    infected_counts: np.ndarray<int>[n_groups, n_particles], the output of
+      infected_in_groups(particles, groups), or None if test_results is None.
+    test_results: np.ndarray, probability depends on recorded test results
+    groups: np.ndarray ... tests above defined using these groups.
+    log_prior_specificity: np.ndarray, specificity expected from test device
+    log_prior_1msensitivity: np.ndarray, 1-sensitivity expected from test device
+    prior_infection_rate: np.ndarray, prior on infection.
+  Returns:
+    a vector of log probabilities
+  """
+  log_prob = np.zeros((particles.shape[0],))
+  if test_results is not None:
+    log_prob += log_likelihood_from_counts(infected_counts, test_results,
+                                           groups, log_prior_specificity,
+                                           log_prior_1msensitivity)
+  if prior_infection_rate is not None:
+    log_prob += log_prior(particles, prior_infection_rate)
+  return log_prob
+
+
+def infected_counts_of_params(particles, log_probability_params):
+  """Returns infected_in_groups for the tests of log_probability_params.
+
+  Args:
+    particles: np.ndarray<bool>[n_particles, n_patients].
+    log_probability_params: Dict of parameters of log_probability.
+
+  Returns:
+    A np.ndarray<int>[n_groups, n_particles], or None if the parameters do not
+    contain test results.
+  """
+  if log_probability_params['test_results'] is None:
+    return None
+  return infected_in_groups(particles, log_probability_params['groups'])
+
+
 def tempered_logpos_logbase(particles,
                             log_posterior_params,
                             log_base_measure_params,
@@ -114,3 +235,28 @@ def tempered_logpos_logbase(particles,
   lp_p = log_probability(particles, **log_posterior_params)
   lp_b = log_probability(particles, **log_base_measure_params)
   return temperature * lp_p + lp_b
+
+
+def tempered_logpos_logbase_from_counts(particles,
+                                        infected_counts,
+                                        log_posterior_params,
+                                        log_base_measure_params,
+                                        temperature):
+  """Same as tempered_logpos_logbase, given the counts of both tests.
+
+  Args:
+    particles: np.ndarray<bool>[n_particles, n_patients].
+    infected_counts: pair with infected_counts_of_params of particles for
+      log_posterior_params and for log_base_measure_params.
+    log_posterior_params: Dict of parameters to compute log-posterior.
+    log_base_measure_params: Dict of parameters to compute log-base measure.
+    temperature: float, scaling for posterior.
+
+  Returns:
+    a vector of tempered log probabilities.
+  """
+  lp_p = log_probability_from_counts(particles, infected_counts[0],
+                                     **log_posterior_params)
+  lp_b = log_probability_from_counts(particles, infected_counts[1],
+                                     **log_base_measure_params)
+  return temperature * lp_p + lp_b
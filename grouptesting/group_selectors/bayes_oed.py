@@ -22,10 +22,13 @@ approach attempts to find groups that maximize the expected objective function
 under the current posterior.
 """
 
+import functools
 import itertools
+
 import gin
 import jax
 import jax.numpy as np
+import numpy as onp
 
 from grouptesting import metrics
 from grouptesting import utils
@@ -142,7 +145,9 @@ def group_utility(particle_weights,
   This function computes the utility of a set of groups, given a distribution
   over the population status encoded as a weighted sum of Dirac measures on
   particles, the specificities and sensitivities of tests, and a utility
-  function.
+  function. As in the wet lab, a group tests positive with probability its
+  sensitivity if it holds at least one infected patient, and one minus its
+  specificity otherwise.
 
   Args:
    particle_weights: weights of particles
@@ -157,7 +162,8 @@ def group_utility(particle_weights,
    The expected utility (over the test results) of the posterior
   """
   num_groups = groups.shape[0]
-  proba_y_is_one_given_x = (np.matmul(particles, np.transpose(groups))
+  positive_in_groups = np.matmul(particles, np.transpose(groups)) > 0
+  proba_y_is_one_given_x = (positive_in_groups
                             * (group_sensitivities + group_specificities - 1)
                             + 1.0 - group_specificities)
   proba_y_is_one_given_x = np.expand_dims(proba_y_is_one_given_x, axis=2)
@@ -173,64 +179,127 @@ def group_utility(particle_weights,
   return np.dot(proba_y, utility_x_given_y)
 
 
+@functools.partial(jax.jit, static_argnums=(6,))
+def _candidate_utilities(particle_weights,
+                         particles,
+                         previous_groups_prob_particles_states,
+                         positive_in_groups,
+                         sensitivity,
+                         specificity,
+                         utility_fun):
+  """Computes the utility of the previous groups with each candidate group.
+
+  Same as group_utility for each set made of the previous groups and one
+  candidate, with the test outcome probabilities of the previous groups
+  computed once for all candidates.
+
+  Args:
+   particle_weights: weights of particles
+   particles: particles summarizing belief about infection status
+   previous_groups_prob_particles_states: particles x test outcome
+     probabilities of the previous groups.
+   positive_in_groups: np.ndarray<bool>[n_candidates, n_particles], whether
+     each candidate group holds an infected patient in each particle.
+   sensitivity: sensitivity of the candidate groups.
+   specificity: specificity of the candidate groups.
+   utility_fun: a utility function that takes as input (particle_weights,
+      particles) and output the utility of the distribution
+
+  Returns:
+   The expected utility (over the test results) of the posterior, for each
+   candidate.
+  """
+  rho = specificity + sensitivity - 1
+  proba_y_is_one_given_x = np.transpose(
+      1 - specificity + rho * positive_in_groups)[:, :, np.newaxis]
+  previous = previous_groups_prob_particles_states[:, np.newaxis, :]
+  proba_y_given_x = np.concatenate(
+      ((1 - proba_y_is_one_given_x) * previous,
+       proba_y_is_one_given_x * previous),
+      axis=2)
+  proba_y_and_x = proba_y_given_x * particle_weights[:, np.newaxis, np.newaxis]
+  proba_y = np.sum(proba_y_and_x, axis=0)
+  proba_x_given_y = proba_y_and_x / proba_y[np.newaxis, :, :]
+  vutility_fun = jax.vmap(jax.vmap(utility_fun, [1, None]), [1, None])
+  utility_x_given_y = vutility_fun(proba_x_given_y, particles)
+  return np.sum(proba_y * utility_x_given_y, axis=1)
+
+
 def next_best_group(particle_weights,
                     particles,
-                    previous_groups,
+                    previous_groups_prob_particles_states,
                     cur_group,
+                    cur_infected,
                     sensitivity,
                     specificity,
                     utility_fun,
-                    backtracking):
+                    backtracking,
+                    candidate_batch_size=64):
   """Performs greedy utility optimization to compute the next best group.
 
-  Given a set of groups previous_groups, and a current candidate group
-  cur_group, this function computes the utility of the combination of
-  previous_groups and cur_group modified by adding (if backtracking = True) or
-  adding (if backtracking = False) on element to cur_group, and returns the
-  combination with largest utility.
+  Given a set of previous groups, and a current candidate group cur_group, this
+  function computes the utility of the combination of previous groups and
+  cur_group modified by removing (if backtracking = True) or adding (if
+  backtracking = False) one element to cur_group, and returns the
+  combination with largest utility. The candidates are evaluated in jitted
+  batches of candidate_batch_size, so that the memory does not grow with the
+  number of patients and the utility is compiled once.
 
   Args:
    particle_weights: weights of particles
    particles: particles summarizing belief about infection status
-   previous_groups: groups already chosen
+   previous_groups_prob_particles_states: particles x test outcome
+     probabilities of the groups already chosen.
    cur_group: group that we wish to optimize
+   cur_infected: number of infected patients of cur_group in each particle.
    sensitivity: value (vector) of sensitivity(-ies depending on group size).
    specificity: value (vector) of specificity(-ies depending on group size).
    utility_fun: function to compute the utility of a set of groups
    backtracking: (bool), True if removing rather than adding individuals.
+   candidate_batch_size: number of candidate groups evaluated at once.
 
   Returns:
    best_group : cur_group updated with best choice
+   best_infected : number of infected patients of best_group in each particle
    utility: utility of best_group
+   prob_particles_states : particles x test outcome probabilities of the
+     previous groups and best_group.
   """
-  if backtracking:
-    # Backward mode: test groups obtained by removing an item to cur_group
-    candidate_groups = np.logical_not(
-        mutual_information.add_ones_to_line(np.logical_not(cur_group)))
-  else:
-    # Forward mode: test groups obtained by adding an item to cur_group
-    candidate_groups = mutual_information.add_ones_to_line(cur_group)
-  n_candidates = candidate_groups.shape[0]
-
-  # Combine past groups with candidate groups
-  candidate_sets = np.concatenate(
-      (np.repeat(previous_groups[:, :, np.newaxis], n_candidates, axis=2),
-       np.expand_dims(np.transpose(candidate_groups), axis=0)),
-      axis=0)
-
-  # Compute utility of each candidate group
-  group_sizes = np.sum(candidate_sets[:, :, 0], axis=1)
-  group_sensitivities = utils.select_from_sizes(sensitivity, group_sizes)
-  group_specificities = utils.select_from_sizes(specificity, group_sizes)
-  group_util_fun = lambda x: group_utility(particle_weights, particles, x,
-                                           group_sensitivities,
-                                           group_specificities, utility_fun)
-  mgroup_util_fun = jax.vmap(group_util_fun, in_axes=2)
-  objectives = mgroup_util_fun(candidate_sets)
+  group_size = np.atleast_1d(np.sum(cur_group) + 1 - 2 * backtracking)
+  sensitivity = utils.select_from_sizes(sensitivity, group_size)
+  specificity = utils.select_from_sizes(specificity, group_size)
+  positive_in_groups = mutual_information.candidate_positives(
+      particles, cur_group, cur_infected)
+  # Backward mode removes an item of cur_group, forward mode adds one.
+  is_candidate = cur_group if backtracking else np.logical_not(cur_group)
+  candidates = onp.flatnonzero(onp.asarray(is_candidate))
+  num_batches = -(-len(candidates) // candidate_batch_size)
+  padded_candidates = onp.zeros(
+      (num_batches * candidate_batch_size,), dtype=candidates.dtype)
+  padded_candidates[:len(candidates)] = candidates
+
+  objectives = []
+  for batch in onp.split(padded_candidates, num_batches):
+    objectives.append(
+        _candidate_utilities(particle_weights, particles,
+                             previous_groups_prob_particles_states,
+                             positive_in_groups[batch, :], sensitivity,
+                             specificity, utility_fun))
+  objectives = np.concatenate(objectives)[:len(candidates)]
 
   # Greedy selection of largest value
   index = np.argmax(objectives)
-  return (candidate_groups[index, :], objectives[index])
+  patient = candidates[index]
+  best_group = jax.ops.index_update(cur_group, patient, not backtracking)
+  best_infected = cur_infected + (1 - 2 * backtracking) * particles[:, patient]
+  rho = specificity + sensitivity - 1
+  prob_positive = 1 - specificity + rho * positive_in_groups[patient, :]
+  prob_particles_states = np.concatenate(
+      ((1 - prob_positive)[:, np.newaxis] *
+       previous_groups_prob_particles_states,
+       prob_positive[:, np.newaxis] * previous_groups_prob_particles_states),
+      axis=1)
+  return best_group, best_infected, objectives[index], prob_particles_states
 
 
 @gin.configurable
@@ -242,45 +311,55 @@ class BayesOED(group_selector.GroupSelector):
   def __init__(self,
                forward_iterations=1,
                backward_iterations=0,
-               utility_fn=auc()):
+               utility_fn=auc(),
+               candidate_batch_size=64):
     if forward_iterations <= backward_iterations:
       raise ValueError('Forward should be greater than backward.')
     super().__init__()
     self.forward_iterations = forward_iterations
     self.backward_iterations = backward_iterations
     self.utility_fn = utility_fn
+    self.candidate_batch_size = candidate_batch_size
 
   def get_groups(self, rng, state):
     """A greedy forward-backward algorithm to pick groups with large utility."""
     particle_weights, particles = mutual_information.collapse_particles(
         rng, state.particle_weights, state.particles)
-    n_patients = particles.shape[1]
+    n_particles, n_patients = particles.shape
     iterations = [self.forward_iterations, self.backward_iterations]
 
+    previous_groups_prob_partstates = np.ones((n_particles, 1))
     chosen_groups = np.empty((0, n_patients), dtype=bool)
     added_groups_counter = 0
     while added_groups_counter < state.extra_tests_needed:
       # start forming a new group, and improve it greedily
       proposed_group = np.zeros((n_patients,), dtype=bool)
+      infected_in_proposed_group = np.zeros((n_particles,), dtype=np.int32)
       obj_old = -1
       while np.sum(proposed_group) < state.max_group_size:
         for steps, backtrack in zip(iterations, [False, True]):
           for _ in range(steps):
             # Extract candidate with largest utility
-            proposed_group, obj_new = next_best_group(particle_weights,
-                                                      particles,
-                                                      chosen_groups,
-                                                      proposed_group,
-                                                      state.prior_sensitivity,
-                                                      state.prior_specificity,
-                                                      self.utility_fn,
-                                                      backtracking=backtrack)
+            (proposed_group, infected_in_proposed_group, obj_new,
+             proposed_group_prob_partstates) = next_best_group(
+                 particle_weights,
+                 particles,
+                 previous_groups_prob_partstates,
+                 proposed_group,
+                 infected_in_proposed_group,
+                 state.prior_sensitivity,
+                 state.prior_specificity,
+                 self.utility_fn,
+                 backtracking=backtrack,
+                 candidate_batch_size=self.candidate_batch_size)
             if obj_new > obj_old + 1e-6:
               cur_group = proposed_group
+              cur_group_prob_partstates = proposed_group_prob_partstates
               obj_old = obj_new
             else:
               break
       # stop adding, form next group
+      previous_groups_prob_partstates = cur_group_prob_partstates
       chosen_groups = np.concatenate((chosen_groups, cur_group[np.newaxis, :]),
                                      axis=0)
       added_groups_counter += 1
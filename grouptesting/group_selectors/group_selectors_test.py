@@ -61,6 +61,7 @@ class GroupSelectorsTest(jax.test_util.JaxTestCase, parameterized.TestCase):
       bayes_oed.BayesOED(utility_fn=bayes_oed.auc()),
       bayes_oed.BayesOED(utility_fn=bayes_oed.entropy()),
       bayes_oed.BayesOED(utility_fn=bayes_oed.mean_sensitivity_specificity()),
+      bayes_oed.BayesOED(candidate_batch_size=3),
   ])
   def test_selector_with_particles(self, selector):
     sampler = sequential_monte_carlo.SmcSampler(num_particles=100)
@@ -71,6 +72,65 @@ class GroupSelectorsTest(jax.test_util.JaxTestCase, parameterized.TestCase):
     selector(rngs[1], self.state)
     self.assertGreater(np.size(self.state.groups_to_test), 0)
 
+  @parameterized.parameters([False, True])
+  def test_candidate_positives(self, backtracking):
+    rngs = jax.random.split(self.rng, 2)
+    particles = jax.random.uniform(rngs[0], (10, self.num_patients)) < 0.3
+    cur_group = jax.random.uniform(rngs[1], (self.num_patients,)) < 0.2
+    if backtracking:
+      candidate_groups = np.logical_not(mutual_information.add_ones_to_line(
+          np.logical_not(cur_group)))
+      is_candidate = cur_group
+    else:
+      candidate_groups = mutual_information.add_ones_to_line(cur_group)
+      is_candidate = np.logical_not(cur_group)
+    positives = mutual_information.candidate_positives(
+        particles, cur_group, np.dot(particles, cur_group.astype(np.int32)))
+    self.assertArraysEqual(
+        positives[is_candidate, :],
+        np.dot(candidate_groups, np.transpose(particles)) > 0)
+
+  @parameterized.parameters([False, True])
+  def test_candidate_utilities(self, backtracking):
+    # Each particle has two or three infected patients in cur_group, and the
+    # previous group holds three infected patients of the first particle. The
+    # particles are integers, so that products with the groups count the
+    # infected patients instead of telling whether there is one.
+    particles = np.array([[1, 1, 1, 0, 0, 1],
+                          [1, 1, 0, 1, 0, 0],
+                          [0, 1, 1, 1, 1, 0]], dtype=np.int32)
+    particle_weights = np.array([0.5, 0.3, 0.2])
+    cur_group = np.array([True, True, True, False, False, False])
+    previous_group = np.array([True, False, True, False, False, True])
+    sensitivity = np.array([0.7])
+    specificity = np.array([0.9])
+    utility_fn = bayes_oed.entropy()
+
+    prob_positive = np.where(np.dot(particles, previous_group) > 0,
+                             sensitivity[0], 1 - specificity[0])
+    previous_prob_particles_states = np.stack(
+        (1 - prob_positive, prob_positive), axis=1)
+    positives = mutual_information.candidate_positives(
+        particles, cur_group, np.dot(particles, cur_group.astype(np.int32)))
+    utilities = bayes_oed._candidate_utilities(
+        particle_weights, particles, previous_prob_particles_states,
+        positives, sensitivity, specificity, utility_fn)
+
+    if backtracking:
+      candidate_groups = np.logical_not(mutual_information.add_ones_to_line(
+          np.logical_not(cur_group)))
+      is_candidate = cur_group
+    else:
+      candidate_groups = mutual_information.add_ones_to_line(cur_group)
+      is_candidate = np.logical_not(cur_group)
+    expected = [
+        bayes_oed.group_utility(
+            particle_weights, particles,
+            np.stack((previous_group, candidate_group)),
+            np.repeat(sensitivity, 2), np.repeat(specificity, 2), utility_fn)
+        for candidate_group in candidate_groups]
+    self.assertArraysAllClose(utilities[is_candidate], np.array(expected))
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -47,10 +47,81 @@ def collapse_particles(rng, particle_weights, particles):
   return new_weights, new_particles
 
 
+def candidate_positives(particles, cur_group, cur_infected):
+  """Positive particles of the groups one patient away from cur_group.
+
+  Candidate group i is cur_group with patient i added if it is not in
+  cur_group, or removed if it is. Keeping the number of infected patients of
+  cur_group in each particle, rather than whether there is one, makes both
+  directions a vectorized update instead of a product with the candidates.
+
+  Args:
+   particles: particles summarizing belief about infection status
+   cur_group: np.ndarray<bool>[n_patients], group currently considered.
+   cur_infected: np.ndarray<int>[n_particles], number of infected patients of
+     cur_group in each particle.
+
+  Returns:
+   A np.ndarray<bool>[n_patients, n_particles], the positive_in_groups of the
+   n_patients candidate groups.
+  """
+  toggles = np.where(cur_group, -1, 1)
+  infected = cur_infected[np.newaxis, :] + (
+      toggles[:, np.newaxis] * np.transpose(particles))
+  return infected > 0
+
+
+@jax.jit
+def _mi_objectives(particle_weights,
+                   positive_in_groups,
+                   is_candidate,
+                   previous_groups_prob_particles_states,
+                   previous_groups_cumcond_entropy,
+                   sensitivity,
+                   specificity):
+  """Joint mutual information of previous groups with each candidate group.
+
+  Args:
+   particle_weights: weights of particles
+   positive_in_groups: np.ndarray<bool>[n_candidates, n_particles].
+   is_candidate: np.ndarray<bool>[n_candidates], False for the candidates to
+     ignore.
+   previous_groups_prob_particles_states: particles x test outcome probabilities
+   previous_groups_cumcond_entropy: previous conditional entropies
+   sensitivity: sensitivity of the candidate groups.
+   specificity: specificity of the candidate groups.
+
+  Returns:
+   objectives: np.ndarray[n_candidates], -inf for the ignored candidates.
+   cond_entropy: np.ndarray[n_candidates], the conditional entropies of the
+     previous groups and each candidate.
+  """
+  entropy_spec = metrics.binary_entropy(specificity)
+  gamma = metrics.binary_entropy(sensitivity) - entropy_spec
+  cond_entropy = (previous_groups_cumcond_entropy + entropy_spec +
+                  gamma * np.dot(positive_in_groups, particle_weights))
+  rho = specificity + sensitivity - 1
+
+  # Probability of all 2^j possible test results of the previous groups and a
+  # candidate, averaged over particles without forming the candidates x
+  # particles x states tensor.
+  weighted_prob_particles_states = (
+      particle_weights[:, np.newaxis] * previous_groups_prob_particles_states)
+  prob_positive = 1 - specificity + rho * positive_in_groups
+  new_plus_previous_groups_prob_states = np.concatenate(
+      (np.dot(1 - prob_positive, weighted_prob_particles_states),
+       np.dot(prob_positive, weighted_prob_particles_states)),
+      axis=1)
+  whole_entropy = metrics.entropy(
+      new_plus_previous_groups_prob_states, axis=1)
+  objectives = np.where(is_candidate, whole_entropy - cond_entropy, -np.inf)
+  return objectives, cond_entropy
+
+
 def joint_mi_criterion_mg(particle_weights,
                           particles,
                           cur_group,
-                          cur_positives,
+                          cur_infected,
                           previous_groups_prob_particles_states,
                           previous_groups_cumcond_entropy,
                           sensitivity,
@@ -59,7 +130,9 @@ def joint_mi_criterion_mg(particle_weights,
   """Compares the benefit of adding one group to previously selected ones.
 
   Groups are formed iteratively by considering all possible individuals
-  that can be considered to add (or remove if backtracking).
+  that can be considered to add (or remove if backtracking). All these
+  candidates are scored at once by a jitted function whose shapes do not
+  depend on cur_group.
 
   If the sensitivity and/or specificity parameters are group size dependent,
   we take that into account in our optimization.
@@ -74,7 +147,7 @@ def joint_mi_criterion_mg(particle_weights,
    particle_weights: weights of particles
    particles: particles summarizing belief about infection status
    cur_group: group currently considered to add to former groups.
-   cur_positives: stores which particles would test positive w.r.t cur_group
+   cur_infected: number of infected patients of cur_group in each particle.
    previous_groups_prob_particles_states: particles x test outcome probabilities
    previous_groups_cumcond_entropy: previous conditional entropies
    sensitivity: value (vector) of sensitivity(-ies depending on group size).
@@ -83,8 +156,8 @@ def joint_mi_criterion_mg(particle_weights,
 
   Returns:
     cur_group : group updated with best choice
-    cur_positives : bool vector keeping trace of whether particles
-                             would test or not positive
+    cur_infected : number of infected patients of the updated group in each
+      particle
     new_objective : MI reached with this new group
     prob_particles_states : if cur_group were to be selected, this matrix
       would keep track of probability of seeing one of 2^j possible test
@@ -95,87 +168,32 @@ def joint_mi_criterion_mg(particle_weights,
   group_size = np.atleast_1d(np.sum(cur_group) + 1 - 2 * backtracking)
   sensitivity = utils.select_from_sizes(sensitivity, group_size)
   specificity = utils.select_from_sizes(specificity, group_size)
-  if backtracking:
-    # if backtracking, we recompute the truth table for all proposed groups,
-    # namely run the np.dot below
-    # TODO(cuturi)? If we switch to integer arithmetic we may be able to
-    # save on this iteration by keeping track of how many positives there
-    # are, and not just on whether there is or not one positive.
-    candidate_groups = np.logical_not(
-        add_ones_to_line(np.logical_not(cur_group)))
-    positive_in_groups = np.dot(candidate_groups, np.transpose(particles)) > 0
-  else:
-    # in forward mode, candidate groups are recovered by adding
-    # a 1 instead of zeros. Therefore, we can use previous vector of positive
-    # in groups to simply compute all positive in groups for candidates
-    indices_of_false_in_cur_group, = np.where(np.logical_not(cur_group))
-    positive_in_groups = np.logical_or(
-        cur_positives[:, np.newaxis],
-        particles[:, indices_of_false_in_cur_group])
-    # recover a candidates x n_particles matrix
-    positive_in_groups = np.transpose(positive_in_groups)
-
-  entropy_spec = metrics.binary_entropy(specificity)
-  gamma = metrics.binary_entropy(sensitivity) - entropy_spec
-  cond_entropy = previous_groups_cumcond_entropy + entropy_spec + gamma * np.sum(
-      particle_weights[np.newaxis, :] * positive_in_groups, axis=1)
-  rho = specificity + sensitivity - 1
+  is_candidate = cur_group if backtracking else np.logical_not(cur_group)
+  positive_in_groups = candidate_positives(particles, cur_group, cur_infected)
+  objectives, cond_entropy = _mi_objectives(
+      particle_weights, positive_in_groups, is_candidate,
+      previous_groups_prob_particles_states, previous_groups_cumcond_entropy,
+      sensitivity, specificity)
 
-  # positive_in_groups defines probability of two possible outcomes for the test
-  # of each new candidate group.
-  probabilities_new_test = np.stack(
-      (specificity - rho * positive_in_groups,
-       1 - specificity + rho * positive_in_groups),
-      axis=-1)
-  # we now incorporate previous probability of all previous groups added so far
-  # and expand x 2 the state space of possible test results.
-  new_plus_previous_groups_prob_particles_states = np.concatenate(
-      (probabilities_new_test[:, :, 0][:, :, np.newaxis] *
-       previous_groups_prob_particles_states[np.newaxis, :, :],
-       probabilities_new_test[:, :, 1][:, :, np.newaxis] *
-       previous_groups_prob_particles_states[np.newaxis, :, :]),
-      axis=2)
-
-  # average over particles to recover probability of all 2^j possible
-  # test results
-  new_plus_previous_groups_prob_states = np.sum(
-      particle_weights[np.newaxis, :, np.newaxis] *
-      new_plus_previous_groups_prob_particles_states,
-      axis=1)
-
-  whole_entropy = metrics.entropy(
-      new_plus_previous_groups_prob_states, axis=1)
-
-  # exhaustive way to compute cond entropy, useful to check
-  # computations.
-  # cond_entropy_old = np.sum(
-  #     particle_weights[np.newaxis, :] *
-  #     entropy(new_plus_previous_groups_prob_particles_states, axis=2),
-  #     axis=1)
-  objectives = whole_entropy - cond_entropy
-
-  # greedy selection of largest/smallest value
+  # greedy selection of largest value
   index = np.argmax(objectives)
-
   if backtracking:
-    # return most promising group by recovering it from the matrix directly
     logging.info('backtracking, candidate_groups size: %i',
-                 candidate_groups.shape)
-    cur_group = candidate_groups[index, :]
-
-  else:
-    # return most promising group by adding a 1
-    cur_group = jax.ops.index_update(
-        cur_group, indices_of_false_in_cur_group[index], True)
+                 np.sum(is_candidate))
+  cur_group = jax.ops.index_update(cur_group, index, not backtracking)
+  cur_infected = cur_infected + (1 - 2 * backtracking) * particles[:, index]
 
-  # refresh the status of vector positives
-  cur_positives = positive_in_groups[index, :]
-  new_objective = objectives[index]
-  prob_particles_states = new_plus_previous_groups_prob_particles_states[
-      index, :, :]
-  new_cond_entropy = cond_entropy[index]
-  return (cur_group, cur_positives, new_objective,
-          prob_particles_states, new_cond_entropy)
+  # probability of the 2^j possible test outcomes of each particle once the
+  # chosen group is added.
+  rho = specificity + sensitivity - 1
+  prob_positive = 1 - specificity + rho * positive_in_groups[index, :]
+  prob_particles_states = np.concatenate(
+      ((1 - prob_positive)[:, np.newaxis] *
+       previous_groups_prob_particles_states,
+       prob_positive[:, np.newaxis] * previous_groups_prob_particles_states),
+      axis=1)
+  return (cur_group, cur_infected, objectives[index],
+          prob_particles_states, cond_entropy[index])
 
 
 def add_ones_to_line(single_group):
@@ -216,7 +234,7 @@ class MaxMutualInformation(group_selector.GroupSelector):
     while added_groups_counter < state.extra_tests_needed:
       # start forming a new group, and evaluate all possible groups
       proposed_group = np.zeros((n_patients,), dtype=bool)
-      positives_in_proposed_group = np.zeros((n_particles,), dtype=bool)
+      infected_in_proposed_group = np.zeros((n_particles,), dtype=np.int32)
       proposed_group_size = 0
       obj_old = -1
       forward_it = self.forward_iterations
@@ -230,13 +248,13 @@ class MaxMutualInformation(group_selector.GroupSelector):
         for steps, backtrack in zip(iterations, [False, True]):
           for _ in range(steps):
             # extract candidate with largest potential
-            (proposed_group, positives_in_proposed_group, obj_new,
+            (proposed_group, infected_in_proposed_group, obj_new,
              proposed_group_prob_partstates,
              proposed_group_cumcond_entropy) = joint_mi_criterion_mg(
                  particle_weights,
                  particles,
                  proposed_group,
-                 positives_in_proposed_group,
+                 infected_in_proposed_group,
                  previous_groups_prob_partstates,
                  previous_groups_cumcond_entropy,
                  state.prior_sensitivity,
@@ -249,7 +267,7 @@ class MaxMutualInformation(group_selector.GroupSelector):
           cur_group = proposed_group
           cur_groups_cumcond_entropy = proposed_group_cumcond_entropy
           cur_groups_recorded_prob_partstates = proposed_group_prob_partstates
-          # cur_positives = positives_in_proposed_group
+          # cur_infected = infected_in_proposed_group
           obj_old = obj_new
           proposed_group_size += (forward_it - backward_it)
           # correction on backward_it done to ensure one is able to get to
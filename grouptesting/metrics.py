@@ -53,6 +53,10 @@ def entropy(table, axis=0):
 class Metrics:
   """Some metrics to be kept while simulating."""
 
+  # Arrays holding the metrics, indexed by simulation first.
+  ARRAY_NAMES = ('marginals', 'ground_truth', 'groups', 'test_results',
+                 'lbp_convergence', 'smc_convergence')
+
   def __init__(self,
                workdir=None,
                num_simulations=0,
@@ -99,6 +103,15 @@ class Metrics:
     if smc_convergence is not None:
       self.smc_convergence[simulation, cycle] = smc_convergence
 
+  def simulation_arrays(self, simulation):
+    """Returns the metrics of one simulation, as a dict of arrays."""
+    return {name: getattr(self, name)[simulation] for name in self.ARRAY_NAMES}
+
+  def set_simulation_arrays(self, simulation, arrays):
+    """Sets the metrics of one simulation from simulation_arrays."""
+    for name, value in arrays.items():
+      getattr(self, name)[simulation] = value
+
   def load(self):
     """Loads metrics from files."""
     filenames = glob.glob(os.path.join(self.workdir, '*.npy'))
@@ -115,14 +128,10 @@ class Metrics:
     if not os.path.exists(self.workdir):
       os.makedirs(self.workdir)
 
-    names = ['marginals', 'ground_truth', 'groups',
-             'test_results', 'lbp_convergence', 'smc_convergence']
-    arrays = [self.marginals, self.ground_truth, self.groups,
-              self.test_results, self.lbp_convergence, self.smc_convergence]
-    for arr, name in zip(arrays, names):
+    for name in self.ARRAY_NAMES:
       output_file = os.path.join(self.workdir, f'{name}.npy')
       with open(output_file, 'wb') as fp:
-        onp.save(fp, arr)
+        onp.save(fp, getattr(self, name))
 
   def _merge_one(self, other, name):
     """Merges one a single metrics from another object with the current one."""
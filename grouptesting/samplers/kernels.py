@@ -103,6 +103,99 @@ def gibbs_kernel(rng,
   return rng_particles[1]
 
 
+def _flip_counts(infected_counts, groups, i, flip_signs):
+  """Counts of infected_in_groups once patient i is flipped in all particles."""
+  if infected_counts is None:
+    return None
+  return (infected_counts +
+          groups[:, i].astype(np.int32)[:, np.newaxis] * flip_signs)
+
+
+def _select_counts(flipped_at_i, infected_counts_flipped, infected_counts):
+  """Keeps the counts of the flipped particles where the flip was accepted."""
+  if infected_counts is None:
+    return None
+  return np.where(flipped_at_i, infected_counts_flipped, infected_counts)
+
+
+@jax.jit
+def gibbs_kernel_with_counts(rng,
+                             particles,
+                             infected_counts,
+                             rho,
+                             log_posterior_params,
+                             log_base_measure_params,
+                             cycles = 2,
+                             liu_modification = True):
+  """Same as gibbs_kernel, keeping the infected counts of tested groups.
+
+  Instead of multiplying the flipped particles with all the tested groups to
+  evaluate their likelihood, the number of infected patients of each group
+  (see bayes.infected_in_groups) is updated with the groups of the flipped
+  patient, and only kept for the particles whose flip was accepted. Particles
+  and random draws are the same as with gibbs_kernel.
+
+  Args:
+   rng: np.ndarray<int> random key.
+   particles: np.ndarray [n_particles,n_patients] plausible infections states.
+   infected_counts: pair with bayes.infected_counts_of_params of particles for
+     log_posterior_params and for log_base_measure_params.
+   rho: float, scaling for posterior.
+   log_posterior_params: Dict of parameters to compute log-posterior.
+   log_base_measure_params: Dict of parameters to compute log-base measure.
+   cycles: the number of times we want of do Gibbs sampling.
+   liu_modification : use or not Liu's modification.
+
+  Returns:
+   A np.array representing the new particles and the pair of their infected
+   counts.
+  """
+
+  def gibbs_loop(i, state):
+    rng, particles, infected_counts, log_posteriors = state
+    i = i % num_patients
+    # +1 for the particles where i becomes infected, -1 otherwise.
+    flip_signs = 1 - 2 * particles[:, i].astype(np.int32)
+    particles_flipped = jax.ops.index_update(particles, jax.ops.index[:, i],
+                                             np.logical_not(particles[:, i]))
+    infected_counts_flipped = [
+        _flip_counts(counts, params['groups'], i, flip_signs)
+        for counts, params in zip(
+            infected_counts, (log_posterior_params, log_base_measure_params))
+    ]
+    log_posteriors_flipped_at_i = bayes.tempered_logpos_logbase_from_counts(
+        particles_flipped, infected_counts_flipped, log_posterior_params,
+        log_base_measure_params, rho)
+    if liu_modification:
+      log_proposal_ratio = log_posteriors_flipped_at_i - log_posteriors
+    else:
+      log_proposal_ratio = log_posteriors_flipped_at_i - np.logaddexp(
+          log_posteriors_flipped_at_i, log_posteriors)
+    rng, rng_unif = jax.random.split(rng, 2)
+    random_values = jax.random.uniform(rng_unif, particles.shape[:1])
+    flipped_at_i = np.log(random_values) < log_proposal_ratio
+    selected_at_i = np.logical_xor(flipped_at_i, particles[:, i])
+    particles = jax.ops.index_update(
+        particles, jax.ops.index[:, i], selected_at_i)
+    infected_counts = [
+        _select_counts(flipped_at_i, flipped, counts)
+        for flipped, counts in zip(infected_counts_flipped, infected_counts)
+    ]
+    log_posteriors = np.where(
+        flipped_at_i, log_posteriors_flipped_at_i, log_posteriors)
+    return [rng, particles, infected_counts, log_posteriors]
+
+  num_patients = particles.shape[1]
+  infected_counts = list(infected_counts)
+
+  log_posteriors = bayes.tempered_logpos_logbase_from_counts(
+      particles, infected_counts, log_posterior_params,
+      log_base_measure_params, rho)
+  state = jax.lax.fori_loop(0, cycles * num_patients, gibbs_loop,
+                            [rng, particles, infected_counts, log_posteriors])
+  return state[1], tuple(state[2])
+
+
 @gin.configurable
 class Gibbs:
   """A Gibbs sampler."""
@@ -123,6 +216,15 @@ class Gibbs:
                         log_base_measure_params,
                         self.cycles)
 
+  def with_counts(self, rng, particles, infected_counts, rho,
+                  log_posterior_params,
+                  log_base_measure_params):
+    """Same as __call__, also returning the updated infected counts."""
+    return gibbs_kernel_with_counts(rng, particles, infected_counts, rho,
+                                    log_posterior_params,
+                                    log_base_measure_params,
+                                    self.cycles)
+
   def fit_model(self, particle_weights, particles):
     """Because Gibbs sampler do not use any model, we return nothing."""
     del particle_weights, particles
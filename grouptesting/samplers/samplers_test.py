@@ -53,6 +53,24 @@ class SamplersTest(jax.test_util.JaxTestCase, parameterized.TestCase):
     self.assertEqual(sampler.particles.shape,
                      (num_particles, self.state.num_patients))
 
+  def test_sequential_monte_carlo_infected_counts(self):
+    samplers = [
+        sequential_monte_carlo.SmcSampler(
+            num_particles=50, cache_infected_counts=cache)
+        for cache in (False, True)
+    ]
+    rngs = jax.random.split(self.rng, 2)
+    for i in range(2):
+      groups = jax.random.uniform(
+          rngs[i], (3, self.state.num_patients)) < 0.1
+      self.state.add_past_groups(groups)
+      self.state.add_test_results(groups[:, 0])
+      for sampler in samplers:
+        sampler.produce_sample(rngs[i], self.state)
+      self.assertArraysEqual(samplers[0].particles, samplers[1].particles)
+      self.assertArraysAllClose(samplers[0].particle_weights,
+                                samplers[1].particle_weights)
+
   def test_belief_propagation(self):
     sampler = loopy_belief_propagation.LbpSampler()
     self.assertIsNone(sampler.particles)
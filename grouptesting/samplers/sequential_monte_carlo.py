@@ -30,6 +30,18 @@ from grouptesting.samplers import sampler
 from grouptesting.samplers import temperature
 
 
+def _pad_counts(infected_counts, log_probability_params):
+  """Pads infected counts with the zero counts of bayes.pad_tests tests."""
+  if infected_counts is None:
+    return None
+  padding = (log_probability_params['test_results'].shape[0] -
+             infected_counts.shape[0])
+  return np.concatenate(
+      (infected_counts,
+       np.zeros((padding, infected_counts.shape[1]),
+                dtype=infected_counts.dtype)))
+
+
 @gin.configurable
 class SmcSampler(sampler.Sampler):
   """Sequential monte carlo sampler."""
@@ -44,7 +56,9 @@ class SmcSampler(sampler.Sampler):
                min_kernel_iterations: int = 2,
                max_kernel_iterations: int = 20,
                min_ratio_delta: float = 0.02,
-               target_unique_ratio: float = 0.95):
+               target_unique_ratio: float = 0.95,
+               cache_infected_counts: bool = True,
+               test_bucket_size: int = 0):
     """Initializes SmcSampler object.
 
     Args:
@@ -63,6 +77,14 @@ class SmcSampler(sampler.Sampler):
         ratio values goes below that value, MH kernel refreshes is stopped.
       target_unique_ratio: when unique ratio (number of unique particles /
         num_particles) goes above that value we stop.
+      cache_infected_counts: if True and the kernel supports it, keeps the
+        number of infected patients of each tested group in each particle
+        (see bayes.infected_in_groups). The kernel then updates these counts
+        for the particles it flips, and across test rounds only the counts of
+        new tests are computed.
+      test_bucket_size: if positive, the tests are padded with empty groups to
+        a multiple of test_bucket_size (see bayes.pad_tests), so that cycles
+        with different numbers of tests reuse the same compiled kernels.
     """
     super().__init__()
     self._kernel = kernel
@@ -73,11 +95,16 @@ class SmcSampler(sampler.Sampler):
     self._max_kernel_iterations = max_kernel_iterations
     self._min_ratio_delta = min_ratio_delta
     self._target_unique_ratio = target_unique_ratio
+    self._cache_infected_counts = cache_infected_counts
+    self._test_bucket_size = test_bucket_size
     self._sampled_up_to = 0
+    # Infected counts of self.particles for the first _sampled_up_to tests.
+    self._infected_counts = None
 
   def reset(self):
     super().reset()
     self._sampled_up_to = 0
+    self._infected_counts = None
 
   @property
   def is_cheap(self):
@@ -107,6 +134,7 @@ class SmcSampler(sampler.Sampler):
           jax.random.uniform(rng, shape=shape) < state.prior_infection_rate)
       self.particle_weights = np.ones(
           (self._num_particles,))/self._num_particles
+      self._infected_counts = None
     else:
       rngs = jax.random.split(rng, 2)
       # if we have never sampled before particles, resample field is True
@@ -146,8 +174,28 @@ class SmcSampler(sampler.Sampler):
         sampling_from_scratch,
         self._start_from_prior,
         self._sampled_up_to)
+    infected_counts = None
+    if (self._cache_infected_counts and
+        hasattr(self._kernel, 'with_counts')):
+      infected_counts = self._initial_infected_counts(
+          particles, sampling_from_scratch, log_posterior_params,
+          log_base_measure_params)
+      num_tests = [
+          counts if counts is None else counts.shape[0]
+          for counts in infected_counts
+      ]
+    log_posterior_params = bayes.pad_tests(log_posterior_params,
+                                           self._test_bucket_size)
+    log_base_measure_params = bayes.pad_tests(log_base_measure_params,
+                                              self._test_bucket_size)
+    if infected_counts is not None:
+      infected_counts = tuple(
+          _pad_counts(counts, params) for counts, params in zip(
+              infected_counts,
+              (log_posterior_params, log_base_measure_params)))
     # add log weights to dictionary of log_prior parameters
-    log_posterior = bayes.log_probability(particles, **log_posterior_params)
+    log_posterior = self._log_posterior(particles, infected_counts,
+                                        log_posterior_params)
     alpha, log_tempered_probability = temperature.find_step_length(
         0, log_posterior)
     rho = alpha
@@ -157,17 +205,70 @@ class SmcSampler(sampler.Sampler):
       print(f'Sampling {rho:.0%}', end='\r')
       rng, *rngs = jax.random.split(rng, 3)
       self._kernel.fit_model(particle_weights, particles)
-      particles = particles[self.resample(rngs[0], particle_weights), :]
-      particles = self.move(rngs[1], particles, rho,
-                            log_posterior_params, log_base_measure_params)
-      log_posterior = bayes.log_probability(particles, **log_posterior_params)
+      indices = self.resample(rngs[0], particle_weights)
+      particles = particles[indices, :]
+      if infected_counts is not None:
+        infected_counts = tuple(counts if counts is None else counts[:, indices]
+                                for counts in infected_counts)
+      particles, infected_counts = self.move(rngs[1], particles, rho,
+                                             log_posterior_params,
+                                             log_base_measure_params,
+                                             infected_counts)
+      log_posterior = self._log_posterior(particles, infected_counts,
+                                          log_posterior_params)
       alpha, log_tempered_probability = temperature.find_step_length(
           rho, log_posterior)
       particle_weights = temperature.importance_weights(
           log_tempered_probability)
       rho = rho + alpha
+    if infected_counts is not None:
+      # The base measure holds the tests before the posterior ones.
+      self._infected_counts = np.concatenate(
+          [counts[:n] for counts, n in reversed(
+              list(zip(infected_counts, num_tests))) if counts is not None],
+          axis=0)
     return particle_weights, particles
 
+  def _initial_infected_counts(self,
+                               particles,
+                               sampling_from_scratch,
+                               log_posterior_params,
+                               log_base_measure_params):
+    """Infected counts of particles for the posterior and base measure tests.
+
+    When continuing from the previous particles, the base measure tests are
+    the ones these particles were sampled with, so their counts are reused and
+    only the counts of the new tests are computed.
+
+    Args:
+      particles: np.ndarray<bool>[n_particles, n_patients].
+      sampling_from_scratch: whether the particles were sampled from scratch.
+      log_posterior_params: dict of parameters to evaluate posterior.
+      log_base_measure_params: dict of parameters to evaluate base measure.
+
+    Returns:
+      pair of bayes.infected_counts_of_params of the particles for both dicts.
+    """
+    posterior_counts = bayes.infected_counts_of_params(particles,
+                                                       log_posterior_params)
+    base_test_results = log_base_measure_params['test_results']
+    if (not sampling_from_scratch and self._infected_counts is not None and
+        base_test_results is not None and
+        self._infected_counts.shape == (base_test_results.shape[0],
+                                        particles.shape[0])):
+      base_counts = self._infected_counts
+    else:
+      base_counts = bayes.infected_counts_of_params(particles,
+                                                    log_base_measure_params)
+    return posterior_counts, base_counts
+
+  def _log_posterior(self, particles, infected_counts, log_posterior_params):
+    """Log posterior of the particles, from their counts if available."""
+    if infected_counts is None:
+      return bayes.log_probability(particles, **log_posterior_params)
+    return bayes.log_probability_from_counts(particles, infected_counts[0],
+                                             **log_posterior_params)
+
   def resample(self,
                rng: int,
                particle_weights: np.ndarray) -> np.ndarray:
@@ -202,7 +303,8 @@ class SmcSampler(sampler.Sampler):
            particles: np.ndarray,
            rho: float,
            log_posterior_params: Dict[str, np.ndarray],
-           log_base_measure_params: Dict[str, np.ndarray]):
+           log_base_measure_params: Dict[str, np.ndarray],
+           infected_counts=None):
     """Applies the kernel until particles are sufficiently refreshed.
 
     Args:
@@ -211,9 +313,12 @@ class SmcSampler(sampler.Sampler):
       rho : temperature, between 0 and 1
       log_posterior_params : dict of parameters to evaluate posterior
       log_base_measure_params : dict of parameters to evaluate base measure
+      infected_counts : None, or pair of infected counts of the particles for
+        both dicts, updated by the kernel's with_counts method.
 
     Returns:
-      a np.ndarray of particles of the same size as the input.
+      a np.ndarray of particles of the same size as the input, and their
+      infected counts (None if infected_counts is None).
     """
     num_particles = particles.shape[0]
     rng, rng_uniques = jax.random.split(rng, 2)
@@ -221,9 +326,14 @@ class SmcSampler(sampler.Sampler):
 
     for it in range(self._max_kernel_iterations):
       rng, *rngs = jax.random.split(rng, 3)
-      particles = self._kernel(rngs[0], particles, rho,
-                               log_posterior_params,
-                               log_base_measure_params)
+      if infected_counts is None:
+        particles = self._kernel(rngs[0], particles, rho,
+                                 log_posterior_params,
+                                 log_base_measure_params)
+      else:
+        particles, infected_counts = self._kernel.with_counts(
+            rngs[0], particles, infected_counts, rho, log_posterior_params,
+            log_base_measure_params)
 
       old_unique_ratio = unique_ratio
       unique_ratio = utils.unique(rngs[1], particles) / num_particles
@@ -234,4 +344,4 @@ class SmcSampler(sampler.Sampler):
           unique_ratio > self._target_unique_ratio):
         break
 
-    return particles
+    return particles, infected_counts
@@ -16,6 +16,8 @@
 # Lint as: python3
 """Simulates an environment to try Group testing Strategies."""
 
+import copy
+import multiprocessing
 import time
 from typing import Iterable, Union
 
@@ -66,7 +68,8 @@ class Simulator(object):
                prior_sensitivity = 0.85,
                prior_infection_rate = 0.05,
                metrics_cls=metrics.Metrics,
-               export_metrics_every = 5):
+               export_metrics_every = 5,
+               num_workers = 1):
     """Initializes simulation.
 
     Args:
@@ -97,6 +100,11 @@ class Simulator(object):
       metrics_cls: class of metrics object used to store results.
       export_metrics_every: frequency of exports to file when carrying our
         num_simulations results.
+      num_workers: number of processes running the simulations. Each process
+        gets a copy of the simulator, compiles the jitted functions once and
+        reuses them for all its simulations, and sends the metrics of each
+        simulation back as soon as it is over. The wetlab, policy and samplers
+        must therefore be picklable.
     """
 
     self._wetlab = wetlab
@@ -111,6 +119,8 @@ class Simulator(object):
                              prior_infection_rate,
                              prior_specificity,
                              prior_sensitivity)
+    self._metrics_cls = metrics_cls
+    self._num_workers = num_workers
     self.metrics = metrics_cls(
         workdir,
         self._num_simulations,
@@ -135,25 +145,81 @@ class Simulator(object):
     return self._samplers[-1]
 
   def run(self, rngkey=None):
-    """Runs sequentially all simulations."""
+    """Runs all simulations, sequentially or in num_workers processes.
+
+    Each simulation gets the same random key, hence the same results, in both
+    cases.
+
+    Args:
+     rngkey: a random seed for the simulations.
+    """
     if self._num_simulations > 1 and self._wetlab.freeze_diseased:
       logging.warning("Running several simulations with the exact same group of"
                       " patients. You might want to consider using the "
                       "freeze_diseased=False parameter to the WetLab.")
     rngkey = int(time.time()) if rngkey is None else rngkey
     rng = jax.random.PRNGKey(rngkey)
-    for sim_idx in range(self._num_simulations):
-      logging.debug("Starting experiment %s", sim_idx)
+    sim_rngs = []
+    for _ in range(self._num_simulations):
       rng, sim_rng = jax.random.split(rng)
-      self.run_simulation(sim_rng, sim_idx)
-
-      for i in range(self.state.curr_cycle, self._max_test_cycles):
-        self._on_iteration_end(sim_idx, i)
+      sim_rngs.append(sim_rng)
 
-      if (sim_idx % self._export_every == 0 or
-          sim_idx == self._num_simulations - 1):
+    if self._num_workers > 1 and self._num_simulations > 1:
+      finished = self._run_in_workers(sim_rngs)
+    else:
+      finished = (self.run_full_simulation(sim_rng, sim_idx)
+                  for sim_idx, sim_rng in enumerate(sim_rngs))
+    for num_finished, _ in enumerate(finished):
+      if (num_finished % self._export_every == 0 or
+          num_finished == self._num_simulations - 1):
         self.metrics.export()
 
+  def run_full_simulation(self, rng, sim_idx):
+    """Runs one simulation and records metrics for all max_test_cycles.
+
+    Args:
+     rng: the random key of the simulation.
+     sim_idx: (int) the index of the simulation.
+
+    Returns:
+     sim_idx.
+    """
+    logging.debug("Starting experiment %s", sim_idx)
+    self.run_simulation(rng, sim_idx)
+    for i in range(self.state.curr_cycle, self._max_test_cycles):
+      self._on_iteration_end(sim_idx, i)
+    return sim_idx
+
+  def _run_in_workers(self, sim_rngs):
+    """Runs the simulations in a pool of processes.
+
+    Args:
+     sim_rngs: the random key of each simulation.
+
+    Yields:
+     The index of each simulation once it is over and its metrics are set.
+    """
+    if self._wetlab.freeze_diseased:
+      # Draw the frozen diseased patients as the reset of the first simulation
+      # would (see run_simulation and reset), so that all workers share them.
+      reset_rng = jax.random.split(sim_rngs[0])[1]
+      self._wetlab.reset(jax.random.split(reset_rng, 2)[0])
+    # The workers only record one simulation at a time.
+    worker_simulator = copy.copy(self)
+    worker_simulator.metrics = self._metrics_cls(
+        None, 1, self._max_test_cycles, self._wetlab.num_patients,
+        self.state.num_tests_per_cycle)
+    tasks = [(sim_idx, onp.asarray(sim_rng))
+             for sim_idx, sim_rng in enumerate(sim_rngs)]
+    # jax is not fork-safe, so the workers are started from scratch.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(self._num_workers, initializer=_init_worker,
+                      initargs=(worker_simulator,)) as pool:
+      for sim_idx, arrays in pool.imap_unordered(_run_in_worker, tasks):
+        self.metrics.set_simulation_arrays(sim_idx, arrays)
+        logging.info("Simulation %i is over.", sim_idx)
+        yield sim_idx
+
   @property
   def is_over(self):
     """Returns True if the simulation is over, False otherwise."""
@@ -311,3 +377,20 @@ class Simulator(object):
         print("Groups\n", df)
         print(self.marginal.shape)
         print("Marginal\n", pd.DataFrame(self.marginal[onp.newaxis, :]))
+
+
+# Simulator of the current worker process of Simulator._run_in_workers.
+_worker_simulator = None
+
+
+def _init_worker(simulator):
+  """Sets the simulator of the current worker process."""
+  global _worker_simulator
+  _worker_simulator = simulator
+
+
+def _run_in_worker(task):
+  """Runs one simulation and returns its index and metrics."""
+  sim_idx, rng = task
+  _worker_simulator.run_full_simulation(rng, 0)
+  return sim_idx, _worker_simulator.metrics.simulation_arrays(0)
@@ -21,6 +21,7 @@ import jax
 import jax.numpy as np
 import jax.test_util
 
+from grouptesting import metrics
 from grouptesting import policy
 from grouptesting import simulator
 from grouptesting import wet_lab
@@ -63,6 +64,26 @@ class SimulatorTestCase(jax.test_util.JaxTestCase):
     last_groups = sim.metrics.groups[0, -1]
     self.assertFalse(np.all(np.isnan(last_groups)))
 
+  def test_run_in_workers(self):
+    """Parallel simulations give the same metrics as sequential ones."""
+    for freeze_diseased in [False, True]:
+      sims = [
+          simulator.Simulator(
+              None, wet_lab.WetLab(self.num_patients,
+                                   freeze_diseased=freeze_diseased),
+              policy=self.policy, num_simulations=3,
+              max_test_cycles=self.max_test_cycles,
+              num_tests_per_cycle=4, max_group_size=5,
+              num_workers=num_workers)
+          for num_workers in (1, 2)
+      ]
+      for sim in sims:
+        sim.run(0)
+      for name in metrics.Metrics.ARRAY_NAMES:
+        self.assertArraysAllClose(
+            np.nan_to_num(getattr(sims[0].metrics, name)),
+            np.nan_to_num(getattr(sims[1].metrics, name)))
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -0,0 +1,97 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+r"""Benchmarks the scan and chunked versions of unidirectional fast attention.
+
+For each sequence length, reports the compilation time and the mean run time
+of the jitted forward (or forward and backward) pass.
+
+Example:
+  python -m performer.fast_self_attention.causal_attention_benchmark \
+    --lengths=1024,4096,16384,65536 --chunk_sizes=0,64,256 --mode=backward
+"""
+
+import time
+from absl import app
+from absl import flags
+import jax
+import jax.numpy as jnp
+import numpy as onp
+from performer.fast_self_attention import fast_self_attention
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_list('lengths', ['1024', '4096', '16384', '65536'],
+                  'Sequence lengths to benchmark.')
+flags.DEFINE_list('chunk_sizes', ['0', '64', '256'],
+                  'Chunk sizes to benchmark, 0 is the scan version.')
+flags.DEFINE_enum('mode', 'forward', ['forward', 'backward'],
+                  'Whether to time the forward or the forward and backward '
+                  'pass.')
+flags.DEFINE_integer('batch_size', 1, 'Batch size.')
+flags.DEFINE_integer('num_heads', 1, 'Number of attention heads.')
+flags.DEFINE_integer('qk_dim', 64, 'Dimension of queries, keys and values.')
+flags.DEFINE_integer('nb_features', 256, 'Number of random features.')
+flags.DEFINE_integer('sample_number', 10, 'Number of timed runs.')
+
+
+def benchmark(length, chunk_size):
+  """Returns the compilation and mean run times, in seconds."""
+  attention_fn = fast_self_attention.make_fast_softmax_attention(
+      FLAGS.qk_dim,
+      nb_features=FLAGS.nb_features,
+      unidirectional=True,
+      chunk_size=chunk_size or None)
+
+  def sum_attention_fn(query, key, value):
+    return jnp.sum(attention_fn(query, key, value))
+
+  if FLAGS.mode == 'forward':
+    fn = jax.jit(sum_attention_fn)
+  else:
+    fn = jax.jit(jax.grad(sum_attention_fn, argnums=(0, 1, 2)))
+
+  shape = (FLAGS.batch_size, length, FLAGS.num_heads, FLAGS.qk_dim)
+  query, key, value = (
+      jnp.array(onp.random.rand(*shape), dtype=jnp.float32) * 0.001
+      for _ in range(3))
+
+  def run():
+    jax.tree_util.tree_map(lambda x: x.block_until_ready(),
+                           fn(query, key, value))
+
+  start = time.time()
+  run()
+  compile_time = time.time() - start
+
+  start = time.time()
+  for _ in range(FLAGS.sample_number):
+    run()
+  return compile_time, (time.time() - start) / FLAGS.sample_number
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+  print('%8s %8s %12s %12s' % ('length', 'chunk', 'compile (s)', 'run (s)'))
+  for length in map(int, FLAGS.lengths):
+    for chunk_size in map(int, FLAGS.chunk_sizes):
+      compile_time, run_time = benchmark(length, chunk_size)
+      print('%8d %8s %12.3f %12.5f' %
+            (length, chunk_size or 'scan', compile_time, run_time))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -22,6 +22,7 @@ and low rank decomposition of the attention matrix.
 # pylint: disable=invalid-name, missing-function-docstring
 
 import abc
+import collections
 from collections.abc import Iterable  # pylint: disable=g-importing-member
 import functools
 from absl import logging
@@ -204,7 +205,8 @@ def make_fast_softmax_attention(qkv_dim,
                                 redraw_features=False,
                                 unidirectional=False,
                                 nonnegative_features=True,
-                                lax_scan_unroll=1):
+                                lax_scan_unroll=1,
+                                chunk_size=None):
   """Construct a fast softmax attention method."""
   logging.info(
       'Fast softmax attention: %s features and orthogonal=%s, renormalize=%s',
@@ -252,7 +254,9 @@ def make_fast_softmax_attention(qkv_dim,
       numerical_stabilizer=numerical_stabilizer,
       redraw_features=redraw_features,
       unidirectional=unidirectional,
-      lax_scan_unroll=lax_scan_unroll).dot_product_attention
+      sequence_dependent_features=True,
+      lax_scan_unroll=lax_scan_unroll,
+      chunk_size=chunk_size).dot_product_attention
   return attention_fn
 
 
@@ -266,7 +270,8 @@ def make_fast_generalized_attention(qkv_dim,
                                     kernel_epsilon=0.001,
                                     redraw_features=False,
                                     unidirectional=False,
-                                    lax_scan_unroll=1):
+                                    lax_scan_unroll=1,
+                                    chunk_size=None):
   """Construct a fast generalized attention menthod."""
   logging.info('Fast generalized attention.: %s features and renormalize=%s',
                nb_features, renormalize_attention)
@@ -302,7 +307,8 @@ def make_fast_generalized_attention(qkv_dim,
       numerical_stabilizer=numerical_stabilizer,
       redraw_features=redraw_features,
       unidirectional=unidirectional,
-      lax_scan_unroll=lax_scan_unroll).dot_product_attention
+      lax_scan_unroll=lax_scan_unroll,
+      chunk_size=chunk_size).dot_product_attention
   return attention_fn
 
 
@@ -508,6 +514,128 @@ def _denominator(t_slice_shape, precision, qs, ks):
 _denominator.defvjp(_denominator_fwd, _denominator_bwd)
 
 
+# Chunked version of _numerator. The inputs have shape
+# (nb_chunks, <batch dims>, chunk_size, channels): attention within a chunk is
+# computed with dense (masked) matrix products, and only the prefix sums are
+# carried across chunks. As above, the backward pass recovers the prefix sums by
+# subtracting the chunk contributions from the final ones, so only the inputs
+# need to be kept. The chunked denominator is the numerator of all-ones values.
+
+
+def _chunkwise_numerator_fwd(z_slice_shape, precision, qs, ks, vs):
+
+  def body(p, qkv):
+    (q, k, v) = qkv
+    a = jnp.tril(jnp.einsum('...im,...jm->...ij', q, k, precision=precision))
+    X_chunk = (
+        jnp.einsum('...im,...md->...id', q, p, precision=precision) +
+        jnp.einsum('...ij,...jd->...id', a, v, precision=precision))
+    p += jnp.einsum('...jm,...jd->...md', k, v, precision=precision)
+    return p, X_chunk
+
+  init_value = jnp.zeros(z_slice_shape)
+  p, W = lax.scan(body, init_value, (qs, ks, vs))
+  return W, (p, qs, ks, vs)
+
+
+def _chunkwise_numerator_bwd(z_slice_shape, precision, pqkv, W_ct):
+  del z_slice_shape
+
+  def body(carry, qkv_xct):
+    p, p_ct = carry
+    q, k, v, x_ct = qkv_xct
+    p -= jnp.einsum('...jm,...jd->...md', k, v, precision=precision)
+    a = jnp.tril(jnp.einsum('...im,...jm->...ij', q, k, precision=precision))
+    a_ct = jnp.tril(
+        jnp.einsum('...id,...jd->...ij', x_ct, v, precision=precision))
+    q_ct = (
+        jnp.einsum('...id,...md->...im', x_ct, p, precision=precision) +
+        jnp.einsum('...ij,...jm->...im', a_ct, k, precision=precision))
+    k_ct = (
+        jnp.einsum('...ij,...im->...jm', a_ct, q, precision=precision) +
+        jnp.einsum('...md,...jd->...jm', p_ct, v, precision=precision))
+    v_ct = (
+        jnp.einsum('...ij,...id->...jd', a, x_ct, precision=precision) +
+        jnp.einsum('...md,...jm->...jd', p_ct, k, precision=precision))
+    p_ct += jnp.einsum('...im,...id->...md', q, x_ct, precision=precision)
+    return (p, p_ct), (q_ct, k_ct, v_ct)
+
+  p, qs, ks, vs = pqkv
+  _, (qs_ct, ks_ct, vs_ct) = lax.scan(
+      body, (p, jnp.zeros_like(p)), (qs, ks, vs, W_ct), reverse=True)
+  return qs_ct, ks_ct, vs_ct
+
+
+@functools.partial(jax.custom_vjp, nondiff_argnums=(0, 1))
+def _chunkwise_numerator(z_slice_shape, precision, qs, ks, vs):
+  W, _ = _chunkwise_numerator_fwd(z_slice_shape, precision, qs, ks, vs)
+  return W
+
+
+_chunkwise_numerator.defvjp(_chunkwise_numerator_fwd, _chunkwise_numerator_bwd)
+
+
+def _split_chunks(xs, chunk_size):
+  """Splits the leading (attention) axis of xs into chunks.
+
+  The attention axis is padded with zeros to a multiple of chunk_size. Zero
+  (padded) keys come after all the others, so they do not change the prefix
+  sums seen by the other positions.
+
+  Args:
+    xs: array of shape (length, <batch dims>, channels).
+    chunk_size: number of positions per chunk.
+
+  Returns:
+    Array of shape (nb_chunks, <batch dims>, chunk_size, channels).
+  """
+  length = xs.shape[0]
+  nb_chunks = -(-length // chunk_size)
+  padding = nb_chunks * chunk_size - length
+  if padding:
+    xs = jnp.pad(xs, [(0, padding)] + [(0, 0)] * (xs.ndim - 1))
+  xs = xs.reshape((nb_chunks, chunk_size) + xs.shape[1:])
+  return jnp.moveaxis(xs, 1, -2)
+
+
+def _merge_chunks(xs, length):
+  """Inverse of _split_chunks, dropping the padded positions."""
+  xs = jnp.moveaxis(xs, -2, 1)
+  return xs.reshape((-1,) + xs.shape[2:])[:length]
+
+
+def _chunked_numerator(z_slice_shape, precision, qs, ks, vs, chunk_size):
+  """Same as _numerator, computed chunk_size positions at a time."""
+  W = _chunkwise_numerator(z_slice_shape, precision,
+                           _split_chunks(qs, chunk_size),
+                           _split_chunks(ks, chunk_size),
+                           _split_chunks(vs, chunk_size))
+  return _merge_chunks(W, qs.shape[0])
+
+
+# State of unidirectional attention while decoding one position at a time.
+# numerator: sum of K^{'}_i V_i^{T} over the decoded positions i, of shape
+#   (bs, num_heads, channels_m, channels_v).
+# denominator: sum of K^{'}_i over the decoded positions i, of shape
+#   (bs, num_heads, channels_m).
+DecodingState = collections.namedtuple('DecodingState',
+                                       ['numerator', 'denominator'])
+
+
+def reorder_decoding_state(state, indices):
+  """Reorders (e.g. beams of) a DecodingState along the batch axis.
+
+  Args:
+    state: DecodingState.
+    indices: int array of shape (new_bs,): the new batch element i continues
+      the decoding of the old batch element indices[i].
+
+  Returns:
+    The reordered DecodingState.
+  """
+  return DecodingState(*[jnp.take(x, indices, axis=0) for x in state])
+
+
 class FastAttentionviaLowRankDecomposition(FastAttention):
   r"""Class providing a method for fast attention via low rank decomposition.
 
@@ -523,7 +651,9 @@ class FastAttentionviaLowRankDecomposition(FastAttention):
                numerical_stabilizer,
                redraw_features,
                unidirectional,
-               lax_scan_unroll=1):  # For optimal GPU performance, set to 16.
+               lax_scan_unroll=1,  # For optimal GPU performance, set to 16.
+               chunk_size=None,
+               sequence_dependent_features=False):
     rng = random.PRNGKey(0)
     self.matrix_creator = matrix_creator
     self.projection_matrix = self.draw_weights(rng)
@@ -533,6 +663,12 @@ class FastAttentionviaLowRankDecomposition(FastAttention):
     self.redraw_features = redraw_features
     self.unidirectional = unidirectional
     self.lax_scan_unroll = lax_scan_unroll
+    # When set, unidirectional attention is computed chunk_size positions at a
+    # time instead of position by position.
+    self.chunk_size = chunk_size
+    # Whether the kernel features of a position depend on the other positions
+    # (e.g. through numerical stabilizers), which rules out decoding.
+    self.sequence_dependent_features = sequence_dependent_features
 
   def draw_weights(self, key):
     if self.matrix_creator is None:
@@ -603,13 +739,23 @@ class FastAttentionviaLowRankDecomposition(FastAttention):
 
     if self.unidirectional:
       index = attention_dims_t[0]
+      if self.chunk_size:
+        numerator = functools.partial(_chunked_numerator,
+                                      chunk_size=self.chunk_size)
+        if self.renormalize_attention:
+          # The denominator is the numerator of all-ones values. Computing both
+          # at once shares the attention matrices within the chunks.
+          value = jnp.concatenate(
+              [value, jnp.ones(value.shape[:-1] + (1,), value.dtype)], axis=-1)
+      else:
+        numerator = _numerator
       z_slice_shape = key_prime.shape[0:len(batch_dims_t)] + (
           key_prime.shape[-1],) + (value.shape[-1],)
 
-      W = _numerator(z_slice_shape, precision,
-                     jnp.moveaxis(query_prime, index, 0),
-                     jnp.moveaxis(key_prime, index, 0),
-                     jnp.moveaxis(value, index, 0))
+      W = numerator(z_slice_shape, precision,
+                    jnp.moveaxis(query_prime, index, 0),
+                    jnp.moveaxis(key_prime, index, 0),
+                    jnp.moveaxis(value, index, 0))
 
       # Constructing W = (Q^{'}(K^{'})^{T})_{masked}V
       W = jnp.moveaxis(W, 0, index)
@@ -619,6 +765,9 @@ class FastAttentionviaLowRankDecomposition(FastAttention):
         perm_inv = _invert_perm(qk_perm)
         result = W.transpose(perm_inv)
         return result
+      elif self.chunk_size:
+        # Unidirectional, normalized attention.
+        W, R = W[..., :-1], W[..., -1]
       else:
         # Unidirectional, normalized attention.
         thick_all_ones = jnp.zeros(key.shape[0:-1]) + jnp.ones(
@@ -696,6 +845,88 @@ class FastAttentionviaLowRankDecomposition(FastAttention):
     result = result.transpose(perm_inv)
     return result
 
+  def _check_decoding(self):
+    if not self.unidirectional:
+      raise ValueError('Decoding requires unidirectional attention.')
+    if self.redraw_features or self.sequence_dependent_features:
+      raise ValueError('Decoding requires kernel features that only depend on '
+                       'their own position, e.g. those of '
+                       'make_fast_generalized_attention without '
+                       'redraw_features.')
+
+  def _decoding_features(self, data, is_query, precision):
+    # data (bs, 1, num_heads, channels) -> (bs, num_heads, 1, channels_m)
+    return self.kernel_feature_creator(
+        data.transpose((0, 2, 1, 3)), self.projection_matrix, (2,), (0, 1),
+        precision, is_query)
+
+  def init_decoding_state(self, batch_size, num_heads, qk_dim, v_dim,
+                          dtype=jnp.float32):
+    """Returns the DecodingState before the first position is decoded.
+
+    Args:
+      batch_size: batch size, including the beams.
+      num_heads: number of attention heads.
+      qk_dim: channels of the queries and keys.
+      v_dim: channels of the values.
+      dtype: the dtype of the state.
+
+    Returns:
+      DecodingState of zeros.
+    """
+    self._check_decoding()
+    features = jax.eval_shape(
+        lambda x: self._decoding_features(x, False, None),
+        jax.ShapeDtypeStruct((batch_size, 1, num_heads, qk_dim), dtype))
+    nb_features = features.shape[-1]
+    return DecodingState(
+        numerator=jnp.zeros((batch_size, num_heads, nb_features, v_dim),
+                            dtype),
+        denominator=jnp.zeros((batch_size, num_heads, nb_features), dtype))
+
+  def decode_step(self, state, query, key, value, precision=None):
+    """Computes unidirectional attention for the next position.
+
+    Decoding positions one by one gives the same results as
+    dot_product_attention on the whole sequence, at a cost that does not depend
+    on the number of positions already decoded.
+
+    Args:
+      state: DecodingState of the previous positions, see init_decoding_state.
+      query: query of the new position, with shape of [batch_size, 1,
+        num_heads, mem_channels].
+      key: key of the new position, with shape of [batch_size, 1, num_heads,
+        mem_channels].
+      value: value of the new position, with shape of [batch_size, 1,
+        num_heads, value_channels].
+      precision: numerical precision of the computation see
+        `jax.lax.Precision` for details.
+
+    Returns:
+      Tuple with the output of shape [batch_size, 1, num_heads, value_channels]
+      and the DecodingState including the new position.
+    """
+    self._check_decoding()
+    query_prime = self._decoding_features(query, True, precision)
+    key_prime = self._decoding_features(key, False, precision)
+    value = value.transpose((0, 2, 1, 3))
+
+    numerator = state.numerator + jnp.einsum(
+        '...lm,...ld->...md', key_prime, value, precision=precision)
+    denominator = state.denominator + jnp.sum(key_prime, axis=-2)
+    state = DecodingState(numerator=numerator, denominator=denominator)
+
+    W = jnp.einsum(
+        '...lm,...md->...ld', query_prime, numerator, precision=precision)
+    if self.renormalize_attention:
+      R = jnp.einsum(
+          '...lm,...m->...l', query_prime, denominator, precision=precision)
+      R = R + 2 * self.numerical_stabilizer * (
+          jnp.abs(R) <= self.numerical_stabilizer)
+      R = jnp.reciprocal(R)
+      W = W * jnp.expand_dims(R, len(R.shape))
+    return W.transpose((0, 2, 1, 3)), state
+
 
 def _invert_perm(perm):
   perm_inv = [0] * len(perm)
@@ -105,6 +105,81 @@ class FSAAccuracyTest(absltest.TestCase):
     max_ortho_error = 2.0
     self.assertLess(jnp.max(jnp.abs(ortho_error)), max_ortho_error)
 
+  def test_chunked_unidirectional_attention(self):
+    # The sequence length is not a multiple of the chunk size.
+    shape = (2, 37, 3, 8)
+    rngs = random.split(random.PRNGKey(0), 4)
+    query, key, value, weights = (random.normal(rng, shape) for rng in rngs)
+
+    for renormalize_attention in [True, False]:
+      results = []
+      for chunk_size in [None, 1, 8, 64]:
+        attention_fn = fast_self_attention.make_fast_softmax_attention(
+            shape[-1],
+            renormalize_attention=renormalize_attention,
+            nb_features=16,
+            unidirectional=True,
+            chunk_size=chunk_size)
+
+        def loss_fn(q, k, v, attention_fn=attention_fn):
+          return jnp.sum(attention_fn(q, k, v) * weights)
+
+        results.append((attention_fn(query, key, value),) +
+                       jax.grad(loss_fn, (0, 1, 2))(query, key, value))
+
+      for chunked_results in results[1:]:
+        for expected, actual in zip(results[0], chunked_results):
+          onp.testing.assert_allclose(expected, actual, rtol=1e-4, atol=1e-5)
+
+  def test_decoding(self):
+    batch_size, length, num_heads, qk_dim = 3, 9, 3, 8
+    reorder_position = 4
+    # The new batch element i continues the decoding of batch element
+    # beam_indices[i] after reorder_position positions.
+    beam_indices = jnp.array([1, 1, 0])
+    rngs = random.split(random.PRNGKey(0), 3)
+    query, key, value = (
+        random.normal(rng, (batch_size, length, num_heads, qk_dim))
+        for rng in rngs)
+
+    for features_type in ["deterministic", "ortho"]:
+      for renormalize_attention in [True, False]:
+        attention_fn = fast_self_attention.make_fast_generalized_attention(
+            qk_dim,
+            renormalize_attention=renormalize_attention,
+            nb_features=16,
+            features_type=features_type,
+            unidirectional=True)
+        fast_attention = attention_fn.__self__
+        decode_step = jax.jit(fast_attention.decode_step)
+
+        # Sequences of the batch after reordering.
+        reordered = [
+            jnp.concatenate([
+                jnp.take(x[:, :reorder_position], beam_indices, axis=0),
+                x[:, reorder_position:]
+            ], axis=1) for x in (query, key, value)
+        ]
+        expected_results = (attention_fn(query, key, value),
+                            attention_fn(*reordered))
+
+        state = fast_attention.init_decoding_state(batch_size, num_heads,
+                                                   qk_dim, qk_dim)
+        for position in range(length):
+          if position == reorder_position:
+            state = fast_self_attention.reorder_decoding_state(
+                state, beam_indices)
+          inputs = (query, key, value)
+          expected = expected_results[0]
+          if position >= reorder_position:
+            inputs = reordered
+            expected = expected_results[1]
+          result, state = decode_step(
+              state, *(x[:, position:position + 1] for x in inputs))
+          onp.testing.assert_allclose(
+              result, expected[:, position:position + 1],
+              rtol=1e-4, atol=1e-4)
+
   def test_attention_speed(self):
 
     fast = False
@@ -21,6 +21,7 @@ from __future__ import division
 from __future__ import print_function
 
 import glob
+import itertools
 
 from absl import logging
 import six
@@ -29,14 +30,24 @@ from six.moves import zip_longest
 
 
 
+# Number of characters read from an input file at a time.
+_READ_BLOCK_SIZE = 1 << 20
+
+
 def compute_scores_and_write_to_csv(target_filepattern,
                                     prediction_filepattern,
                                     output_filename,
                                     scorer,
                                     aggregator,
-                                    delimiter="\n"):
+                                    delimiter="\n",
+                                    num_workers=1,
+                                    chunk_size=1000):
   """Runs aggregate score calculations and outputs results to a CSV file.
 
+  Records are streamed from the input files and scored chunk by chunk, so
+  memory use does not grow with the number of records beyond what the
+  aggregator keeps.
+
   Args:
     target_filepattern: Pattern for files containing target text.
     prediction_filepattern: Pattern for files containing prediction text.
@@ -45,12 +56,14 @@ def compute_scores_and_write_to_csv(target_filepattern,
     aggregator: An aggregator to aggregate scores. If None, outputs are
       per-example scores.
     delimiter: Record delimiter.
+    num_workers: Number of processes used to compute scores.
+    chunk_size: Number of records scored by a process at a time.
   """
 
   target_filenames = _glob(target_filepattern)
   prediction_filenames = _glob(prediction_filepattern)
   scores = _compute_scores(target_filenames, prediction_filenames, scorer,
-                           delimiter)
+                           delimiter, num_workers, chunk_size)
   if aggregator:
     for score in scores:
       aggregator.add_scores(score)
@@ -67,32 +80,84 @@ def _open(filepattern, mode="r"):
   return open(filepattern, mode)  # pylint: disable=unreachable
 
 
-def _record_gen(filename, delimiter):
-  """Opens file and yields records separated by delimiter."""
+def _record_gen(filename, delimiter, block_size=_READ_BLOCK_SIZE):
+  """Opens file and yields records separated by delimiter.
+
+  The file is read in blocks of block_size characters, so only the current
+  record and one block are held in memory.
+
+  Args:
+    filename: Name of the file to read.
+    delimiter: string delimiter between each record in the file.
+    block_size: Number of characters to read at a time.
+  Yields:
+    Each record in the file, without its delimiter.
+  """
+
+  delimiter = six.ensure_str(delimiter)
+  # Pieces of the current, incomplete record. They are only joined once the
+  # delimiter is found, so a record spanning many blocks is copied once.
+  pieces = []
+  # Last len(delimiter) - 1 characters of the pieces, to find a delimiter that
+  # straddles two blocks.
+  tail = ""
+  tail_size = len(delimiter) - 1
   with _open(filename) as f:
-    records = f.read().split(six.ensure_str(delimiter))
-  if records[-1]:
+    while True:
+      block = f.read(block_size)
+      if not block:
+        break
+      if delimiter not in tail + block:
+        pieces.append(block)
+        tail = (tail + block)[-tail_size:] if tail_size else ""
+        continue
+      records = ("".join(pieces) + block).split(delimiter)
+      # The last piece may be an incomplete record.
+      buf = records.pop()
+      pieces = [buf]
+      tail = buf[-tail_size:] if tail_size else ""
+      for record in records:
+        yield record
+  buf = "".join(pieces)
+  if buf:
     # Need a final delimiter at end of file to be able to detect an empty last
     # record.
     logging.warn("Expected delimiter at end of file")
-  else:
-    records = records[:-1]
-  for record in records:
-    yield record
+    yield buf
 
 
-def _compute_scores(target_filenames, prediction_filenames, scorer, delimiter):
-  """Computes aggregates scores across the given target and prediction files.
+def _record_pair_gen(target_filenames, prediction_filenames, delimiter):
+  """Yields (target, prediction) records, reading both files in lockstep."""
+  for target_filename, prediction_filename in zip(
+      sorted(target_filenames), sorted(prediction_filenames)):
+    logging.info("Reading targets from %s.", target_filename)
+    logging.info("Reading predictions from %s.", prediction_filename)
+    targets = _record_gen(target_filename, delimiter)
+    preds = _record_gen(prediction_filename, delimiter)
+    for target_rec, prediction_rec in zip_longest(targets, preds):
+      if target_rec is None or prediction_rec is None:
+        raise ValueError("Must have equal number of lines across target and "
+                         "prediction files. Mismatch between files: %s, %s." %
+                         (target_filename, prediction_filename))
+      yield target_rec, prediction_rec
+
+
+def _compute_scores(target_filenames, prediction_filenames, scorer, delimiter,
+                    num_workers=1, chunk_size=1000):
+  """Computes scores across the given target and prediction files.
 
   Args:
     target_filenames: List of filenames from which to read target lines.
     prediction_filenames: List of filenames from which to read prediction lines.
     scorer: A BaseScorer object to compute scores.
     delimiter: string delimiter between each record in input files
+    num_workers: Number of processes used to compute scores.
+    chunk_size: Number of records scored by a process at a time.
   Returns:
-    A list of dicts mapping score_type to Score objects.
+    An iterator over dicts mapping score_type to Score objects, one per record.
   Raises:
-    ValueError: If invalid targets or predictions are provided.
+    ValueError: If invalid targets or predictions are provided. Mismatched
+      record counts are only detected, and raised, while iterating.
   """
 
   if (len(target_filenames) < 1 or
@@ -102,21 +167,14 @@ def _compute_scores(target_filenames, prediction_filenames, scorer, delimiter):
                      "files." % (len(target_filenames),
                                  len(prediction_filenames)))
 
-  scores = []
-  for target_filename, prediction_filename in zip(
-      sorted(target_filenames), sorted(prediction_filenames)):
-    logging.info("Reading targets from %s.", target_filename)
-    logging.info("Reading predictions from %s.", prediction_filename)
-    targets = _record_gen(target_filename, delimiter)
-    preds = _record_gen(prediction_filename, delimiter)
-    for target_rec, prediction_rec in zip_longest(targets, preds):
-      if target_rec is None or prediction_rec is None:
-        raise ValueError("Must have equal number of lines across target and "
-                         "prediction files. Mismatch between files: %s, %s." %
-                         (target_filename, prediction_filename))
-      scores.append(scorer.score(target_rec, prediction_rec))
-
-  return scores
+  # Both tee branches are consumed in lockstep by the scorer, so at most one
+  # pair is buffered.
+  target_pairs, prediction_pairs = itertools.tee(
+      _record_pair_gen(target_filenames, prediction_filenames, delimiter))
+  return scorer.iter_score_corpus((t for t, _ in target_pairs),
+                                  (p for _, p in prediction_pairs),
+                                  num_workers=num_workers,
+                                  chunk_size=chunk_size)
 
 
 def _write_aggregates_to_csv(output_filename, aggregates):
@@ -156,15 +214,19 @@ def _write_scores_to_csv(output_filename, scores):
 
   The header row indicates the type of each score column.
 
+  Rows are written as scores are produced.
+
   Args:
     output_filename: Name of file to write results to.
-    scores: A list of dicts mapping each score_type to a Score object.
+    scores: An iterable of dicts mapping each score_type to a Score object.
   """
 
-  if len(scores) < 1:
+  scores = iter(scores)
+  first = next(scores, None)
+  if first is None:
     logging.warn("No scores to write")
     return
-  rouge_types = sorted(scores[0].keys())
+  rouge_types = sorted(first.keys())
 
   logging.info("Writing results to %s.", output_filename)
   with _open(output_filename, "w") as out_file:
@@ -172,7 +234,7 @@ def _write_scores_to_csv(output_filename, scores):
     for rouge_type in rouge_types:
       out_file.write(",{t}-P,{t}-R,{t}-F".format(t=rouge_type))
     out_file.write("\n")
-    for i, result in enumerate(scores):
+    for i, result in enumerate(itertools.chain([first], scores)):
       out_file.write("%d" % i)
       for rouge_type in rouge_types:
         out_file.write(",%f,%f,%f" %
@@ -75,6 +75,52 @@ class IoTest(absltest.TestCase):
       self.assertEqual(ids[0], "id")
       self.assertLen(csv_lines, 5)
 
+  def testRecordGenReadsAcrossBlocks(self):
+    with open(test_util.DELIMITED_FILE) as f:
+      expected = f.read().split(":")[:-1]
+    for block_size in [1, 2, 7, 1 << 20]:
+      self.assertEqual(
+          expected,
+          list(io._record_gen(test_util.DELIMITED_FILE, ":", block_size)))
+
+  def testRecordGenWithoutFinalDelimiter(self):
+    with tempfile.NamedTemporaryFile("w") as f:
+      f.write("one\ntwo\n\nthree")
+      f.flush()
+      self.assertEqual(["one", "two", "", "three"],
+                       list(io._record_gen(f.name, "\n", 2)))
+
+  def testRecordGenMultiCharacterDelimiter(self):
+    with tempfile.NamedTemporaryFile("w") as f:
+      f.write("a long record<|>x<|><|>another long record<|>")
+      f.flush()
+      for block_size in [1, 2, 3, 5, 1 << 20]:
+        self.assertEqual(["a long record", "x", "", "another long record"],
+                         list(io._record_gen(f.name, "<|>", block_size)))
+
+  def testMultipleWorkers(self):
+    scorer = rouge_scorer.RougeScorer(["rouge1", "rougeL"], False)
+    csv_lines = []
+    for num_workers in [1, 2]:
+      with tempfile.NamedTemporaryFile() as output_file:
+        io.compute_scores_and_write_to_csv(test_util.LARGE_TARGETS_FILE,
+                                           test_util.LARGE_PREDICTIONS_FILE,
+                                           output_file.name, scorer, None,
+                                           num_workers=num_workers,
+                                           chunk_size=100)
+        with open(output_file.name) as f:
+          csv_lines.append(f.readlines())
+    self.assertLen(csv_lines[0], 1001)
+    self.assertEqual(csv_lines[0], csv_lines[1])
+
+  def testAssertsOnMismatchedRecords(self):
+    scorer = rouge_scorer.RougeScorer(["rouge1"], False)
+    with tempfile.NamedTemporaryFile() as output_file:
+      with self.assertRaises(ValueError):
+        io.compute_scores_and_write_to_csv(test_util.TARGETS_FILE,
+                                           test_util.LARGE_PREDICTIONS_FILE,
+                                           output_file.name, scorer, None)
+
   def testAssertsOnInvalidInputFiles(self):
     scorer = rouge_scorer.RougeScorer(["rouge1"], False)
     with self.assertRaises(ValueError):
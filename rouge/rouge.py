@@ -59,6 +59,10 @@ flags.DEFINE_boolean("use_stemmer", False,
                      "Whether to use Porter stemmer to remove common suffixes.")
 flags.DEFINE_boolean("aggregate", True,
                      "Write aggregates if this is set to True")
+flags.DEFINE_integer("num_workers", 1,
+                     "Number of processes used to compute scores.")
+flags.DEFINE_integer("chunk_size", 1000,
+                     "Number of records scored by a process at a time.")
 
 FLAGS = flags.FLAGS
 
@@ -74,7 +78,9 @@ def main(argv):
       FLAGS.output_filename,
       scorer,
       aggregator,
-      delimiter=FLAGS.delimiter)
+      delimiter=FLAGS.delimiter,
+      num_workers=FLAGS.num_workers,
+      chunk_size=FLAGS.chunk_size)
 
 
 if __name__ == "__main__":
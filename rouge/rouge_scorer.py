@@ -39,12 +39,22 @@ import collections
 import re
 
 from nltk.stem import porter
+import numpy as np
 import six
 from six.moves import map
 from six.moves import range
 from rouge import scoring
 from rouge import tokenize
 
+# Default maximum number of stems kept by a RougeScorer's stem cache.
+DEFAULT_STEM_CACHE_SIZE = 65536
+
+
+class TokenizedText(
+    collections.namedtuple("TokenizedText",
+                           ["tokens", "sentence_tokens", "stemmed"])):
+  """Text tokenized by RougeScorer.tokenize, reusable across score calls."""
+
 
 class RougeScorer(scoring.BaseScorer):
   """Calculate rouges scores between two blobs of text.
@@ -53,9 +63,14 @@ class RougeScorer(scoring.BaseScorer):
     scorer = RougeScorer(['rouge1', 'rougeL'], use_stemmer=True)
     scores = scorer.score('The quick brown fox jumps over the lazy dog',
                           'The quick brown dog jumps on the log.')
+
+  To score many predictions against one target, tokenize the target once:
+    target = scorer.tokenize('The quick brown fox jumps over the lazy dog')
+    scores = [scorer.score(target, p) for p in predictions]
   """
 
-  def __init__(self, rouge_types, use_stemmer=False):
+  def __init__(self, rouge_types, use_stemmer=False,
+               stem_cache_size=DEFAULT_STEM_CACHE_SIZE):
     """Initializes a new RougeScorer.
 
     Valid rouge types that can be computed are:
@@ -66,27 +81,88 @@ class RougeScorer(scoring.BaseScorer):
       rouge_types: A list of rouge types to calculate.
       use_stemmer: Bool indicating whether Porter stemmer should be used to
         strip word suffixes to improve matching.
+      stem_cache_size: Maximum number of stems remembered across calls when
+        use_stemmer is set. 0 disables the cache.
     Returns:
       A dict mapping rouge types to Score tuples.
     """
 
     self.rouge_types = rouge_types
-    self._stemmer = porter.PorterStemmer() if use_stemmer else None
+    self._stemmer = None
+    if use_stemmer:
+      self._stemmer = porter.PorterStemmer()
+      if stem_cache_size:
+        self._stemmer = tokenize.CachingStemmer(self._stemmer, stem_cache_size)
 
   def score(self, target, prediction):
     """Calculates rouge scores between the target and prediction.
 
     Args:
-      target: Text containing the target (ground truth) text.
-      prediction: Text containing the predicted text.
+      target: Text containing the target (ground truth) text, or a
+        TokenizedText returned by tokenize.
+      prediction: Text containing the predicted text, or a TokenizedText
+        returned by tokenize.
+    Returns:
+      A dict mapping each rouge type to a Score object.
+    Raises:
+      ValueError: If an invalid rouge type is encountered, or a TokenizedText
+        was produced with a different use_stemmer setting.
+    """
+
+    return self._score_tokenized(self._as_tokenized(target),
+                                 self._as_tokenized(prediction))
+
+  def tokenize(self, text):
+    """Tokenizes text so that it can be scored repeatedly.
+
+    Args:
+      text: Text to tokenize.
+    Returns:
+      A TokenizedText which can be passed to score in place of text.
+    """
+
+    # Newlines are token separators, so the document tokens are exactly the
+    # concatenation of the sentence tokens used by rougeLsum.
+    sentence_tokens = [
+        tokenize.tokenize(s, self._stemmer) for s in _get_sents(text)
+    ]
+    tokens = [token for sentence in sentence_tokens for token in sentence]
+    return TokenizedText(tokens=tokens, sentence_tokens=sentence_tokens,
+                         stemmed=self._stemmer is not None)
+
+  def stem_cache_info(self):
+    """Returns a tokenize.CacheInfo for the stem cache, or None if disabled.
+
+    Worker processes started by score_corpus keep their own stem caches, which
+    are not reflected here.
+    """
+    if isinstance(self._stemmer, tokenize.CachingStemmer):
+      return self._stemmer.cache_info()
+    return None
+
+  def _as_tokenized(self, text):
+    """Returns text as a TokenizedText, tokenizing it if needed."""
+    if not isinstance(text, TokenizedText):
+      return self.tokenize(text)
+    if text.stemmed != (self._stemmer is not None):
+      raise ValueError("TokenizedText was created with use_stemmer=%s." %
+                       text.stemmed)
+    return text
+
+  def _score_tokenized(self, target, prediction):
+    """Calculates rouge scores between tokenized texts.
+
+    Args:
+      target: TokenizedText of the target text.
+      prediction: TokenizedText of the prediction text.
     Returns:
       A dict mapping each rouge type to a Score object.
     Raises:
       ValueError: If an invalid rouge type is encountered.
     """
 
-    target_tokens = tokenize.tokenize(target, self._stemmer)
-    prediction_tokens = tokenize.tokenize(prediction, self._stemmer)
+    target_tokens = target.tokens
+    prediction_tokens = prediction.tokens
     result = {}
 
     for rouge_type in self.rouge_types:
@@ -94,19 +170,8 @@ class RougeScorer(scoring.BaseScorer):
         # Rouge from longest common subsequences.
         scores = _score_lcs(target_tokens, prediction_tokens)
       elif rouge_type == "rougeLsum":
-        # Note: Does not support multi-line text.
-        def get_sents(text):
-          # Assume sentences are separated by newline.
-          sents = six.ensure_str(text).split("\n")
-          sents = [x for x in sents if len(x)]
-          return sents
-
-        target_tokens_list = [
-            tokenize.tokenize(s, self._stemmer) for s in get_sents(target)]
-        prediction_tokens_list = [
-            tokenize.tokenize(s, self._stemmer) for s in get_sents(prediction)]
-        scores = _summary_level_lcs(target_tokens_list,
-                                    prediction_tokens_list)
+        scores = _summary_level_lcs(target.sentence_tokens,
+                                    prediction.sentence_tokens)
       elif re.match(r"rouge[0-9]$", six.ensure_str(rouge_type)):
         # Rouge from n-grams.
         n = int(rouge_type[5:])
@@ -122,6 +187,14 @@ class RougeScorer(scoring.BaseScorer):
     return result
 
 
+def _get_sents(text):
+  """Splits text into non-empty sentences."""
+  # Assume sentences are separated by newline.
+  sents = six.ensure_str(text).split("\n")
+  sents = [x for x in sents if len(x)]
+  return sents
+
+
 def _create_ngrams(tokens, n):
   """Creates ngrams from the given list of tokens.
 
@@ -151,9 +224,7 @@ def _score_lcs(target_tokens, prediction_tokens):
   if not target_tokens or not prediction_tokens:
     return scoring.Score(precision=0, recall=0, fmeasure=0)
 
-  # Compute length of LCS from the bottom up in a table (DP appproach).
-  lcs_table = _lcs_table(target_tokens, prediction_tokens)
-  lcs_length = lcs_table[-1][-1]
+  lcs_length = _lcs_length(target_tokens, prediction_tokens)
 
   precision = lcs_length / len(prediction_tokens)
   recall = lcs_length / len(target_tokens)
@@ -162,6 +233,35 @@ def _score_lcs(target_tokens, prediction_tokens):
   return scoring.Score(precision=precision, recall=recall, fmeasure=fmeasure)
 
 
+def _lcs_length(ref, can):
+  """Computes the length of the LCS with a bit-parallel kernel.
+
+  Row j of the LCS table is encoded as a bit vector V over the positions of the
+  longer sequence, where a zero bit marks a position at which the table
+  increases. Each token of the shorter sequence then updates the whole row with
+  a constant number of big-integer operations (Allison and Dix, 1986), so the
+  cost is O(len(ref) * len(can) / w) for machine word size w.
+
+  Args:
+    ref: list of tokens
+    can: list of tokens
+
+  Returns:
+    The length of the longest common subsequence of ref and can.
+  """
+  if len(ref) < len(can):
+    ref, can = can, ref
+  masks = {}
+  for i, token in enumerate(ref):
+    masks[token] = masks.get(token, 0) | (1 << i)
+  full = (1 << len(ref)) - 1
+  v = full
+  for token in can:
+    u = v & masks.get(token, 0)
+    v = ((v + u) | (v - u)) & full
+  return len(ref) - bin(v).count("1")
+
+
 def _lcs_table(ref, can):
   """Create 2-d LCS score table."""
   rows = len(ref)
@@ -249,8 +349,74 @@ def _union_lcs(ref, c_list):
   Returns:
     List of tokens in ref representing union LCS.
   """
-  lcs_list = [lcs_ind(ref, c) for c in c_list]
-  return [ref[i] for i in _find_union(lcs_list)]
+  return [ref[i] for i in _union_lcs_ind(ref, c_list)]
+
+
+def _union_lcs_ind(ref, c_list):
+  """Finds the union of the LCS of ref with each candidate sentence.
+
+  Gives the same result as _find_union([lcs_ind(ref, c) for c in c_list]), but
+  fills the LCS tables of all candidates at once. Candidates are laid side by
+  side in one NumPy table, each preceded by a zero column, and every row is
+  computed from the previous one with a running maximum that restarts at each
+  candidate. All candidates are then backtracked together.
+
+  Args:
+    ref: list of tokens
+    c_list: list of list of tokens
+
+  Returns:
+    Sorted list of indices into ref that appear in any of the LCS.
+  """
+  if not ref or not c_list:
+    return []
+
+  vocab = {}
+  ref_ids = np.array([vocab.setdefault(t, len(vocab)) for t in ref])
+  # Boundary columns hold -1 and tokens missing from ref hold -2, so neither
+  # matches any reference token.
+  can_ids = []
+  starts = []
+  for c in c_list:
+    starts.append(len(can_ids))
+    can_ids.append(-1)
+    can_ids.extend(vocab.get(t, -2) for t in c)
+  can_ids = np.array(can_ids)
+  starts = np.array(starts)
+  lengths = np.array([len(c) for c in c_list])
+
+  rows = len(ref) + 1
+  # Table values are below rows, so adding rows * (candidate number) to each
+  # column keeps the running maximum from leaking across candidates.
+  offsets = np.cumsum(can_ids == -1) * rows
+  dtype = np.int32 if offsets[-1] + rows <= np.iinfo(np.int32).max else np.int64
+  offsets = offsets.astype(dtype)
+  table = np.zeros((rows, len(can_ids)), dtype=dtype)
+  diag = np.zeros(len(can_ids), dtype=dtype)
+  for i in range(1, rows):
+    prev = table[i - 1]
+    np.add(prev[:-1], 1, out=diag[1:])
+    row = np.where(can_ids == ref_ids[i - 1], diag, prev)
+    row += offsets
+    np.maximum.accumulate(row, out=row)
+    row -= offsets
+    table[i] = row
+
+  # Backtrack every candidate in lockstep, following _backtrack_norec.
+  in_union = np.zeros(len(ref), dtype=bool)
+  i = np.full(len(c_list), len(ref))
+  j = lengths
+  active = np.flatnonzero(j > 0)
+  while active.size:
+    ii = i[active]
+    col = starts[active] + j[active]
+    match = ref_ids[ii - 1] == can_ids[col]
+    in_union[ii[match] - 1] = True
+    left = table[ii, col - 1] > table[ii - 1, col]
+    i[active] -= ~left | match
+    j[active] -= left | match
+    active = active[(i[active] > 0) & (j[active] > 0)]
+  return np.flatnonzero(in_union).tolist()
 
 
 def _find_union(lcs_list):
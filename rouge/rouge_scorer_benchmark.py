@@ -0,0 +1,91 @@
+# coding=utf-8
+# Copyright 2020 The Google Research Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python2, python3
+r"""Benchmarks batched corpus scoring against serial RougeScorer.score calls.
+
+Sample usage (from google-research/):
+
+python -m rouge.rouge_scorer_benchmark \
+    --rouge_types=rouge1,rouge2,rougeL \
+    --use_stemmer \
+    --num_workers=4
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import timeit
+
+from absl import app
+from absl import flags
+from six.moves import zip
+from rouge import rouge_scorer
+from rouge import test_util
+
+flags.DEFINE_list("rouge_types", ["rouge1", "rouge2", "rougeL"],
+                  "List of ROUGE types to calculate.")
+flags.DEFINE_boolean("use_stemmer", True,
+                     "Whether to use Porter stemmer to remove common suffixes.")
+flags.DEFINE_integer("num_repeats", 20,
+                     "Number of copies of the test corpus to score.")
+flags.DEFINE_integer("num_workers", 4,
+                     "Number of processes used by score_corpus.")
+flags.DEFINE_integer("chunk_size", 1000,
+                     "Number of pairs sent to a worker at a time.")
+
+FLAGS = flags.FLAGS
+
+
+def _run(name, fn, num_records):
+  start = timeit.default_timer()
+  result = fn()
+  elapsed = timeit.default_timer() - start
+  print("%-24s %8.3fs %10.1f records/s" % (name, elapsed,
+                                          num_records / elapsed))
+  return result
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError("Too many command-line arguments.")
+  with open(test_util.LARGE_TARGETS_FILE) as f:
+    targets = f.read().splitlines() * FLAGS.num_repeats
+  with open(test_util.LARGE_PREDICTIONS_FILE) as f:
+    predictions = f.read().splitlines() * FLAGS.num_repeats
+  scorer = rouge_scorer.RougeScorer(FLAGS.rouge_types, FLAGS.use_stemmer)
+  num_records = len(targets)
+  print("Scoring %d records with %s." % (num_records,
+                                         ",".join(FLAGS.rouge_types)))
+
+  serial = _run("serial score", lambda: [
+      scorer.score(t, p) for t, p in zip(targets, predictions)
+  ], num_records)
+  batch = _run("score_batch", lambda: scorer.score_batch(targets, predictions),
+               num_records)
+  corpus = _run(
+      "score_corpus (%d workers)" % FLAGS.num_workers,
+      lambda: scorer.score_corpus(
+          targets,
+          predictions,
+          num_workers=FLAGS.num_workers,
+          chunk_size=FLAGS.chunk_size), num_records)
+  if not serial == batch == corpus:
+    raise ValueError("Batched scores differ from serial scores.")
+
+
+if __name__ == "__main__":
+  app.run(main)
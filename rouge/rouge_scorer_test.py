@@ -27,9 +27,11 @@ from __future__ import division
 from __future__ import print_function
 
 import os
+import random
 
 from absl.testing import absltest
 from absl.testing import parameterized
+from six.moves import zip
 from rouge import rouge_scorer
 from rouge import test_util
 
@@ -170,6 +172,70 @@ class RougeScorerTest(parameterized.TestCase):
     self.assertAlmostEqual(0.66667, result["rougeLsum"].precision, places=5)
     self.assertAlmostEqual(0.47205, result["rougeLsum"].fmeasure, places=5)
 
+  @parameterized.parameters([False, True])
+  def testScoreBatchMatchesScore(self, use_stemmer):
+    scorer = rouge_scorer.RougeScorer(
+        ["rouge1", "rouge2", "rougeL", "rougeLsum"], use_stemmer=use_stemmer)
+    expected = [scorer.score(t, p)
+                for t, p in zip(self.targets, self.predictions)]
+    self.assertEqual(expected,
+                     scorer.score_batch(self.targets, self.predictions))
+
+  def testScoreBatchMismatchedLengths(self):
+    scorer = rouge_scorer.RougeScorer(["rouge1"])
+    with self.assertRaises(ValueError):
+      scorer.score_batch(self.targets, self.predictions[:1])
+
+  @parameterized.parameters([1, 2])
+  def testScoreCorpusPreservesOrder(self, num_workers):
+    scorer = rouge_scorer.RougeScorer(["rouge1", "rougeLsum"],
+                                      use_stemmer=True)
+    targets = self.targets * 5
+    predictions = self.predictions[::-1] * 5
+    expected = [scorer.score(t, p) for t, p in zip(targets, predictions)]
+    result = scorer.score_corpus(
+        targets, predictions, num_workers=num_workers, chunk_size=3)
+    self.assertEqual(expected, result)
+
+  def testScoreCorpusMismatchedLengths(self):
+    scorer = rouge_scorer.RougeScorer(["rouge1"])
+    with self.assertRaises(ValueError):
+      scorer.score_corpus(self.targets, self.predictions * 2)
+
+  def testScoreTokenizedText(self):
+    scorer = rouge_scorer.RougeScorer(["rouge1", "rougeL", "rougeLsum"],
+                                      use_stemmer=True)
+    target = scorer.tokenize(self.targets[0])
+    for prediction in self.predictions:
+      self.assertEqual(scorer.score(self.targets[0], prediction),
+                       scorer.score(target, prediction))
+      self.assertEqual(scorer.score(prediction, self.targets[0]),
+                       scorer.score(prediction, target))
+
+  def testScoreTokenizedTextStemmerMismatch(self):
+    target = rouge_scorer.RougeScorer(["rouge1"]).tokenize("testing one two")
+    scorer = rouge_scorer.RougeScorer(["rouge1"], use_stemmer=True)
+    with self.assertRaises(ValueError):
+      scorer.score(target, "testing")
+
+  def testStemCacheIsSharedAcrossCalls(self):
+    scorer = rouge_scorer.RougeScorer(["rouge1"], use_stemmer=True)
+    scorer.score(self.targets[0], self.predictions[0])
+    misses = scorer.stem_cache_info().misses
+    scorer.score(self.targets[0], self.predictions[0])
+    info = scorer.stem_cache_info()
+    self.assertEqual(misses, info.misses)
+    self.assertGreater(info.hits, 0)
+
+  def testStemCacheDisabled(self):
+    self.assertIsNone(rouge_scorer.RougeScorer(["rouge1"]).stem_cache_info())
+    scorer = rouge_scorer.RougeScorer(["rouge1"], use_stemmer=True,
+                                      stem_cache_size=0)
+    self.assertIsNone(scorer.stem_cache_info())
+    cached_scorer = rouge_scorer.RougeScorer(["rouge1"], use_stemmer=True)
+    self.assertEqual(cached_scorer.score(self.targets[1], self.predictions[1]),
+                     scorer.score(self.targets[1], self.predictions[1]))
+
   def testLcsTable(self):
     ref = [1, 2, 3, 4, 5]
     c1 = [2, 5, 3, 4]
@@ -191,6 +257,33 @@ class RougeScorerTest(parameterized.TestCase):
     self.assertEqual([],
                      _read_lcs(t, ref, c2))
 
+  def testLcsLengthMatchesLcsTable(self):
+    rng = random.Random(0)
+    for _ in range(200):
+      ref = [rng.randint(0, 5) for _ in range(rng.randint(0, 40))]
+      can = [rng.randint(0, 7) for _ in range(rng.randint(0, 40))]
+      t = rouge_scorer._lcs_table(ref, can)
+      self.assertEqual(t[len(ref)][len(can)],
+                       rouge_scorer._lcs_length(ref, can))
+
+  def testLcsLengthLongDocuments(self):
+    ref = self.targets[0].split() * 80
+    can = self.predictions[0].split() * 80
+    self.assertGreater(len(ref), 1000)
+    t = rouge_scorer._lcs_table(ref, can)
+    self.assertEqual(t[len(ref)][len(can)],
+                     rouge_scorer._lcs_length(ref, can))
+
+  def testUnionLcsIndMatchesLcsInd(self):
+    rng = random.Random(0)
+    for _ in range(200):
+      ref = [rng.randint(0, 5) for _ in range(rng.randint(1, 30))]
+      c_list = [[rng.randint(0, 7) for _ in range(rng.randint(0, 30))]
+                for _ in range(rng.randint(0, 5))]
+      expected = rouge_scorer._find_union(
+          [rouge_scorer.lcs_ind(ref, c) for c in c_list])
+      self.assertEqual(expected, rouge_scorer._union_lcs_ind(ref, c_list))
+
   def testUnionLcs(self):
     # Example in Section 3.2 of https://www.aclweb.org/anthology/W04-1013,
     # except using indices into ref.
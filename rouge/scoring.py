@@ -26,10 +26,18 @@ from __future__ import print_function
 
 import abc
 import collections
+import itertools
+import multiprocessing
 
 import numpy as np
 import six
 from six.moves import range
+from six.moves import zip
+from six.moves import zip_longest
+
+# Maximum number of resampling indices BootstrapAggregator draws at once when
+# no chunk_size is given.
+_MAX_RESAMPLE_INDICES = 10**7
 
 
 class Score(
@@ -52,6 +60,130 @@ class BaseScorer(object):
       A dict mapping each score_type (string) to Score object.
     """
 
+  def score_batch(self, targets, predictions):
+    """Calculates scores for a batch of (target, prediction) pairs.
+
+    Args:
+      targets: A sequence of target (ground truth) texts.
+      predictions: A sequence of predicted texts, aligned with targets.
+
+    Returns:
+      A list of dicts mapping each score_type (string) to Score object, in the
+      same order as the inputs.
+
+    Raises:
+      ValueError: If the inputs differ in length.
+    """
+
+    if len(targets) != len(predictions):
+      raise ValueError("Must have equal number of targets and predictions. "
+                       "Found: %d targets, %d predictions." %
+                       (len(targets), len(predictions)))
+    return [
+        self.score(target, prediction)
+        for target, prediction in zip(targets, predictions)
+    ]
+
+  def score_corpus(self, targets, predictions, num_workers=1,
+                   chunk_size=1000):
+    """Calculates scores for a corpus, optionally across processes.
+
+    Args:
+      targets: An iterable of target (ground truth) texts.
+      predictions: An iterable of predicted texts, aligned with targets.
+      num_workers: Number of worker processes. Values <= 1 score the corpus in
+        the calling process.
+      chunk_size: Number of pairs sent to a worker at a time.
+
+    Returns:
+      A list of dicts mapping each score_type (string) to Score object, in the
+      same order as the inputs.
+
+    Raises:
+      ValueError: If the inputs differ in length or chunk_size is not positive.
+    """
+
+    return list(
+        self.iter_score_corpus(targets, predictions, num_workers, chunk_size))
+
+  def iter_score_corpus(self, targets, predictions, num_workers=1,
+                        chunk_size=1000):
+    """Lazily calculates scores for a corpus, optionally across processes.
+
+    The inputs are consumed chunk_size pairs at a time and each chunk is scored
+    with score_batch, either in this process or in a pool of num_workers
+    processes. At most 2 * num_workers chunks are in flight at once, so memory
+    use does not grow with the size of the corpus. Each worker process holds
+    its own copy of the scorer.
+
+    Args:
+      targets: An iterable of target (ground truth) texts.
+      predictions: An iterable of predicted texts, aligned with targets.
+      num_workers: Number of worker processes. Values <= 1 score the corpus in
+        the calling process.
+      chunk_size: Number of pairs sent to a worker at a time.
+
+    Yields:
+      Dicts mapping each score_type (string) to Score object, in the same
+      order as the inputs.
+
+    Raises:
+      ValueError: If the inputs differ in length or chunk_size is not positive.
+    """
+
+    if chunk_size <= 0:
+      raise ValueError("chunk_size must be positive")
+    chunks = _chunk_pairs(targets, predictions, chunk_size)
+    if num_workers <= 1:
+      for chunk in chunks:
+        for score in self.score_batch(*chunk):
+          yield score
+      return
+
+    pool = multiprocessing.Pool(
+        num_workers, initializer=_init_worker, initargs=(self,))
+    try:
+      pending = collections.deque()
+      for chunk in chunks:
+        pending.append(pool.apply_async(_score_chunk, (chunk,)))
+        if len(pending) >= 2 * num_workers:
+          for score in pending.popleft().get():
+            yield score
+      while pending:
+        for score in pending.popleft().get():
+          yield score
+    finally:
+      pool.terminate()
+      pool.join()
+
+
+def _chunk_pairs(targets, predictions, chunk_size):
+  """Yields aligned (targets, predictions) lists of at most chunk_size."""
+  pairs = zip_longest(targets, predictions)
+  while True:
+    chunk = list(itertools.islice(pairs, chunk_size))
+    if not chunk:
+      return
+    for target, prediction in chunk:
+      if target is None or prediction is None:
+        raise ValueError("Must have equal number of targets and predictions.")
+    yield [t for t, _ in chunk], [p for _, p in chunk]
+
+
+# Scorer used by processes in an iter_score_corpus worker pool.
+_worker_scorer = None
+
+
+def _init_worker(scorer):
+  """Installs the scorer used by _score_chunk in a worker process."""
+  global _worker_scorer
+  _worker_scorer = scorer
+
+
+def _score_chunk(chunk):
+  """Scores one (targets, predictions) chunk in a worker process."""
+  return _worker_scorer.score_batch(*chunk)
+
 
 class AggregateScore(
     collections.namedtuple("AggregateScore", ["low", "mid", "high"])):
@@ -78,13 +210,20 @@ class BootstrapAggregator(object):
          high=Score(precision=1.0, recall=0.66, fmeasure=0.80))}
   """
 
-  def __init__(self, confidence_interval=0.95, n_samples=1000):
+  def __init__(self, confidence_interval=0.95, n_samples=1000, seed=None,
+               chunk_size=None):
     """Initializes a BootstrapAggregator object.
 
     Args:
       confidence_interval: Confidence interval to compute on the mean as a
         decimal.
       n_samples: Number of samples to use for bootstrap resampling.
+      seed: Optional seed for the resampling random number generator. If None,
+        the global numpy random state is used.
+      chunk_size: Optional number of bootstrap samples drawn per vectorized
+        pass. Resampling holds chunk_size * (number of scores) indices in
+        memory at once; if None, the chunk size is chosen to hold at most about
+        1e7 indices (and at least one bootstrap sample).
 
     Raises:
       ValueError: If invalid argument is given.
@@ -94,10 +233,14 @@ class BootstrapAggregator(object):
       raise ValueError("confidence_interval must be in range [0, 1]")
     if n_samples <= 0:
       raise ValueError("n_samples must be positive")
+    if chunk_size is not None and chunk_size <= 0:
+      raise ValueError("chunk_size must be positive")
 
     self._n_samples = n_samples
     self._confidence_interval = confidence_interval
-    self._scores = collections.defaultdict(list)
+    self._chunk_size = chunk_size
+    self._rng = np.random if seed is None else np.random.RandomState(seed)
+    self._scores = {}
 
   def add_scores(self, scores):
     """Adds a sample for future aggregation.
@@ -108,6 +251,8 @@ class BootstrapAggregator(object):
     """
 
     for score_type, score in six.iteritems(scores):
+      if score_type not in self._scores:
+        self._scores[score_type] = _ScoreArray(score.__class__, len(score))
       self._scores[score_type].append(score)
 
   def aggregate(self):
@@ -119,17 +264,20 @@ class BootstrapAggregator(object):
 
     result = {}
     for score_type, scores in six.iteritems(self._scores):
-      # Stack scores into a 2-d matrix of (sample, measure).
-      score_matrix = np.vstack(tuple(scores))
       # Percentiles are returned as (interval, measure).
-      percentiles = self._bootstrap_resample(score_matrix)
+      percentiles = self._bootstrap_resample(scores.matrix())
       # Extract the three intervals (low, mid, high).
       intervals = tuple(
-          (scores[0].__class__(*percentiles[j, :]) for j in range(3)))
+          (scores.score_class(*percentiles[j, :]) for j in range(3)))
       result[score_type] = AggregateScore(
           low=intervals[0], mid=intervals[1], high=intervals[2])
     return result
 
+  def _resample_chunk_size(self, n):
+    """Returns the number of bootstrap samples to draw at once for n scores."""
+    chunk_size = self._chunk_size or max(1, _MAX_RESAMPLE_INDICES // n)
+    return min(chunk_size, self._n_samples)
+
   def _bootstrap_resample(self, matrix):
     """Performs bootstrap resampling on a matrix of scores.
 
@@ -144,13 +292,18 @@ class BootstrapAggregator(object):
       confidence interval on the mean).
     """
 
-    # Matrix of (bootstrap sample, measure).
+    # Matrix of (bootstrap sample, measure), filled chunk_size samples at a
+    # time from a single (sample, index) matrix of draws per chunk. Measures
+    # are gathered one at a time to keep a single copy of the draws in memory.
+    n = matrix.shape[0]
+    chunk_size = self._resample_chunk_size(n)
     sample_mean = np.zeros((self._n_samples, matrix.shape[1]))
-    for i in range(self._n_samples):
-      sample_idx = np.random.choice(
-          np.arange(matrix.shape[0]), size=matrix.shape[0])
-      sample = matrix[sample_idx, :]
-      sample_mean[i, :] = np.mean(sample, axis=0)
+    for start in range(0, self._n_samples, chunk_size):
+      end = min(start + chunk_size, self._n_samples)
+      sample_idx = self._rng.randint(0, n, size=(end - start, n))
+      for measure in range(matrix.shape[1]):
+        sample_mean[start:end, measure] = np.mean(
+            matrix[sample_idx, measure], axis=1)
 
     # Take percentiles on the estimate of the mean using bootstrap samples.
     # Final result is a (bounds, measure) matrix.
@@ -159,6 +312,29 @@ class BootstrapAggregator(object):
     return np.percentile(sample_mean, q, axis=0)
 
 
+class _ScoreArray(object):
+  """Growable 2-d array of (sample, measure) scores of a single score type."""
+
+  _INITIAL_CAPACITY = 1024
+
+  def __init__(self, score_class, num_measures):
+    self.score_class = score_class
+    self._data = np.empty((self._INITIAL_CAPACITY, num_measures))
+    self._size = 0
+
+  def append(self, score):
+    if self._size == self._data.shape[0]:
+      # Double the capacity so appends take amortized constant time.
+      data = np.empty((2 * self._data.shape[0], self._data.shape[1]))
+      data[:self._size] = self._data
+      self._data = data
+    self._data[self._size] = score
+    self._size += 1
+
+  def matrix(self):
+    return self._data[:self._size]
+
+
 def fmeasure(precision, recall):
   """Computes f-measure given precision and recall values."""
 
@@ -111,6 +111,55 @@ class BootstrapAggregatorTest(absltest.TestCase):
                                  (3 / 6, 3 / 6, 3 / 6),
                                  result["rouge1"], delta=1e-8)
 
+  def testSeedIsDeterministic(self):
+    results = []
+    for _ in range(2):
+      aggregator = scoring.BootstrapAggregator(seed=7)
+      for i in range(50):
+        aggregator.add_scores({
+            "rouge1": scoring.Score(precision=i / 50, recall=1 - i / 50,
+                                    fmeasure=(i % 7) / 7)
+        })
+      results.append(aggregator.aggregate())
+    self.assertEqual(results[0], results[1])
+
+  def testChunkedResamplingMatchesUnchunked(self):
+    results = []
+    for chunk_size in [None, 1, 64]:
+      aggregator = scoring.BootstrapAggregator(seed=7, chunk_size=chunk_size)
+      for i in range(50):
+        aggregator.add_scores({
+            "rouge1": scoring.Score(precision=i / 50, recall=1 - i / 50,
+                                    fmeasure=(i % 7) / 7)
+        })
+      results.append(aggregator.aggregate())
+    self.assertEqual(results[0], results[1])
+    self.assertEqual(results[0], results[2])
+
+  def testDefaultChunkSizeIsBounded(self):
+    aggregator = scoring.BootstrapAggregator()
+    self.assertEqual(aggregator._resample_chunk_size(10), 1000)
+    for n in [10**5, 10**7, 10**8]:
+      chunk_size = aggregator._resample_chunk_size(n)
+      self.assertGreaterEqual(chunk_size, 1)
+      self.assertLessEqual(chunk_size * n, max(n, 10**7))
+    self.assertEqual(
+        scoring.BootstrapAggregator(chunk_size=64)._resample_chunk_size(10**7),
+        64)
+
+  def testInvalidChunkSize(self):
+    with self.assertRaises(ValueError):
+      scoring.BootstrapAggregator(chunk_size=0)
+
+  def testManyScores(self):
+    aggregator = scoring.BootstrapAggregator(confidence_interval=0.0)
+    values = np.random.uniform(size=(5000, 3))
+    for row in values:
+      aggregator.add_scores({"rouge1": scoring.Score(*row)})
+    result = aggregator.aggregate()["rouge1"]
+    self.assertIsInstance(result.mid, scoring.Score)
+    np.testing.assert_allclose(values.mean(axis=0), result.mid, atol=0.01)
+
   def testMultipleRougeTypes(self):
     scorer = rouge_scorer.RougeScorer(["rouge1", "rougeL"], use_stemmer=False)
     aggregator = scoring.BootstrapAggregator()
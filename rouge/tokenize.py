@@ -20,9 +20,15 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
 import re
 import six
 
+# Pre-compiled regexes used by tokenize.
+_NON_ALPHANUM_RE = re.compile(r"[^a-z0-9]+")
+_SPACES_RE = re.compile(r"\s+")
+_VALID_TOKEN_RE = re.compile(r"^[a-z0-9]+$")
+
 
 def tokenize(text, stemmer):
   """Tokenize input text into a list of tokens.
@@ -41,14 +47,79 @@ def tokenize(text, stemmer):
   # Convert everything to lowercase.
   text = text.lower()
   # Replace any non-alpha-numeric characters with spaces.
-  text = re.sub(r"[^a-z0-9]+", " ", six.ensure_str(text))
+  text = _NON_ALPHANUM_RE.sub(" ", six.ensure_str(text))
 
-  tokens = re.split(r"\s+", text)
+  tokens = _SPACES_RE.split(text)
   if stemmer:
     # Only stem words more than 3 characters long.
     tokens = [stemmer.stem(x) if len(x) > 3 else x for x in tokens]
 
   # One final check to drop any empty or invalid tokens.
-  tokens = [x for x in tokens if re.match(r"^[a-z0-9]+$", six.ensure_str(x))]
+  tokens = [x for x in tokens if _VALID_TOKEN_RE.match(six.ensure_str(x))]
 
   return tokens
+
+
+class CacheInfo(
+    collections.namedtuple("CacheInfo",
+                           ["hits", "misses", "max_size", "size"])):
+  """Tuple containing stem cache statistics."""
+
+  @property
+  def hit_rate(self):
+    lookups = self.hits + self.misses
+    return self.hits / lookups if lookups else 0.0
+
+
+class CachingStemmer(object):
+  """Wraps a stemmer with a bounded least-recently-used cache of stems.
+
+  Sample usage:
+    stemmer = CachingStemmer(porter.PorterStemmer(), max_size=1000)
+    tokens = tokenize("The quick brown fox", stemmer)
+    print(stemmer.cache_info().hit_rate)
+  """
+
+  def __init__(self, stemmer, max_size):
+    """Initializes a new CachingStemmer.
+
+    Args:
+      stemmer: The stemmer to wrap. Must provide a stem(word) method.
+      max_size: Maximum number of stems to keep.
+
+    Raises:
+      ValueError: If max_size is not positive.
+    """
+
+    if max_size <= 0:
+      raise ValueError("max_size must be positive")
+    self._stemmer = stemmer
+    self._max_size = max_size
+    self._stems = collections.OrderedDict()
+    self._hits = 0
+    self._misses = 0
+
+  def stem(self, word):
+    """Returns the stem of word, computing it only on a cache miss."""
+    stem = self._stems.pop(word, None)
+    if stem is None:
+      self._misses += 1
+      stem = self._stemmer.stem(word)
+      if len(self._stems) >= self._max_size:
+        self._stems.popitem(last=False)
+    else:
+      self._hits += 1
+    # (Re)inserting marks the word as the most recently used.
+    self._stems[word] = stem
+    return stem
+
+  def cache_info(self):
+    """Returns a CacheInfo with the hit and miss counts so far."""
+    return CacheInfo(hits=self._hits, misses=self._misses,
+                     max_size=self._max_size, size=len(self._stems))
+
+  def cache_clear(self):
+    """Removes all cached stems and resets the statistics."""
+    self._stems.clear()
+    self._hits = 0
+    self._misses = 0
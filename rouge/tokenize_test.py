@@ -21,6 +21,7 @@ from __future__ import division
 from __future__ import print_function
 
 from absl.testing import absltest
+from nltk.stem import porter
 from rouge import tokenize
 
 
@@ -32,6 +33,38 @@ class TokenizeTest(absltest.TestCase):
     self.assertEqual(['one', 'two', 'three'],
                      tokenize.tokenize('one\n Two \nthree', None))
 
+  def test_caching_stemmer_matches_stemmer(self):
+    stemmer = porter.PorterStemmer()
+    caching_stemmer = tokenize.CachingStemmer(porter.PorterStemmer(), 10)
+    text = 'Running runners ran, running quickly and jumping'
+    self.assertEqual(tokenize.tokenize(text, stemmer),
+                     tokenize.tokenize(text, caching_stemmer))
+    info = caching_stemmer.cache_info()
+    self.assertEqual(1, info.hits)
+    self.assertEqual(4, info.misses)
+    self.assertEqual(4, info.size)
+    self.assertAlmostEqual(1 / 5, info.hit_rate)
+
+  def test_caching_stemmer_evicts_least_recently_used(self):
+    caching_stemmer = tokenize.CachingStemmer(porter.PorterStemmer(), 2)
+    caching_stemmer.stem('running')
+    caching_stemmer.stem('jumping')
+    caching_stemmer.stem('running')
+    caching_stemmer.stem('walking')  # Evicts 'jumping'.
+    caching_stemmer.stem('running')
+    caching_stemmer.stem('jumping')
+    info = caching_stemmer.cache_info()
+    self.assertEqual(2, info.hits)
+    self.assertEqual(4, info.misses)
+    self.assertEqual(2, info.size)
+
+    caching_stemmer.cache_clear()
+    self.assertEqual((0, 0, 2, 0), caching_stemmer.cache_info())
+
+  def test_caching_stemmer_invalid_size(self):
+    with self.assertRaises(ValueError):
+      tokenize.CachingStemmer(porter.PorterStemmer(), 0)
+
 
 if __name__ == '__main__':
   absltest.main()